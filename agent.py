@@ -34,6 +34,10 @@ class AgentConfig:
     embeddings_model: ModelConfig
     prompts_subdir: str = ""
     memory_subdir: str = ""
+    # overrides for memory/<subdir>/index.json, e.g. {"storage": "sq8", "rerank": True}
+    memory_index: dict = field(default_factory=dict)
+    # "vector" recalls by similarity, "hybrid" adds keyword matches and diverse results
+    memory_recall_mode: str = "vector"
     
     # Enhancement systems configurations
     pattern_recognition: dict = field(default_factory=lambda: {
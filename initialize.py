@@ -94,6 +94,7 @@ def initialize():
         prompts_subdir=current_settings["agent_prompts_subdir"],
         memory_subdir=current_settings["agent_memory_subdir"],
         knowledge_subdirs=["default", current_settings["agent_knowledge_subdir"]],
+        memory_recall_mode=current_settings["agent_memory_recall_mode"],
         
         # Enhancement configurations
         pattern_recognition=pattern_recognition_config,
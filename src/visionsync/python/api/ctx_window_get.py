@@ -9,6 +9,6 @@ class GetCtxWindow(ApiHandler):
         context = self.get_context(ctxid)
         agent = context.streaming_agent or context.agent0
         window = agent.get_data(agent.DATA_NAME_CTX_WINDOW)
-        size = tokens.approximate_tokens(window)
+        size = tokens.estimate_tokens(window)  # display only, no need to encode
 
         return {"content": window, "tokens": size}
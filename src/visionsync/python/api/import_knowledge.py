@@ -29,11 +29,11 @@ class ImportKnowledge(ApiHandler):
                 file.save(os.path.join(KNOWLEDGE_FOLDER, filename))
                 saved_filenames.append(filename)
 
-        #reload memory to re-import knowledge
-        await memory.Memory.reload(context.agent0)
-        context.log.set_initial_progress()
+        # import new files into the live index in the background, progress goes to the log
+        job_id = memory.Memory.start_knowledge_import(context.agent0)
 
         return {
-            "message": "Knowledge Imported",
+            "message": "Knowledge import started",
+            "job_id": job_id,
             "filenames": saved_filenames[:5]
         }
\ No newline at end of file
@@ -1,18 +1,50 @@
 import asyncio
 from python.helpers.extension import Extension
+from python.helpers.history import get_ctx_size_for_history
 from agent import LoopData
 
 DATA_NAME_TASK = "_organize_history_task"
+DATA_NAME_GROWTH = "_organize_history_growth"
+
+SOFT_WATERMARK = 0.8  # share of the history budget where compression starts ahead of time
+MIN_TARGET_RATIO = 0.5  # never compress below this share, however fast the history grows
+GROWTH_SMOOTHING = 0.5  # weight of the latest iteration in the growth rate
+LOOKAHEAD_ITERATIONS = 2
 
 
 class OrganizeHistory(Extension):
     async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
+        # track growth every round, also while a task is running
+        history = self.agent.history
+        tokens = history.get_tokens()  # cached, cheap after the first count
+        growth = self.update_growth(tokens)
+
         # is there a running task? if yes, skip this round, the wait extension will double check the context size
         task = self.agent.get_data(DATA_NAME_TASK)
         if task and not task.done():
             return
 
+        # projected over the soft watermark, compress now so that the next iterations fit without waiting
+        limit = get_ctx_size_for_history()
+        projected = tokens + growth * LOOKAHEAD_ITERATIONS
+        if limit and projected > limit * SOFT_WATERMARK:
+            ratio = max(
+                MIN_TARGET_RATIO,
+                min(SOFT_WATERMARK, 1 - growth * LOOKAHEAD_ITERATIONS / limit),
+            )
+        else:
+            ratio = 1.0
+
         # start task
-        task = asyncio.create_task(self.agent.history.compress())
+        task = asyncio.create_task(history.compress(ratio))
         # set to agent to be able to wait for it
         self.agent.set_data(DATA_NAME_TASK, task)
+
+    def update_growth(self, tokens: int) -> float:
+        # smoothed token growth per iteration, shrinking history does not count as negative growth
+        state = self.agent.get_data(DATA_NAME_GROWTH) or {"tokens": tokens, "rate": 0.0}
+        delta = max(0, tokens - state["tokens"])
+        state["rate"] = state["rate"] * (1 - GROWTH_SMOOTHING) + delta * GROWTH_SMOOTHING
+        state["tokens"] = tokens
+        self.agent.set_data(DATA_NAME_GROWTH, state)
+        return state["rate"]
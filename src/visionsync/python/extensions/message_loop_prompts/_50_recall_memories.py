@@ -1,6 +1,8 @@
 import asyncio
 from python.helpers.extension import Extension
 from python.helpers.memory import Memory
+from python.helpers.dirty_json import DirtyJson
+from python.helpers.recall_cache import RecallCache, get_recall_cache
 from agent import LoopData
 
 DATA_NAME_TASK = "_recall_memories_task"
@@ -10,11 +12,14 @@ class RecallMemories(Extension):
     INTERVAL = 3
     HISTORY = 5  # TODO cleanup
     RESULTS = 3
+    SOLUTIONS_COUNT = 2
+    INSTRUMENTS_COUNT = 2
     THRESHOLD = 0.6
+    MMR_LAMBDA = 0.5  # hybrid mode only, vector mode ranks by relevance alone
 
     async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
 
-        # every 3 iterations (or the first one) recall memories
+        # every 3 iterations (or the first one) recall memories and solutions
         if loop_data.iteration % RecallMemories.INTERVAL == 0:
             task = asyncio.create_task(self.search_memories(loop_data=loop_data, **kwargs))
         else:
@@ -22,14 +27,15 @@ class RecallMemories(Extension):
 
         # set to agent to be able to wait for it
         self.agent.set_data(DATA_NAME_TASK, task)
-            
+
 
     async def search_memories(self, loop_data: LoopData, **kwargs):
 
         # cleanup
         extras = loop_data.extras_temporary
-        if "memories" in extras:
-            del extras["memories"]
+        extras.pop("memories", None)
+        extras.pop("solutions", None)
+        extras.pop("instruments", None)
 
         # try:
         # show temp info message
@@ -49,60 +55,151 @@ class RecallMemories(Extension):
         # )  # only last X messages
         msgs_text = self.agent.history.current.output_text()
         system = self.agent.read_prompt(
-            "memory.memories_query.sys.md", history=msgs_text
-        )
-
-        # log query streamed by LLM
-        async def log_callback(content):
-            log_item.stream(query=content)
-
-        # call util llm to summarize conversation
-        query = await self.agent.call_utility_model(
-            system=system,
-            message=loop_data.user_message.output_text() if loop_data.user_message else "",
-            callback=log_callback,
+            "memory.recall_query.sys.md", history=msgs_text
         )
+        message = loop_data.user_message.output_text() if loop_data.user_message else ""
+
+        # same topic and message as last time, the utility model would write the same queries
+        cache = get_recall_cache(self.agent)
+        topic = RecallCache.topic_key(self.agent.history, message)
+        queries = {
+            area: cache.get_query(area, topic) for area in ("memories", "solutions")
+        }
+
+        if None in queries.values():
+            # log query streamed by LLM
+            async def log_callback(content):
+                log_item.stream(query=content)
+
+            # one util llm call writes the queries for both areas
+            response = await self.agent.call_utility_model(
+                system=system,
+                message=message,
+                callback=log_callback,
+            )
+            queries = self.parse_queries(response)
+            for area, query in queries.items():
+                cache.put_query(area, topic, query)
+        else:
+            log_item.update(query="\n".join(queries.values()))  # type: ignore
 
         # get solutions database
         db = await Memory.get(self.agent)
 
-        memories = await db.search_similarity_threshold(
-            query=query,
-            limit=RecallMemories.RESULTS,
-            threshold=RecallMemories.THRESHOLD,
-            filter=f"area == '{Memory.Area.MAIN.value}' or area == '{Memory.Area.FRAGMENTS.value}'",  # exclude solutions
+        # a near-identical query against unchanged memory finds the same documents
+        embeddings = dict(
+            zip(queries, await db.embed_queries(list(queries.values())))  # type: ignore
         )
+        version = db.version
+        found = {
+            area: cache.get_results(area, embeddings[area], version) for area in queries
+        }
+
+        # every area not served from cache in one batched search, deduplicated across areas
+        searches: list[tuple[str, str]] = []
+        if found["memories"] is None:
+            searches.append(
+                ("memories", f"area == '{Memory.Area.MAIN.value}' or area == '{Memory.Area.FRAGMENTS.value}'")
+            )
+        if found["solutions"] is None:
+            searches.append(("solutions", f"area == '{Memory.Area.SOLUTIONS.value}'"))
+            searches.append(("solutions", f"area == '{Memory.Area.INSTRUMENTS.value}'"))
+        if searches:
+            hybrid = self.agent.config.memory_recall_mode == "hybrid"
+            results = await db.search_many(
+                queries=[queries[area] for area, _ in searches],  # type: ignore
+                k=max(
+                    RecallMemories.RESULTS,
+                    RecallMemories.SOLUTIONS_COUNT,
+                    RecallMemories.INSTRUMENTS_COUNT,
+                ),
+                filters=[filter for _, filter in searches],
+                threshold=RecallMemories.THRESHOLD,
+                mmr_lambda=RecallMemories.MMR_LAMBDA if hybrid else 1.0,
+                search_mode="hybrid" if hybrid else "vector",
+            )
+            for area in dict.fromkeys(area for area, _ in searches):
+                found[area] = [r for (a, _), r in zip(searches, results) if a == area]
+                cache.put_results(area, embeddings[area], version, found[area])
+        summaries = [f"{area} {cache.summary(area)}" for area in queries]
+        if db.db.query_cache:
+            summaries.append(f"query vectors {db.db.query_cache.summary()}")
+        log_item.update(cache=", ".join(summaries))
+
+        memories = found["memories"][0][: RecallMemories.RESULTS]  # type: ignore
+        solutions = found["solutions"][0][: RecallMemories.SOLUTIONS_COUNT]  # type: ignore
+        instruments = found["solutions"][1][: RecallMemories.INSTRUMENTS_COUNT]  # type: ignore
 
         # log the short result
-        if not isinstance(memories, list) or len(memories) == 0:
+        if not memories and not solutions and not instruments:
             log_item.update(
                 heading="No useful memories found",
             )
             return
         else:
             log_item.update(
-                heading=f"{len(memories)} memories found",
+                heading=f"{len(memories)} memories, {len(instruments)} instruments, {len(solutions)} solutions found",
             )
 
-        # concatenate memory.page_content in memories:
-        memories_text = ""
-        for memory in memories:
-            memories_text += memory.page_content + "\n\n"
-        memories_text = memories_text.strip()
+        if memories:
+            # concatenate memory.page_content in memories:
+            memories_text = ""
+            for memory in memories:
+                memories_text += memory.page_content + "\n\n"
+            memories_text = memories_text.strip()
 
-        # log the full results
-        log_item.update(memories=memories_text)
+            # log the full results
+            log_item.update(memories=memories_text)
 
-        # place to prompt
-        memories_prompt = self.agent.parse_prompt(
-            "agent.system.memories.md", memories=memories_text
-        )
+            # place to prompt
+            memories_prompt = self.agent.parse_prompt(
+                "agent.system.memories.md", memories=memories_text
+            )
 
-        # append to prompt
-        extras["memories"] = memories_prompt
+            # append to prompt
+            extras["memories"] = memories_prompt
+
+        if instruments:
+            instruments_text = ""
+            for instrument in instruments:
+                instruments_text += instrument.page_content + "\n\n"
+            instruments_text = instruments_text.strip()
+            log_item.update(instruments=instruments_text)
+            instruments_prompt = self.agent.read_prompt(
+                "agent.system.instruments.md", instruments=instruments_text
+            )
+            # with the other recall results at the tail, the system prompt stays cacheable
+            extras["instruments"] = instruments_prompt
+
+        if solutions:
+            solutions_text = ""
+            for solution in solutions:
+                solutions_text += solution.page_content + "\n\n"
+            solutions_text = solutions_text.strip()
+            log_item.update(solutions=solutions_text)
+            solutions_prompt = self.agent.parse_prompt(
+                "agent.system.solutions.md", solutions=solutions_text
+            )
+
+            # append to prompt
+            extras["solutions"] = solutions_prompt
 
     # except Exception as e:
     #     err = errors.format_error(e)
     #     self.agent.context.log.log(
     #         type="error", heading="Recall memories extension error:", content=err
     #     )
+
+    @staticmethod
+    def parse_queries(response: str) -> dict[str, str]:
+        # a reply that is not the expected json still makes a usable query for both areas
+        try:
+            parsed = DirtyJson.parse_string(response)
+        except Exception:
+            parsed = None
+        if not isinstance(parsed, dict):
+            parsed = {}
+        return {
+            area: str(parsed.get(area) or response).strip()
+            for area in ("memories", "solutions")
+        }
@@ -0,0 +1,13 @@
+from datetime import datetime
+from python.helpers.extension import Extension
+from agent import LoopData
+
+
+class IncludeCurrentDatetime(Extension):
+    async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
+        # changes every call, at the end of chain it does not invalidate the cached prompt prefix
+        current_datetime = self.agent.read_prompt(
+            "agent.system.datetime.md",
+            date_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        loop_data.extras_temporary["current_datetime"] = current_datetime
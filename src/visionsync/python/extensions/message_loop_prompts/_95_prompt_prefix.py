@@ -0,0 +1,43 @@
+from python.helpers.extension import Extension
+from python.helpers.history import prompt_digest
+from python.helpers.print_style import PrintStyle
+from agent import LoopData
+
+DATA_NAME_PREFIX = "_prompt_prefix"
+
+
+class PromptPrefix(Extension):
+    async def execute(self, loop_data: LoopData = LoopData(), **kwargs):
+        # a provider can reuse its prompt cache when the last prompt is a prefix of this one
+        system = "\n\n".join(loop_data.system)
+        messages = self.agent.history.output_langchain(copy=False)  # read only
+        state = self.agent.get_data(DATA_NAME_PREFIX) or {
+            "system": None,
+            "messages": [],
+            "digest": None,
+            "hits": 0,
+            "misses": 0,
+        }
+        previous = state["messages"]
+        # unchanged records return the very same cached messages, compared by identity,
+        # only the few rendered again are compared by content, nothing is rehashed
+        kept = (
+            system == state["system"]
+            and len(messages) >= len(previous)
+            and all(
+                a is b or (a.type == b.type and a.content == b.content)
+                for a, b in zip(previous, messages)
+            )
+        )
+        if kept:
+            state["hits"] += 1
+            digest = prompt_digest(system, messages[len(previous) :], state["digest"].copy())
+        else:
+            state["misses"] += 1
+            digest = prompt_digest(system, messages)
+        state.update(system=system, messages=messages, digest=digest)
+        self.agent.set_data(DATA_NAME_PREFIX, state)
+        PrintStyle(font_color="gray", log_only=True).print(
+            f"Prompt prefix {digest.hexdigest()[:12]}, {len(messages)} messages, "
+            f"{state['hits']} cacheable / {state['misses']} changed"
+        )
@@ -2,9 +2,13 @@ import asyncio
 from python.helpers.extension import Extension
 from python.helpers.memory import Memory
 from python.helpers.dirty_json import DirtyJson
-from agent import LoopData
+from agent import Agent, LoopData
 from python.helpers.log import LogItem
 from python.helpers.defer import run_in_background
+from python.helpers import history, persist_chat
+
+DATA_NAME_WATERMARK = "memorization_watermark"
+CONTEXT_HEADER_CHARS = 2000
 
 
 class MemorizeMemories(Extension):
@@ -30,9 +34,16 @@ class MemorizeMemories(Extension):
 
     async def memorize(self, loop_data: LoopData, log_item: LogItem, **kwargs):
 
+        # only messages added since the last successful pass
+        since = get_watermark(self.agent, "fragments")
+        until = self.agent.history.last_no
+        if until <= since:
+            log_item.update(heading="No new information to memorize.")
+            return
+
         # get system message and chat history for util llm
         system = self.agent.read_prompt("memory.memories_sum.sys.md")
-        msgs_text = self.agent.concat_messages(self.agent.history)
+        msgs_text = memorize_input(self.agent, since)
 
         # log query streamed by LLM
         async def log_callback(content):
@@ -50,6 +61,7 @@ class MemorizeMemories(Extension):
 
         if not isinstance(memories, list) or len(memories) == 0:
             log_item.update(heading="No useful information to memorize.")
+            set_watermark(self.agent, "fragments", until)
             return
         else:
             log_item.update(heading=f"{len(memories)} entries to memorize.")
@@ -57,37 +69,62 @@ class MemorizeMemories(Extension):
         # save chat history
         db = await Memory.get(self.agent)
 
-        memories_txt = ""
-        rem = []
-        for memory in memories:
-            # solution to plain text:
-            txt = f"{memory}"
-            memories_txt += "\n\n" + txt
-            log_item.update(memories=memories_txt.strip())
-
-            # remove previous fragments too similiar to this one
-            if self.REPLACE_THRESHOLD > 0:
-                rem += await db.delete_documents_by_query(
-                    query=txt,
-                    threshold=self.REPLACE_THRESHOLD,
-                    filter=f"area=='{Memory.Area.FRAGMENTS.value}'",
-                )
-                if rem:
-                    rem_txt = "\n\n".join(Memory.format_docs_plain(rem))
-                    log_item.update(replaced=rem_txt)
-
-            # insert new solution
-            await db.insert_text(text=txt, metadata={"area": Memory.Area.FRAGMENTS.value})
+        # memories to plain text:
+        texts = [f"{memory}" for memory in memories]
+        memories_txt = "\n\n".join(texts)
+        log_item.update(memories=memories_txt)
+
+        # insert all at once, removing previous fragments too similiar to any of them
+        ids, rem = await db.upsert_deduplicated(
+            texts,
+            area=Memory.Area.FRAGMENTS.value,
+            threshold=self.REPLACE_THRESHOLD,
+        )
+        if rem:
+            rem_txt = "\n\n".join(Memory.format_docs_plain(rem))
+            log_item.update(replaced=rem_txt)
 
         log_item.update(
-            result=f"{len(memories)} entries memorized.",
-            heading=f"{len(memories)} entries memorized.",
+            result=f"{len(ids)} entries memorized.",
+            heading=f"{len(ids)} entries memorized.",
         )
+        # near-identical entries of one batch are stored once
+        if len(ids) < len(memories):
+            log_item.stream(
+                result=f"\nMerged {len(memories) - len(ids)} near-duplicate entries."
+            )
         if rem:
             log_item.stream(result=f"\nReplaced {len(rem)} previous memories.")
+        set_watermark(self.agent, "fragments", until)
 
     # except Exception as e:
     #     err = errors.format_error(e)
     #     self.agent.context.log.log(
     #         type="error", heading="Memorize memories extension error:", content=err
     #     )
+
+
+def get_watermark(agent: Agent, area: str) -> int:
+    no = (agent.get_data(DATA_NAME_WATERMARK) or {}).get(area, 0)
+    # a watermark past the end belongs to a history that was reset
+    return no if no <= agent.history.last_no else 0
+
+
+def set_watermark(agent: Agent, area: str, no: int):
+    watermarks = dict(agent.get_data(DATA_NAME_WATERMARK) or {})
+    watermarks[area] = no
+    agent.set_data(DATA_NAME_WATERMARK, watermarks)
+    persist_chat.save_tmp_chat(agent.context)  # keep the watermark with the saved chat
+
+
+def memorize_input(agent: Agent, since: int) -> str:
+    # new messages, plus the tail of what came before so they can be understood
+    messages = history.output_text(agent.history.output_since(since), "assistant", "user")
+    context = history.output_text(agent.history.output_until(since), "assistant", "user")
+    if not context:
+        return messages
+    return agent.read_prompt(
+        "memory.memorize_input.md",
+        context=context[-CONTEXT_HEADER_CHARS:],
+        messages=messages,
+    )
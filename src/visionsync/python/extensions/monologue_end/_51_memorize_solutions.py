@@ -4,6 +4,11 @@ from python.helpers.memory import Memory
 from python.helpers.dirty_json import DirtyJson
 from agent import LoopData
 from python.helpers.log import LogItem
+from python.extensions.monologue_end._50_memorize_fragments import (
+    get_watermark,
+    memorize_input,
+    set_watermark,
+)
 
 
 class MemorizeSolutions(Extension):
@@ -28,9 +33,16 @@ class MemorizeSolutions(Extension):
         asyncio.create_task(self.memorize(loop_data, log_item))        
 
     async def memorize(self, loop_data: LoopData, log_item: LogItem, **kwargs):
+        # only messages added since the last successful pass
+        since = get_watermark(self.agent, "solutions")
+        until = self.agent.history.last_no
+        if until <= since:
+            log_item.update(heading="No new solutions to memorize.")
+            return
+
         # get system message and chat history for util llm
         system = self.agent.read_prompt("memory.solutions_sum.sys.md")
-        msgs_text = self.agent.concat_messages(self.agent.history)
+        msgs_text = memorize_input(self.agent, since)
 
         # log query streamed by LLM
         async def log_callback(content):
@@ -48,6 +60,7 @@ class MemorizeSolutions(Extension):
 
         if not isinstance(solutions, list) or len(solutions) == 0:
             log_item.update(heading="No successful solutions to memorize.")
+            set_watermark(self.agent, "solutions", until)
             return
         else:
             log_item.update(
@@ -57,35 +70,37 @@ class MemorizeSolutions(Extension):
         # save chat history
         db = await Memory.get(self.agent)
 
-        solutions_txt = ""
-        rem = []
-        for solution in solutions:
-            # solution to plain text:
-            txt = f"# Problem\n {solution['problem']}\n# Solution\n {solution['solution']}"
-            solutions_txt += txt + "\n\n"
-
-            # remove previous solutions too similiar to this one
-            if self.REPLACE_THRESHOLD > 0:
-                rem += await db.delete_documents_by_query(
-                    query=txt,
-                    threshold=self.REPLACE_THRESHOLD,
-                    filter=f"area=='{Memory.Area.SOLUTIONS.value}'",
-                )
-                if rem:
-                    rem_txt = "\n\n".join(Memory.format_docs_plain(rem))
-                    log_item.update(replaced=rem_txt)
-
-            # insert new solution
-            await db.insert_text(text=txt, metadata={"area": Memory.Area.SOLUTIONS.value})
+        # solution to plain text:
+        texts = [
+            f"# Problem\n {solution['problem']}\n# Solution\n {solution['solution']}"
+            for solution in solutions
+        ]
+        solutions_txt = "\n\n".join(texts)
+
+        # insert all at once, removing previous solutions too similiar to any of them
+        ids, rem = await db.upsert_deduplicated(
+            texts,
+            area=Memory.Area.SOLUTIONS.value,
+            threshold=self.REPLACE_THRESHOLD,
+        )
+        if rem:
+            rem_txt = "\n\n".join(Memory.format_docs_plain(rem))
+            log_item.update(replaced=rem_txt)
 
         solutions_txt = solutions_txt.strip()
         log_item.update(solutions=solutions_txt)
         log_item.update(
-            result=f"{len(solutions)} solutions memorized.",
-            heading=f"{len(solutions)} solutions memorized.",
+            result=f"{len(ids)} solutions memorized.",
+            heading=f"{len(ids)} solutions memorized.",
         )
+        # near-identical entries of one batch are stored once
+        if len(ids) < len(solutions):
+            log_item.stream(
+                result=f"\nMerged {len(solutions) - len(ids)} near-duplicate solutions."
+            )
         if rem:
             log_item.stream(result=f"\nReplaced {len(rem)} previous solutions.")
+        set_watermark(self.agent, "solutions", until)
 
     # except Exception as e:
     #     err = errors.format_error(e)
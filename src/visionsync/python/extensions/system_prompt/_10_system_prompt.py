@@ -1,4 +1,3 @@
-from datetime import datetime
 from python.helpers.extension import Extension
 from agent import Agent, LoopData
 
@@ -19,11 +18,9 @@ def get_tools_prompt(agent: Agent):
     return get_prompt("agent.system.tools.md", agent)
 
 def get_prompt(file: str, agent: Agent):
-    # variables for system prompts
-    # TODO: move variables to the end of chain
-    # variables in system prompt would break prompt caching, better to add them to the last message in conversation
+    # variables for system prompts, only stable ones to keep the prompt prefix cacheable
+    # volatile ones like the current time are added at the end of chain by message_loop_prompts
     vars = {
-        "date_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "agent_name": agent.agent_name,
     }
     return agent.read_prompt(file, **vars)
\ No newline at end of file
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Iterator
+
+from python.helpers.print_style import PrintStyle
+
+if TYPE_CHECKING:
+    from agent import Agent, AgentContext
+
+JOURNAL_SUFFIX = ".journal.jsonl"
+COMPACT_MAX_RECORDS = 200  # snapshot again after this many journaled saves
+COMPACT_SIZE_RATIO = 1.0  # or once the journal outgrows the snapshot it follows
+
+
+@dataclass
+class AgentState:
+    history: Any  # the History object journaled, a replaced one needs a snapshot
+    edits: int
+    counter: int
+    topics: int
+    data: str
+
+
+class ChatJournal:
+    """Append-only log of what changed in a chat context since its last snapshot: messages
+    appended to agent histories, agent data, touched log items. Anything else, like a
+    compressed history or a reset log, is left to a new snapshot. Records carry a sequence
+    number and snapshots the last one they include, so replay skips what a snapshot
+    written just before a crash already holds."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.seq = 0
+        self.records = 0
+        self.bytes = 0
+        self.snapshot_bytes = 0
+        self.agents: dict[int, AgentState] = {}
+        self.log_guid = ""
+        self.log_updates = 0
+        self.streaming_agent = 0
+
+    def capture(self, context: "AgentContext", serialize_data: Callable[["Agent"], str]):
+        # remember the state a snapshot or replay left the context in
+        self.agents = {
+            agent.number: AgentState(
+                history=agent.history,
+                edits=agent.history.edits,
+                counter=agent.history.counter,
+                topics=len(agent.history.topics),
+                data=serialize_data(agent),
+            )
+            for agent in _agents(context)
+        }
+        self.log_guid = context.log.guid
+        self.log_updates = len(context.log.updates)
+        self.streaming_agent = _streaming_number(context)
+
+    def diff(
+        self, context: "AgentContext", serialize_data: Callable[["Agent"], str]
+    ) -> list[dict[str, Any]] | None:
+        # journal records since capture, None when only a snapshot can express the change
+        agents = _agents(context)
+        if [a.number for a in agents] != list(self.agents) or context.log.guid != self.log_guid:
+            return None
+        records: list[dict[str, Any]] = []
+        for agent in agents:
+            state = self.agents[agent.number]
+            history = agent.history
+            if history is not state.history or history.edits != state.edits:
+                return None
+            if history.counter != state.counter:
+                topics = history.messages_since(state.counter, state.topics)
+                records.append(
+                    {
+                        "op": "messages",
+                        "agent": agent.number,
+                        "topics": [[m.to_dict() for m in msgs] for msgs in topics],
+                    }
+                )
+                state.counter = history.counter
+                state.topics = len(history.topics)
+            data = serialize_data(agent)
+            if data != state.data:
+                records.append({"op": "data", "agent": agent.number, "data": json.loads(data)})
+                state.data = data
+        log = context.log
+        touched = dict.fromkeys(log.updates[self.log_updates :])
+        streaming = _streaming_number(context)
+        if touched or streaming != self.streaming_agent:
+            records.append(
+                {
+                    "op": "log",
+                    "items": [log.logs[no].output() for no in touched],
+                    "streaming_agent": streaming,
+                }
+            )
+            self.log_updates = len(log.updates)
+            self.streaming_agent = streaming
+        return records
+
+    def append(self, records: list[dict[str, Any]], serialize: Callable[[Any], str]):
+        with self.lock:
+            lines = []
+            for record in records:
+                self.seq += 1
+                lines.append(serialize({"seq": self.seq, **record}) + "\n")
+            text = "".join(lines)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            self.records += len(records)
+            self.bytes += len(text.encode("utf-8"))
+
+    def needs_compaction(self) -> bool:
+        return self.records >= COMPACT_MAX_RECORDS or (
+            self.snapshot_bytes > 0 and self.bytes > self.snapshot_bytes * COMPACT_SIZE_RATIO
+        )
+
+    def read(self, after: int = 0) -> Iterator[dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn write from a crash, everything before it is still valid
+                    PrintStyle.error(f"Skipping corrupted chat journal entry in {self.path}")
+                    continue
+                self.seq = max(self.seq, record.get("seq", 0))
+                if record.get("seq", 0) > after:
+                    yield record
+
+    def compacted(self, snapshot_bytes: int):
+        # the snapshot holds everything journaled so far
+        with self.lock:
+            open(self.path, "w").close()
+            self.records = 0
+            self.bytes = 0
+            self.snapshot_bytes = snapshot_bytes
+
+    def remove(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def _agents(context: "AgentContext") -> list["Agent"]:
+    from agent import Agent
+
+    agents = []
+    agent = context.agent0
+    while agent:
+        agents.append(agent)
+        agent = agent.data.get(Agent.DATA_NAME_SUBORDINATE, None)
+    return agents
+
+
+def _streaming_number(context: "AgentContext") -> int:
+    return context.streaming_agent.number if context.streaming_agent else 0
@@ -0,0 +1,203 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Iterator, Optional, Sequence
+
+from langchain_core.stores import ByteStore
+
+from python.helpers.print_style import PrintStyle
+
+BATCH_SIZE = 500  # keeps IN (...) below sqlite's bound variable limit
+EVICT_TO_RATIO = 0.9  # evict a little more than needed, not on every insert
+
+_stores: dict[str, "SQLiteByteStore"] = {}
+_lru_stores: dict[str, "LRUByteStore"] = {}
+_stores_lock = threading.Lock()
+
+
+class SQLiteByteStore(ByteStore):
+    """Embedding cache packed into a single SQLite file instead of one file per vector."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    def mget(self, keys: Sequence[str]) -> list[Optional[bytes]]:
+        found: dict[str, bytes] = {}
+        with self._lock:
+            for batch in _batches(list(keys)):
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM kv WHERE key IN ({_params(batch)})", batch
+                )
+                found.update(rows)
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, bytes]]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", key_value_pairs
+            )
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock, self._conn:
+            for batch in _batches(list(keys)):
+                self._conn.execute(f"DELETE FROM kv WHERE key IN ({_params(batch)})", batch)
+
+    def yield_keys(self, *, prefix: str | None = None) -> Iterator[str]:
+        with self._lock:
+            if prefix:
+                rows = self._conn.execute(
+                    "SELECT key FROM kv WHERE key >= ? AND key < ? ORDER BY key",
+                    (prefix, prefix + "\uffff"),
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT key FROM kv ORDER BY key").fetchall()
+        for (key,) in rows:
+            yield key
+
+    def migrate_directory(self, directory: str) -> int:
+        # one-shot import of a langchain LocalFileStore, keys are paths relative to its root
+        if not os.path.isdir(directory):
+            return 0
+        count = 0
+        batch: list[tuple[str, bytes]] = []
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                key = os.path.relpath(path, directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    batch.append((key, f.read()))
+                if len(batch) >= BATCH_SIZE:
+                    self.mset(batch)
+                    count += len(batch)
+                    batch = []
+        if batch:
+            self.mset(batch)
+            count += len(batch)
+        # everything is committed, drop the per-vector files
+        shutil.rmtree(directory)
+        return count
+
+
+class LRUByteStore(ByteStore):
+    """Byte store in a single SQLite file bounded by the total size of its values, least
+    recently used evicted first."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_used ON kv (used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM kv").fetchone()[0]
+
+    def mget(self, keys: Sequence[str]) -> list[Optional[bytes]]:
+        found: dict[str, bytes] = {}
+        with self._lock, self._conn:
+            for batch in _batches(list(keys)):
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM kv WHERE key IN ({_params(batch)})", batch
+                )
+                found.update(rows)
+            used = time.time()
+            self._conn.executemany(
+                "UPDATE kv SET used = ? WHERE key = ?", [(used, key) for key in found]
+            )
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, bytes]]) -> None:
+        pairs = dict(key_value_pairs)
+        with self._lock, self._conn:
+            self._size -= self._sizes(list(pairs))
+            used = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO kv (key, value, size, used) VALUES (?, ?, ?, ?)",
+                [(key, value, len(value), used) for key, value in pairs.items()],
+            )
+            self._size += sum(len(value) for value in pairs.values())
+            if self._size > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICT_TO_RATIO))
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock, self._conn:
+            self._size -= self._sizes(list(keys))
+            for batch in _batches(list(keys)):
+                self._conn.execute(f"DELETE FROM kv WHERE key IN ({_params(batch)})", batch)
+
+    def yield_keys(self, *, prefix: str | None = None) -> Iterator[str]:
+        with self._lock:
+            if prefix:
+                rows = self._conn.execute(
+                    "SELECT key FROM kv WHERE key >= ? AND key < ? ORDER BY key",
+                    (prefix, prefix + "\uffff"),
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT key FROM kv ORDER BY key").fetchall()
+        for (key,) in rows:
+            yield key
+
+    def _sizes(self, keys: list[str]) -> int:
+        total = 0
+        for batch in _batches(keys):
+            total += self._conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM kv WHERE key IN ({_params(batch)})", batch
+            ).fetchone()[0]
+        return total
+
+    def _evict(self, target: int):
+        rows = self._conn.execute("SELECT key, size FROM kv ORDER BY used").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM kv WHERE key = ?", evicted)
+
+
+def open_store(path: str, legacy_dir: str | None = None) -> SQLiteByteStore:
+    # one connection per file for the whole process, memory subdirs share the cache
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = SQLiteByteStore(path)
+        if legacy_dir and os.path.isdir(legacy_dir):
+            PrintStyle.standard(f"Migrating embeddings cache from {legacy_dir}...")
+            count = store.migrate_directory(legacy_dir)
+            PrintStyle.standard(f"Migrated {count} cached embeddings to {path}.")
+        return store
+
+
+def open_lru_store(path: str, max_bytes: int) -> LRUByteStore:
+    # one connection per file for the whole process, like open_store
+    with _stores_lock:
+        store = _lru_stores.get(path)
+        if store is None:
+            store = _lru_stores[path] = LRUByteStore(path, max_bytes)
+        return store
+
+
+def _batches(keys: list[str]) -> Iterator[list[str]]:
+    for i in range(0, len(keys), BATCH_SIZE):
+        yield keys[i : i + BATCH_SIZE]
+
+
+def _params(batch: list[str]) -> str:
+    return ",".join("?" * len(batch))
@@ -1,12 +1,13 @@
 from abc import abstractmethod
 import asyncio
 from collections import OrderedDict
+import hashlib
 import json
 import math
-from typing import Coroutine, Literal, TypedDict, cast
-from python.helpers import messages, tokens, settings, call_llm
+from typing import Any, Callable, Coroutine, Literal, TypedDict, cast
+from python.helpers import messages, tokens, settings, call_llm, summary_cache
 from enum import Enum
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
 
 BULK_MERGE_COUNT = 3
 TOPICS_KEEP_COUNT = 3
@@ -15,6 +16,8 @@ HISTORY_TOPIC_RATIO = 0.3
 HISTORY_BULK_RATIO = 0.2
 TOPIC_COMPRESS_RATIO = 0.65
 LARGE_MESSAGE_TO_TOPIC_RATIO = 0.25
+MAX_CONCURRENT_SUMMARIES = 4
+EXPECTED_SUMMARY_RATIO = 0.2  # planning guess of a summary's size relative to its source
 
 MessageContent = (
     list["MessageContent"]
@@ -30,14 +33,66 @@ class OutputMessage(TypedDict):
     content: MessageContent
 
 
+class CompressionStep:
+    # one planned change, an optional utility model call and how to apply its result
+    def __init__(
+        self,
+        apply: Callable[[Any], bool],
+        run: Coroutine[Any, Any, Any] | None = None,
+    ):
+        self.apply = apply
+        self.run = run
+
+
 class Record:
+    # slotted, long chats over many contexts hold a lot of records
+    __slots__ = ("_tokens", "_rendered", "parent")
+
     def __init__(self):
-        pass
+        # token counts are memoised per record and cleared up the parent chain on change
+        self._tokens: int | None = None
+        self._rendered: tuple[list[OutputMessage], list[BaseMessage]] | None = None
+        self.parent: "Record | None" = None
 
     def get_tokens(self) -> int:
+        if self._tokens is None:
+            self._tokens = self.calculate_tokens()
+        return self._tokens
+
+    def calculate_tokens(self) -> int:
         out = self.output_text()
         return tokens.approximate_tokens(out)
 
+    def invalidate(self):
+        self._tokens = None
+        self._rendered = None
+        if self.parent is not None:
+            self.parent.child_changed(self)
+
+    def child_changed(self, child: "Record"):
+        self.invalidate()
+
+    def adopt(self, *children: "Record"):
+        for child in children:
+            child.parent = self
+
+    def edited(self):
+        # more than an appended message, journaled persistence has to snapshot the history
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        if isinstance(root, History):
+            root.edits += 1
+
+    @property
+    def last_no(self) -> int:
+        # sequence number of the newest message this record holds
+        return 0
+
+    def output_since(self, no: int) -> list[OutputMessage]:
+        # output covering messages newer than no, summaries stand in for their messages
+        return self.output() if self.last_no > no else []
+
     @abstractmethod
     async def compress(self) -> bool:
         pass
@@ -62,15 +117,50 @@ class Record:
     def output_langchain(self):
         return output_langchain(self.output())
 
+    def get_rendered(self) -> tuple[list[OutputMessage], list[BaseMessage]]:
+        # output and its langchain messages, serialized once until the record changes
+        if self._rendered is None:
+            out = self.output()
+            self._rendered = (out, output_langchain(out))
+        return self._rendered
+
     def output_text(self, human_label="user", ai_label="ai"):
         return output_text(self.output(), ai_label, human_label)
 
 
 class Message(Record):
-    def __init__(self, ai: bool, content: MessageContent):
-        self.ai = ai
-        self.content = content
-        self.summary: MessageContent = ""
+    __slots__ = ("ai", "_content", "_summary", "no")
+
+    def __init__(self, ai: bool, content: MessageContent, no: int = 0):
+        super().__init__()
+        self.ai = bool(ai)  # the shared True and False, not whatever a loaded chat had
+        self._content = content
+        self._summary: MessageContent = ""
+        self.no = no
+
+    @property
+    def content(self) -> MessageContent:
+        return self._content
+
+    @content.setter
+    def content(self, value: MessageContent):
+        self._content = value
+        self.invalidate()
+        self.edited()
+
+    @property
+    def summary(self) -> MessageContent:
+        return self._summary
+
+    @summary.setter
+    def summary(self, value: MessageContent):
+        self._summary = value
+        self.invalidate()
+        self.edited()
+
+    @property
+    def last_no(self) -> int:
+        return self.no
 
     async def compress(self):
         return False
@@ -90,26 +180,53 @@ class Message(Record):
             "ai": self.ai,
             "content": self.content,
             "summary": self.summary,
+            "no": self.no,
         }
 
     @staticmethod
     def from_dict(data: dict, history: "History"):
-        msg = Message(ai=data["ai"], content=data.get("content", "Content lost"))
+        msg = Message(
+            ai=data["ai"], content=data.get("content", "Content lost"), no=data.get("no", 0)
+        )
         msg.summary = data.get("summary", "")
         return msg
 
 
 class Topic(Record):
+    __slots__ = ("history", "_summary", "messages")
+
     def __init__(self, history: "History"):
+        super().__init__()
         self.history = history
-        self.summary: str = ""
+        self._summary: str = ""
         self.messages: list[Message] = []
 
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    @summary.setter
+    def summary(self, value: str):
+        self._summary = value
+        self.invalidate()
+        self.edited()
+
+    def calculate_tokens(self) -> int:
+        if self.summary:
+            return super().calculate_tokens()
+        return sum(m.get_tokens() for m in self.messages)
+
     def add_message(self, ai: bool, content: MessageContent):
-        msg = Message(ai=ai, content=content)
+        msg = Message(ai=ai, content=content, no=self.history.next_no())
         self.messages.append(msg)
+        self.adopt(msg)
+        self.invalidate()
         return msg
 
+    @property
+    def last_no(self) -> int:
+        return max((m.no for m in self.messages), default=0)
+
     def output(self) -> list[OutputMessage]:
         if self.summary:
             return [OutputMessage(ai=False, content=self.summary)]
@@ -117,11 +234,17 @@ class Topic(Record):
             msgs = [m for r in self.messages for m in r.output()]
             return group_outputs_abab(msgs)
 
+    def output_since(self, no: int) -> list[OutputMessage]:
+        if self.summary:
+            return super().output_since(no)
+        msgs = [m for r in self.messages for m in r.output_since(no)]
+        return group_outputs_abab(msgs)
+
     async def summarize(self):
         self.summary = await self.summarize_messages(self.messages)
         return self.summary
 
-    async def compress_large_messages(self) -> bool:
+    def _large_messages(self) -> tuple[list[tuple[Message, int]], float]:
         set = settings.get_settings()
         msg_max_size = (
             set["chat_model_ctx_length"]
@@ -129,28 +252,72 @@ class Topic(Record):
             * HISTORY_TOPIC_RATIO
             * LARGE_MESSAGE_TO_TOPIC_RATIO
         )
-        large_msgs = []
-        for m in (m for m in self.messages if not m.summary):
-            out = m.output()
-            text = output_text(out)
-            tok = tokens.approximate_tokens(text)
-            leng = len(text)
-            if tok > msg_max_size:
-                large_msgs.append((m, tok, leng, out))
+        # cached counts, only messages over the limit get serialized
+        large_msgs = [
+            (m, m.get_tokens())
+            for m in self.messages
+            if not m.summary and m.get_tokens() > msg_max_size
+        ]
         large_msgs.sort(key=lambda x: x[1], reverse=True)
-        for msg, tok, leng, out in large_msgs:
-            trim_to_chars = leng * (msg_max_size / tok)
-            trunc = messages.truncate_dict_by_ratio(
-                self.history.agent,
-                out[0]["content"],
-                trim_to_chars * 1.15,
-                trim_to_chars * 0.85,
-            )
-            msg.summary = trunc
+        return large_msgs, msg_max_size
+
+    def _truncate(self, msg: Message, tok: int, msg_max_size: float) -> bool:
+        out = msg.output()
+        trim_to_chars = len(output_text(out)) * (msg_max_size / tok)
+        msg.summary = messages.truncate_dict_by_ratio(
+            self.history.agent,
+            out[0]["content"],
+            trim_to_chars * 1.15,
+            trim_to_chars * 0.85,
+        )
+        return True
 
-            return True
+    async def compress_large_messages(self) -> bool:
+        large_msgs, msg_max_size = self._large_messages()
+        for msg, tok in large_msgs:
+            return self._truncate(msg, tok, msg_max_size)
         return False
 
+    def plan_compression(self, excess: float) -> list[CompressionStep]:
+        # truncate large messages first, summarize the middle only if there is nothing left
+        # to truncate, the summary is then written from the truncated messages next round
+        steps = []
+        large_msgs, msg_max_size = self._large_messages()
+        for msg, tok in large_msgs:
+            if excess <= 0:
+                break
+            steps.append(
+                CompressionStep(
+                    apply=lambda _, msg=msg, tok=tok: self._truncate(msg, tok, msg_max_size)
+                )
+            )
+            excess -= tok - msg_max_size
+        if excess > 0 and not steps and len(self.messages) > 2:
+            cnt_to_sum = math.ceil((len(self.messages) - 2) * TOPIC_COMPRESS_RATIO)
+            msg_to_sum = self.messages[1 : cnt_to_sum + 1]
+            steps.append(
+                CompressionStep(
+                    run=self.summarize_messages(msg_to_sum),
+                    apply=lambda summary: self._replace_with_summary(msg_to_sum, summary),
+                )
+            )
+        return steps
+
+    def _replace_with_summary(self, msg_to_sum: list[Message], summary: str) -> bool:
+        # messages may have moved while the summary was written, replace only if intact
+        start = next((i for i, m in enumerate(self.messages) if m is msg_to_sum[0]), -1)
+        current = self.messages[start : start + len(msg_to_sum)]
+        if start < 0 or any(a is not b for a, b in zip(current, msg_to_sum)):
+            return False
+        sum_msg_content = self.history.agent.parse_prompt("fw.msg_summary.md", summary=summary)
+        # numbered as the newest message it replaces
+        sum_msg = Message(False, sum_msg_content, no=msg_to_sum[-1].no)
+        self.messages[start : start + len(msg_to_sum)] = [sum_msg]
+        self.adopt(sum_msg)
+        self.invalidate()
+        self.edited()
+        return True
+
     async def compress(self) -> bool:
         compress = await self.compress_large_messages()
         if not compress:
@@ -163,17 +330,13 @@ class Topic(Record):
             cnt_to_sum = math.ceil((len(self.messages) - 2) * TOPIC_COMPRESS_RATIO)
             msg_to_sum = self.messages[1 : cnt_to_sum + 1]
             summary = await self.summarize_messages(msg_to_sum)
-            sum_msg_content = self.history.agent.parse_prompt(
-                "fw.msg_summary.md", summary=summary
-            )
-            sum_msg = Message(False, sum_msg_content)
-            self.messages[1 : cnt_to_sum + 1] = [sum_msg]
-            return True
+            return self._replace_with_summary(msg_to_sum, summary)
         return False
 
     async def summarize_messages(self, messages: list[Message]):
         msg_txt = [m.output_text() for m in messages]
-        summary = await self.history.agent.call_utility_model(
+        summary = await summary_cache.summarize(
+            self.history.agent,
             system=self.history.agent.read_prompt("fw.topic_summary.sys.md"),
             message=self.history.agent.read_prompt(
                 "fw.topic_summary.msg.md", content=msg_txt
@@ -195,15 +358,39 @@ class Topic(Record):
         topic.messages = [
             Message.from_dict(m, history=history) for m in data["messages"]
         ]
+        topic.adopt(*topic.messages)
         return topic
 
 
 class Bulk(Record):
+    __slots__ = ("history", "_summary", "records")
+
     def __init__(self, history: "History"):
+        super().__init__()
         self.history = history
-        self.summary: str = ""
+        self._summary: str = ""
         self.records: list[Record] = []
 
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    @summary.setter
+    def summary(self, value: str):
+        self._summary = value
+        self.invalidate()
+        self.edited()
+
+    def calculate_tokens(self) -> int:
+        if self.summary:
+            return super().calculate_tokens()
+        return sum(r.get_tokens() for r in self.records)
+
+    def add_records(self, *records: Record):
+        self.records.extend(records)
+        self.adopt(*records)
+        self.invalidate()
+
     def output(
         self, human_label: str = "user", ai_label: str = "ai"
     ) -> list[OutputMessage]:
@@ -213,11 +400,22 @@ class Bulk(Record):
             msgs = [m for r in self.records for m in r.output()]
             return group_outputs_abab(msgs)
 
+    @property
+    def last_no(self) -> int:
+        return max((r.last_no for r in self.records), default=0)
+
+    def output_since(self, no: int) -> list[OutputMessage]:
+        if self.summary:
+            return super().output_since(no)
+        msgs = [m for r in self.records for m in r.output_since(no)]
+        return group_outputs_abab(msgs)
+
     async def compress(self):
         return False
 
     async def summarize(self):
-        self.summary = await self.history.agent.call_utility_model(
+        self.summary = await summary_cache.summarize(
+            self.history.agent,
             system=self.history.agent.read_prompt("fw.topic_summary.sys.md"),
             message=self.history.agent.read_prompt(
                 "fw.topic_summary.msg.md", content=self.output_text()
@@ -236,8 +434,7 @@ class Bulk(Record):
     def from_dict(data: dict, history: "History"):
         bulk = Bulk(history=history)
         bulk.summary = data["summary"]
-        cls = data["_cls"]
-        bulk.records = [Record.from_dict(r, history=history) for r in data["records"]]
+        bulk.add_records(*[Record.from_dict(r, history=history) for r in data["records"]])
         return bulk
 
 
@@ -245,10 +442,47 @@ class History(Record):
     def __init__(self, agent):
         from agent import Agent
 
+        super().__init__()
         self.bulks: list[Bulk] = []
         self.topics: list[Topic] = []
         self.current = Topic(history=self)
         self.agent: Agent = agent
+        self.counter = 0  # messages ever added, numbers them for incremental readers
+        self.edits = 0  # changes other than appended messages and topics
+        # running totals of the three parts, None when a record in the part changed
+        self._parts: dict[str, int | None] = {"bulks": 0, "topics": 0, "current": 0}
+        self.adopt(self.current)
+
+    def child_changed(self, child: Record):
+        self._tokens = None
+        if child is self.current:
+            self._parts["current"] = None
+        elif any(child is topic for topic in self.topics):
+            self._parts["topics"] = None
+        else:
+            self._parts["bulks"] = None
+
+    def structure_changed(self, edited: bool = True):
+        # records moved between parts, recount the parts from their cached records
+        self.adopt(*self.bulks, *self.topics, self.current)
+        self._tokens = None
+        self._parts = dict.fromkeys(self._parts)
+        if edited:
+            self.edits += 1
+
+    def _part_tokens(self, part: str, records: list[Record]) -> int:
+        total = self._parts[part]
+        if total is None:
+            total = self._parts[part] = sum(r.get_tokens() for r in records)
+        return total
+
+    def next_no(self) -> int:
+        self.counter += 1
+        return self.counter
+
+    @property
+    def last_no(self) -> int:
+        return self.counter
 
     def is_over_limit(self):
         limit = get_ctx_size_for_history()
@@ -256,15 +490,15 @@ class History(Record):
         return total > limit
 
     def get_bulks_tokens(self) -> int:
-        return sum(record.get_tokens() for record in self.bulks)
+        return self._part_tokens("bulks", self.bulks)  # type: ignore
 
     def get_topics_tokens(self) -> int:
-        return sum(record.get_tokens() for record in self.topics)
+        return self._part_tokens("topics", self.topics)  # type: ignore
 
     def get_current_topic_tokens(self) -> int:
-        return self.current.get_tokens()
+        return self._part_tokens("current", [self.current])
 
-    def get_tokens(self) -> int:
+    def calculate_tokens(self) -> int:
         return (
             self.get_bulks_tokens()
             + self.get_topics_tokens()
@@ -278,6 +512,7 @@ class History(Record):
         if self.current.messages:
             self.topics.append(self.current)
             self.current = Topic(history=self)
+            self.structure_changed(edited=False)
 
     def output(self) -> list[OutputMessage]:
         result: list[OutputMessage] = []
@@ -287,101 +522,242 @@ class History(Record):
         result = group_outputs_abab(result)
         return result
 
+    def output_langchain(self, copy: bool = True) -> list[BaseMessage]:
+        # assembled from the records' cached renders, older records give a byte stable prefix
+        # and only a message merged across a record boundary is serialized again; the
+        # renders are shared by every later call, so callers get shallow copies unless
+        # they only read them and pass copy=False
+        messages = self._rendered_messages()
+        return [m.model_copy() for m in messages] if copy else messages
+
+    def output_prompt(self, extras: list[OutputMessage]) -> list[BaseMessage]:
+        # chat prompt messages: the history, then the iteration's extras at the tail where
+        # they change without breaking the cached prefix
+        return self.output_langchain() + output_langchain(extras)
+
+    def _rendered_messages(self) -> list[BaseMessage]:
+        outputs: list[OutputMessage] = []
+        result: list[BaseMessage] = []
+        for record in self._prompt_records():
+            out, rendered = record.get_rendered()
+            if not out:
+                continue
+            if outputs and outputs[-1]["ai"] == out[0]["ai"]:
+                merged = group_outputs_abab([outputs[-1], out[0]])
+                outputs[-1:] = merged
+                result[-1:] = output_langchain(merged)
+                out, rendered = out[1:], rendered[1:]
+            outputs += out
+            result += rendered
+        return result
+
+    def _prompt_records(self) -> list[Record]:
+        # the current topic keeps growing, its messages are cached one by one
+        current = [self.current] if self.current.summary else self.current.messages
+        return [*self.bulks, *self.topics, *current]
+
+    def output_since(self, no: int) -> list[OutputMessage]:
+        result: list[OutputMessage] = []
+        for record in [*self.bulks, *self.topics, self.current]:
+            result += record.output_since(no)
+        return group_outputs_abab(result)
+
+    def output_until(self, no: int) -> list[OutputMessage]:
+        # the complement of output_since, records holding only messages up to no
+        result: list[OutputMessage] = []
+        for record in [*self.bulks, *self.topics, self.current]:
+            if record.last_no <= no:
+                result += record.output()
+            elif isinstance(record, Topic) and not record.summary:
+                result += [m for msg in record.messages if msg.no <= no for m in msg.output()]
+        return group_outputs_abab(result)
+
     @staticmethod
     def from_dict(data: dict, history: "History"):
         history.bulks = [Bulk.from_dict(b, history=history) for b in data["bulks"]]
         history.topics = [Topic.from_dict(t, history=history) for t in data["topics"]]
         history.current = Topic.from_dict(data["current"], history=history)
+        history.structure_changed()
+        history.counter = data.get("counter", 0)
+        if not history.counter:
+            # saved before messages were numbered, number them in order now
+            for msg in history.iter_messages():
+                msg.no = history.next_no()
         return history
 
+    def messages_since(self, no: int, topics: int) -> list[list[Message]]:
+        # messages appended after no while `topics` topics were closed, one list per topic
+        # from the then current one on, the counterpart of replay_messages
+        return [
+            [msg for msg in topic.messages if msg.no > no]
+            for topic in [*self.topics[topics:], self.current]
+        ]
+
+    def replay_messages(self, topics: list[list[dict]]):
+        # appends journaled messages, every list after the first starts a new topic
+        for i, messages in enumerate(topics):
+            if i:
+                self.new_topic()
+            for data in messages:
+                msg = Message.from_dict(data, history=self)
+                self.current.messages.append(msg)
+                self.current.adopt(msg)
+                self.current.invalidate()
+                self.counter = max(self.counter, msg.no)
+
+    def iter_messages(self):
+        def walk(record: Record):
+            if isinstance(record, Message):
+                yield record
+            elif isinstance(record, Topic):
+                yield from record.messages
+            elif isinstance(record, Bulk):
+                for child in record.records:
+                    yield from walk(child)
+
+        for record in [*self.bulks, *self.topics, self.current]:
+            yield from walk(record)
+
     def to_dict(self):
         return {
             "_cls": "History",
             "bulks": [b.to_dict() for b in self.bulks],
             "topics": [t.to_dict() for t in self.topics],
             "current": self.current.to_dict(),
+            "counter": self.counter,
         }
 
     def serialize(self):
         data = self.to_dict()
         return json.dumps(data)
 
-    async def compress(self):
+    async def compress(self, ratio: float = 1.0):
+        # each round plans every change needed from cached counts and runs them together
+        # ratio below 1 compresses older topics and bulks ahead of the limit, to that share
+        # of their budgets, the current topic is only compressed at its hard limit
         compressed = False
         while True:
-            curr, hist, bulk = (
-                self.get_current_topic_tokens(),
-                self.get_topics_tokens(),
-                self.get_bulks_tokens(),
-            )
-            total = get_ctx_size_for_history()
-            ratios = [
-                (curr, CURRENT_TOPIC_RATIO, "current_topic"),
-                (hist, HISTORY_TOPIC_RATIO, "history_topic"),
-                (bulk, HISTORY_BULK_RATIO, "history_bulk"),
-            ]
-            ratios = sorted(ratios, key=lambda x: (x[0] / total) / x[1], reverse=True)
-            compressed_part = False
-            for ratio in ratios:
-                if ratio[0] > ratio[1] * total:
-                    over_part = ratio[2]
-                    if over_part == "current_topic":
-                        compressed_part = await self.current.compress()
-                    elif over_part == "history_topic":
-                        compressed_part = await self.compress_topics()
-                    else:
-                        compressed_part = await self.compress_bulks()
-                    if compressed_part:
-                        break
-
-            if compressed_part:
-                compressed = True
-                continue
-            else:
+            steps = self.plan_compression(ratio)
+            if not steps or not await self.run_compression(steps):
                 return compressed
-
-    async def compress_topics(self) -> bool:
-        # summarize topics one by one
+            compressed = True
+
+    def plan_compression(self, ratio: float = 1.0) -> list[CompressionStep]:
+        total = get_ctx_size_for_history()
+        steps: list[CompressionStep] = []
+        # the topic being worked on keeps its detail until it really does not fit
+        excess = self.get_current_topic_tokens() - CURRENT_TOPIC_RATIO * total
+        if excess > 0:
+            steps += self.current.plan_compression(excess)
+        total *= ratio
+        excess = self.get_topics_tokens() - HISTORY_TOPIC_RATIO * total
+        topic_steps = self._plan_topics(excess) if excess > 0 else []
+        steps += topic_steps
+        # merges are planned against the bulks as they are, topics moving in this round
+        # would discard them, so they wait for the next round
+        moving = any(step.run is None for step in topic_steps)
+        excess = self.get_bulks_tokens() - HISTORY_BULK_RATIO * total
+        if excess > 0 and not moving:
+            steps += self._plan_bulks()
+        return steps
+
+    async def run_compression(self, steps: list[CompressionStep]) -> bool:
+        # utility calls run concurrently, each still passes the agent's rate limiter
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_SUMMARIES)
+
+        async def run(step: CompressionStep):
+            if step.run is None:
+                return None
+            async with semaphore:
+                return await step.run
+
+        results = await asyncio.gather(*[run(step) for step in steps])
+        # applied in one go without awaiting, readers never see a half compressed history
+        changed = False
+        for step, result in zip(steps, results):
+            changed = step.apply(result) or changed
+        return changed
+
+    def _plan_topics(self, excess: float) -> list[CompressionStep]:
+        # summarize topics oldest first until the part is expected to fit
+        steps = []
         for topic in self.topics:
-            if not topic.summary:
-                await topic.summarize()
-                return True
+            if excess <= 0:
+                break
+            if topic.summary:
+                continue
+            steps.append(
+                CompressionStep(
+                    run=topic.summarize_messages(topic.messages),
+                    apply=lambda summary, topic=topic: self._set_summary(topic, summary),
+                )
+            )
+            excess -= topic.get_tokens() * (1 - EXPECTED_SUMMARY_RATIO)
+        if not steps:
+            # all topics summarized and still too large, move them to bulks
+            steps.append(CompressionStep(apply=lambda _: self._topics_to_bulks()))
+        return steps
+
+    def _set_summary(self, topic: Topic, summary: str) -> bool:
+        topic.summary = summary
+        return True
 
-        # move oldest topic to bulks and summarize
+    def _topics_to_bulks(self) -> bool:
+        if not self.topics:
+            return False
         for topic in self.topics:
             bulk = Bulk(history=self)
-            bulk.records.append(topic)
-            if topic.summary:
-                bulk.summary = topic.summary
-            else:
-                await bulk.summarize()
+            bulk.add_records(topic)
+            bulk.summary = topic.summary
             self.bulks.append(bulk)
-            self.topics.remove(topic)
+        self.topics = []
+        self.structure_changed()
         return True
 
-    async def compress_bulks(self):
-        # merge bulks if possible
-        compressed = await self.merge_bulks_by(BULK_MERGE_COUNT)
-        # remove oldest bulk if necessary
-        if not compressed:
-            self.bulks.pop(0)
-        return compressed
+    def _plan_bulks(self) -> list[CompressionStep]:
+        if len(self.bulks) < 2:
+            return [CompressionStep(apply=lambda _: self._drop_oldest_bulk())]
+        # merge bulks by groups, all groups summarized concurrently and swapped in together
+        groups = [
+            self.bulks[i : i + BULK_MERGE_COUNT]
+            for i in range(0, len(self.bulks), BULK_MERGE_COUNT)
+        ]
+        merged: list[Bulk] = [group[0] for group in groups]
+        steps = [
+            CompressionStep(
+                run=self.merge_bulks(group),
+                apply=lambda bulk, i=i: self._set_merged(merged, i, bulk),
+            )
+            for i, group in enumerate(groups)
+            if len(group) > 1
+        ]
+        steps.append(CompressionStep(apply=lambda _: self._replace_bulks(groups, merged)))
+        return steps
 
-    async def merge_bulks_by(self, count: int):
-        if len(self.bulks) > 0:
-            return False
-        bulks = await asyncio.gather(
-            *[
-                self.merge_bulks(self.bulks[i : i + count])
-                for i in range(0, len(self.bulks), count)
-            ]
+    def _set_merged(self, merged: list[Bulk], index: int, bulk: Bulk) -> bool:
+        merged[index] = bulk
+        return True
+
+    def _replace_bulks(self, groups: list[list[Bulk]], merged: list[Bulk]) -> bool:
+        planned = [bulk for group in groups for bulk in group]
+        replaced = len(planned) == len(self.bulks) and all(
+            a is b for a, b in zip(planned, self.bulks)
         )
-        self.bulks = bulks
+        if replaced:
+            self.bulks = merged
+        self.structure_changed()  # also re-adopts bulks a discarded merge claimed
+        return replaced
+
+    def _drop_oldest_bulk(self) -> bool:
+        if not self.bulks:
+            return False
+        self.bulks.pop(0)
+        self.structure_changed()
         return True
 
     async def merge_bulks(self, bulks: list[Bulk]) -> Bulk:
         bulk = Bulk(history=self)
-        bulk.records = cast(list[Record], bulks)
+        bulk.add_records(*bulks)
         await bulk.summarize()
         return bulk
 
@@ -435,6 +811,17 @@ def output_langchain(messages: list[OutputMessage]):
     return result
 
 
+def prompt_digest(system: str, messages: list[BaseMessage], digest: Any = None) -> Any:
+    # identifies a prompt prefix, for provider side prompt cache diagnostics; continue
+    # the digest of an earlier prefix to hash only the messages appended since
+    if digest is None:
+        digest = hashlib.sha256(system.encode("utf-8"))
+    for message in messages:
+        digest.update(b"\0" + message.type.encode("utf-8") + b"\0")
+        digest.update(str(message.content).encode("utf-8"))
+    return digest
+
+
 def output_text(messages: list[OutputMessage], ai_label="ai", human_label="human"):
     return "\n".join(serialize_output(o, ai_label, human_label) for o in messages)
 
@@ -1,7 +1,13 @@
+import asyncio
+import atexit
 import glob
 import os
 import hashlib
 import json
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import Any, Dict, Literal, TypedDict
 from langchain_community.document_loaders import (
     CSVLoader,
@@ -11,30 +17,77 @@ from langchain_community.document_loaders import (
     UnstructuredHTMLLoader,
     UnstructuredMarkdownLoader,
 )
-from python.helpers import files
+from python.helpers import files, embedding_store
 from python.helpers.log import LogItem
 from python.helpers.print_style import PrintStyle
 
 text_loader_kwargs = {"autodetect_encoding": True}
 
+# Mapping file extensions to corresponding loader classes
+file_types_loaders = {
+    "txt": TextLoader,
+    "pdf": PyPDFLoader,
+    "csv": CSVLoader,
+    "html": UnstructuredHTMLLoader,
+    # "json": JSONLoader,
+    "json": TextLoader,
+    # "md": UnstructuredMarkdownLoader,
+    "md": TextLoader,
+}
+
+HASH_BLOCK_SIZE = 1024 * 1024
+PARSED_CACHE_FILE = "tmp/knowledge_parsed.db"
+MAX_PARSED_CACHE_BYTES = 256 * 1024 * 1024
+PROGRESS_STEPS = 10  # progress lines per stage at most
+
+_pool: ProcessPoolExecutor | None = None
+
 
 class KnowledgeImport(TypedDict):
     file: str
     checksum: str
-    ids: list[str]
+    mtime: float
+    size: int
+    ids: list[str]  # content hashes of the file's chunks, used as memory document ids
     state: Literal["changed", "original", "removed"]
     documents: list[Any]
 
 
 def calculate_checksum(file_path: str) -> str:
+    # streamed, large files are never held in memory at once
     hasher = hashlib.md5()
     with open(file_path, "rb") as f:
-        buf = f.read()
-        hasher.update(buf)
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            hasher.update(block)
     return hasher.hexdigest()
 
 
-def load_knowledge(
+def parse_file(file_path: str) -> list[Any]:
+    # runs in worker processes, must stay a picklable top-level function
+    ext = file_path.split(".")[-1].lower()
+    loader_cls = file_types_loaders[ext]
+    loader = loader_cls(
+        file_path,
+        **(text_loader_kwargs if ext in ["txt", "csv", "html", "md"] else {}),
+    )
+    return loader.load_and_split()
+
+
+def chunk_ids(file_key: str, documents: list[Any]) -> list[str]:
+    # deterministic ids, an edited file only changes the ids of the chunks that changed
+    ids = []
+    seen: dict[str, int] = {}
+    for doc in documents:
+        content = doc.page_content + "\0" + json.dumps(doc.metadata, sort_keys=True, default=str)
+        occurrence = seen.get(content, 0)  # identical chunks within one file
+        seen[content] = occurrence + 1
+        hasher = hashlib.sha1()
+        hasher.update(f"{file_key}\0{occurrence}\0{content}".encode("utf-8"))
+        ids.append(hasher.hexdigest())
+    return ids
+
+
+async def load_knowledge(
     log_item: LogItem | None,
     knowledge_dir: str,
     index: Dict[str, KnowledgeImport],
@@ -42,33 +95,13 @@ def load_knowledge(
     filename_pattern: str = "**/*",
 ) -> Dict[str, KnowledgeImport]:
 
-    # from python.helpers.memory import Memory
-
-    # Mapping file extensions to corresponding loader classes
-    file_types_loaders = {
-        "txt": TextLoader,
-        "pdf": PyPDFLoader,
-        "csv": CSVLoader,
-        "html": UnstructuredHTMLLoader,
-        # "json": JSONLoader,
-        "json": TextLoader,
-        # "md": UnstructuredMarkdownLoader,
-        "md": TextLoader,
-    }
-
-    cnt_files = 0
-    cnt_docs = 0
-
-    # for area in Memory.Area:
-    #     subdir = files.get_abs_path(knowledge_dir, area.value)
-
-    # if not os.path.exists(knowledge_dir):
-    #     os.makedirs(knowledge_dir)
-    #     continue
-
     # Fetch all files in the directory with specified extensions
     kn_files = glob.glob(knowledge_dir + "/" + filename_pattern, recursive=True)
-    kn_files = [f for f in kn_files if os.path.isfile(f)]
+    kn_files = [
+        f
+        for f in kn_files
+        if os.path.isfile(f) and f.split(".")[-1].lower() in file_types_loaders
+    ]
 
     if kn_files:
         PrintStyle.standard(
@@ -79,40 +112,62 @@ def load_knowledge(
                 progress=f"\nFound {len(kn_files)} knowledge files in {knowledge_dir}, processing...",
             )
 
+    # stage 1: unchanged mtime and size means unchanged file, no need to read it
+    to_hash: list[str] = []
     for file_path in kn_files:
-        ext = file_path.split(".")[-1].lower()
-        if ext in file_types_loaders:
-            checksum = calculate_checksum(file_path)
-            file_key = file_path  # os.path.relpath(file_path, knowledge_dir)
-
-            # Load existing data from the index or create a new entry
-            file_data = index.get(file_key, {})
-
-            if file_data.get("checksum") == checksum:
-                file_data["state"] = "original"
-            else:
-                file_data["state"] = "changed"
-
-            if file_data["state"] == "changed":
-                file_data["checksum"] = checksum
-                loader_cls = file_types_loaders[ext]
-                loader = loader_cls(
-                    file_path,
-                    **(
-                        text_loader_kwargs
-                        if ext in ["txt", "csv", "html", "md"]
-                        else {}
-                    ),
-                )
-                file_data["documents"] = loader.load_and_split()
-                for doc in file_data["documents"]:
-                    doc.metadata = {**doc.metadata, **metadata}
-                cnt_files += 1
-                cnt_docs += len(file_data["documents"])
-                # PrintStyle.standard(f"Imported {len(file_data['documents'])} documents from {file_path}")
-
-            # Update the index
-            index[file_key] = file_data  # type: ignore
+        file_key = file_path  # os.path.relpath(file_path, knowledge_dir)
+        file_data = index.get(file_key, {})
+        stat = os.stat(file_path)
+        if (
+            file_data.get("checksum")
+            and file_data.get("mtime") == stat.st_mtime
+            and file_data.get("size") == stat.st_size
+        ):
+            file_data["state"] = "original"
+        else:
+            file_data["mtime"] = stat.st_mtime
+            file_data["size"] = stat.st_size
+            to_hash.append(file_key)
+        index[file_key] = file_data  # type: ignore
+
+    # stage 2: streaming hashes of touched files, in threads
+    checksums = await asyncio.gather(
+        *[asyncio.to_thread(calculate_checksum, f) for f in to_hash]
+    )
+    to_parse: list[str] = []
+    for file_key, checksum in zip(to_hash, checksums):
+        file_data = index[file_key]
+        if file_data.get("checksum") == checksum:
+            file_data["state"] = "original"  # touched but not modified
+        else:
+            file_data["checksum"] = checksum
+            file_data["state"] = "changed"
+            to_parse.append(file_key)
+
+    # stage 3: parsed documents from cache by checksum, the rest parsed in a process pool
+    cache = _parsed_cache()
+    cached = cache.mget([index[f]["checksum"] for f in to_parse])
+    parsed: dict[str, list[Any]] = {
+        f: pickle.loads(data) for f, data in zip(to_parse, cached) if data is not None
+    }
+    to_load = [f for f in to_parse if f not in parsed]
+    if to_load:
+        loaded = await _parse_files(log_item, to_load)
+        parsed.update(loaded)
+        cache.mset(
+            [(index[f]["checksum"], pickle.dumps(docs)) for f, docs in loaded.items()]
+        )
+
+    cnt_files = 0
+    cnt_docs = 0
+    for file_key in to_parse:
+        documents = parsed[file_key]
+        for doc in documents:
+            # cached documents may come from identical content at another path
+            doc.metadata = {**doc.metadata, "source": file_key, **metadata}
+        index[file_key]["documents"] = documents
+        cnt_files += 1
+        cnt_docs += len(documents)
 
     # loop index where state is not set and mark it as removed
     for file_key, file_data in index.items():
@@ -125,3 +180,55 @@ def load_knowledge(
             progress=f"\nProcessed {cnt_docs} documents from {cnt_files} files."
         )
     return index
+
+
+def _parsed_cache() -> embedding_store.LRUByteStore:
+    return embedding_store.open_lru_store(
+        files.get_abs_path(PARSED_CACHE_FILE), MAX_PARSED_CACHE_BYTES
+    )
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # spawned, forking a process with running threads can deadlock the workers
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+atexit.register(_shutdown_pool)
+
+
+async def _parse_files(
+    log_item: LogItem | None, file_paths: list[str]
+) -> dict[str, list[Any]]:
+    pool = _get_pool()
+    loop = asyncio.get_running_loop()
+
+    result: dict[str, list[Any]] = {}
+    broken = False
+    step = max(1, len(file_paths) // PROGRESS_STEPS)
+
+    async def parse(file_path: str):
+        nonlocal broken
+        try:
+            docs = await loop.run_in_executor(pool, parse_file, file_path)
+        except BrokenProcessPool:
+            broken = True
+            docs = await asyncio.to_thread(parse_file, file_path)
+        result[file_path] = docs
+        if log_item and (len(result) % step == 0 or len(result) == len(file_paths)):
+            log_item.stream(progress=f"\nParsed {len(result)}/{len(file_paths)} files")
+
+    await asyncio.gather(*[parse(f) for f in file_paths])
+    # a dead worker breaks the whole pool, the next import gets a fresh one
+    if broken and _pool is pool:
+        _shutdown_pool()
+    return result
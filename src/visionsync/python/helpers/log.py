@@ -1,8 +1,8 @@
 from dataclasses import dataclass, field
 import json
+import sys
 from typing import Any, Literal, Optional, Dict
 import uuid
-from collections import OrderedDict  # Import OrderedDict
 
 Type = Literal[
     "agent",
@@ -22,7 +22,7 @@ Type = Literal[
 ProgressUpdate = Literal["persistent", "temporary", "none"]
 
 
-@dataclass
+@dataclass(slots=True)
 class LogItem:
     log: "Log"
     no: int
@@ -31,12 +31,13 @@ class LogItem:
     content: str
     temp: bool
     update_progress: Optional[ProgressUpdate] = "persistent"
-    kvps: Optional[OrderedDict] = None  # Use OrderedDict for kvps
+    kvps: Optional[dict] = None  # created on the first key, insertion ordered
     id: Optional[str] = None  # Add id field
     guid: str = ""
 
     def __post_init__(self):
         self.guid = self.log.guid
+        self.type = sys.intern(self.type)  # a handful of types shared by every item
 
     def update(
         self,
@@ -106,16 +107,13 @@ class Log:
         id: Optional[str] = None,  # Add id parameter
         **kwargs,
     ) -> LogItem:
-        # Use OrderedDict if kvps is provided
-        if kvps is not None:
-            kvps = OrderedDict(kvps)
         item = LogItem(
             log=self,
             no=len(self.logs),
             type=type,
             heading=heading or "",
             content=content or "",
-            kvps=OrderedDict({**(kvps or {}), **(kwargs or {})}),
+            kvps={**(kvps or {}), **kwargs} if kvps or kwargs else None,
             update_progress=(
                 update_progress if update_progress is not None else "persistent"
             ),
@@ -140,7 +138,7 @@ class Log:
     ):
         item = self.logs[no]
         if type is not None:
-            item.type = type
+            item.type = sys.intern(type)
         if update_progress is not None:
             item.update_progress = update_progress
         if heading is not None:
@@ -148,14 +146,14 @@ class Log:
         if content is not None:
             item.content = content
         if kvps is not None:
-            item.kvps = OrderedDict(kvps)  # Use OrderedDict to keep the order
+            item.kvps = dict(kvps)
 
         if temp is not None:
             item.temp = temp
 
         if kwargs:
             if item.kvps is None:
-                item.kvps = OrderedDict()  # Ensure kvps is an OrderedDict
+                item.kvps = {}
             for k, v in kwargs.items():
                 item.kvps[k] = v
 
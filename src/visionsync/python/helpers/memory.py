@@ -1,12 +1,11 @@
 from datetime import datetime
-from typing import Any, List, Sequence
-from langchain.storage import InMemoryByteStore, LocalFileStore
+from typing import Any, Callable, List, Sequence
+from langchain.storage import InMemoryByteStore
 from langchain.embeddings import CacheBackedEmbeddings
 
 # from langchain_chroma import Chroma
 from langchain_community.vectorstores import FAISS
 import faiss
-from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores.utils import (
     DistanceStrategy,
 )
@@ -22,20 +21,517 @@ from langchain_core.documents import Document
 import uuid
 from python.helpers import knowledge_import
 from python.helpers.log import Log, LogItem
+from python.helpers.memory_journal import MemoryJournal
+from python.helpers.memory_filter import INDEXED_FIELDS, MetadataIndex, compile_filter
+from python.helpers.memory_lexical import (
+    MIN_COVERAGE,
+    LexicalIndex,
+    fused_scores,
+    reciprocal_rank_fusion,
+)
+from python.helpers import memory_index
+from python.helpers.query_cache import QueryCache, get_query_cache, open_disk_store
+from python.helpers import embedding_store
+from python.helpers import memory_docstore
+from python.helpers.memory_docstore import SQLiteDocstore
+from python.helpers.defer import DeferredTask
 from enum import Enum
+import asyncio
 from agent import Agent
 import models
 
 
+DEDUP_SEARCH_LIMIT = 100
+HYBRID_FETCH_FACTOR = 4  # candidates per result when a python filter drops hybrid hits
+MMR_FETCH_FACTOR = 4  # candidates per result that diversification chooses from
+
+
 class MyFaiss(FAISS):
+    docstore: SQLiteDocstore
+    _meta_index: MetadataIndex | None = None
+    _lexical_index: LexicalIndex | None = None
+    _id_positions: dict[str, int] | None = None
+    _mapped_index: faiss.Index | None = None
+    tiers: memory_index.TieredIndex | None = None
+    query_cache: QueryCache | None = None
+    generation = 0  # bumped by every add and delete, lets callers cache search results
+    layout = 0  # bumped whenever positions are renumbered, invalidates index builds
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # positions deleted from an approximate index, skipped by searches until a rebuild
+        self.tombstones = memory_docstore.deleted_positions(self.index_to_docstore_id)
+
+    @classmethod
+    def load_snapshot(cls, db_dir: str, embeddings: Embeddings, **kwargs) -> "MyFaiss":
+        # index codes and position ids are memory-mapped, documents are read per hit
+        index = memory_docstore.read_index(
+            os.path.join(db_dir, memory_docstore.INDEX_FILE)
+        )
+        db = cls(
+            embedding_function=embeddings,
+            index=index,
+            docstore=SQLiteDocstore(os.path.join(db_dir, memory_docstore.DOCSTORE_FILE)),
+            index_to_docstore_id=memory_docstore.load_positions(
+                os.path.join(db_dir, memory_docstore.IDS_FILE)
+            ),
+            **kwargs,
+        )
+        db._mapped_index = index
+        return db
+
+    def save_snapshot(self, folder: str):
+        os.makedirs(folder, exist_ok=True)
+        faiss.write_index(self.index, os.path.join(folder, memory_docstore.INDEX_FILE))
+        memory_docstore.save_positions(
+            os.path.join(folder, memory_docstore.IDS_FILE), self.index_to_docstore_id
+        )
+
+    def _own_index(self):
+        # the first mutation after load copies the mapped index into memory
+        if self._mapped_index is not None and self.index is self._mapped_index:
+            self.index = memory_docstore.own_index(self.index)
+            if self.tiers:
+                memory_index.apply_search_knobs(self.index, self.tiers.config)
+        self._mapped_index = None
+
+    def exact_vectors(self, positions: list[int]) -> np.ndarray:
+        # float32 vectors by position for rebuilds, zeros where the position is deleted
+        result = np.zeros((len(positions), self.index.d), dtype=np.float32)
+        rows = [row for row, pos in enumerate(positions) if pos not in self.tombstones]
+        if rows:
+            result[rows] = self.vectors_at([positions[row] for row in rows])
+        return result
+
+    def keep_vectors(self, positions: Sequence[int], vectors: np.ndarray):
+        ids = [self.index_to_docstore_id[pos] for pos in positions]
+        self.docstore.add_vectors(ids, vectors)
+
+    def _position_vectors(self, positions: list[int]) -> np.ndarray:
+        ids = [self.index_to_docstore_id[pos] for pos in positions]
+        vectors = self.docstore.vectors(ids)
+        result = np.zeros((len(positions), self.index.d), dtype=np.float32)
+        for row, (pos, vector) in enumerate(zip(positions, vectors)):
+            # decoded codes only for vectors stored before quantization was configured
+            result[row] = vector if vector is not None else self.index.reconstruct(pos)
+        return result
+
+    def _rerank(
+        self, queries: np.ndarray, scores: np.ndarray, indices: np.ndarray, k: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # exact inner products for the quantized candidates, best k per query
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, candidates) in enumerate(zip(queries, indices)):
+            candidates = candidates[candidates != -1]
+            if not candidates.size:
+                continue
+            exact = self._position_vectors(candidates.tolist()) @ query
+            order = np.argsort(-exact)[:k]
+            out_scores[row, : order.size] = exact[order]
+            out_indices[row, : order.size] = candidates[order]
+        return out_scores, out_indices
+
+    def vectors_at(self, positions: list[int]) -> np.ndarray:
+        # exact vectors for a few positions, read back from the index while it stores floats
+        if self.tiers and self.tiers.storage != "float":
+            return self._position_vectors(positions)
+        memory_index.ensure_direct_map(self.index)
+        return self.index.reconstruct_batch(np.array(positions, dtype=np.int64))
+
+    @property
+    def _reranks(self) -> bool:
+        return bool(
+            self.tiers and self.tiers.config["rerank"] and self.tiers.storage != "float"
+        )
+
     # override aget_by_ids
     def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
-        # return all self.docstore._dict[id] in ids
-        return [self.docstore._dict[id] for id in (ids if isinstance(ids, list) else [ids]) if id in self.docstore._dict]  # type: ignore
+        # return all stored documents in ids, one batched read
+        ids = ids if isinstance(ids, list) else [ids]  # type: ignore
+        return [doc for doc in self.docstore.mget(ids) if doc is not None]
 
     async def aget_by_ids(self, ids: Sequence[str], /) -> List[Document]:
         return self.get_by_ids(ids)
 
+    @property
+    def meta_index(self) -> MetadataIndex:
+        # built lazily from the docstore, then kept in sync by add/delete
+        if self._meta_index is None:
+            ids = [
+                self.index_to_docstore_id[i]
+                for i in range(len(self.index_to_docstore_id))
+            ]
+            meta_index = MetadataIndex()
+            meta_index.add(self.docstore.field_values(ids, INDEXED_FIELDS))
+            self._meta_index = meta_index
+        return self._meta_index
+
+    @property
+    def lexical_index(self) -> LexicalIndex:
+        # built lazily like meta_index, only memories searched in hybrid mode pay for it
+        if self._lexical_index is None:
+            ids = [
+                self.index_to_docstore_id[i]
+                for i in range(len(self.index_to_docstore_id))
+            ]
+            lexical_index = LexicalIndex()
+            lexical_index.add(
+                [doc.page_content if doc else "" for doc in self.docstore.mget(ids)]
+            )
+            self._lexical_index = lexical_index
+        return self._lexical_index
+
+    @property
+    def id_positions(self) -> dict[str, int]:
+        # document id -> position, built lazily like meta_index, then kept in sync
+        if self._id_positions is None:
+            self._id_positions = {
+                id: pos
+                for pos, id in self.index_to_docstore_id.items()
+                if id != memory_docstore.TOMBSTONE
+            }
+        return self._id_positions
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        # like the vector store's add, but positions continue after deleted ones, which
+        # ivf and hnsw keep until a rebuild, instead of after the vectors still indexed
+        text_embeddings = list(text_embeddings)
+        texts = [text for text, _ in text_embeddings]
+        metadatas = list(metadatas or [{}] * len(texts))
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Duplicate ids found in the ids list.")
+        self._own_index()
+        self.generation += 1
+        vectors = np.array([v for _, v in text_embeddings], dtype=np.float32)
+        indexed = vectors.copy()
+        if self._normalize_L2:
+            faiss.normalize_L2(indexed)
+        start = len(self.index_to_docstore_id)
+        memory_index.add_vectors(self.index, indexed, start)
+        self.docstore.add(
+            {
+                id: Document(id=id, page_content=text, metadata=metadata)
+                for id, text, metadata in zip(ids, texts, metadatas)
+            }
+        )
+        self.index_to_docstore_id.update({start + i: id for i, id in enumerate(ids)})
+        if self._id_positions is not None:
+            self._id_positions.update({id: start + i for i, id in enumerate(ids)})
+        if self.tiers and self.tiers.keeps_vectors:
+            self.keep_vectors(range(start, start + len(ids)), vectors)
+        if self._meta_index is not None:
+            self._meta_index.add(metadatas)
+        if self._lexical_index is not None:
+            self._lexical_index.add(texts)
+        if self.tiers:
+            self.tiers.maybe_upgrade()
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        self._meta_index = None  # not tracked, rebuild on next use
+        self._lexical_index = None
+        self._id_positions = None
+        self.generation += 1
+        return super().add_texts(texts, metadatas, ids, **kwargs)
+
+    def delete(self, ids: Sequence[str] | None = None, **kwargs):
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        positions = self.id_positions
+        missing = set(ids).difference(positions)
+        if missing:
+            raise ValueError(
+                f"Some specified ids do not exist in the current store. Ids not found: {missing}"
+            )
+        self._own_index()
+        self.generation += 1
+        self.remove_positions(sorted({positions[id] for id in ids}))
+        self.docstore.delete(list(ids))
+        if self.tiers:
+            self.tiers.maybe_upgrade()
+        return True
+
+    def remove_positions(self, positions: list[int]):
+        # flat indexes renumber, approximate ones keep the position with a tombstone id
+        if not positions:
+            return
+        if memory_index.remove_vectors(self.index, positions):
+            self.compact(positions)
+            return
+        for pos in positions:
+            if self._id_positions is not None:
+                self._id_positions.pop(self.index_to_docstore_id[pos], None)
+            self.index_to_docstore_id[pos] = memory_docstore.TOMBSTONE
+        self.tombstones.update(positions)
+
+    def compact(self, positions: Sequence[int]):
+        # drop positions from the mapping and the position-keyed indexes, the vector index
+        # has already dropped them
+        removed = set(positions)
+        if not removed:
+            return
+        mapping = self.index_to_docstore_id
+        remaining = [mapping[pos] for pos in range(len(mapping)) if pos not in removed]
+        self.index_to_docstore_id = dict(enumerate(remaining))
+        self.tombstones = memory_docstore.deleted_positions(self.index_to_docstore_id)
+        if self._id_positions is not None:
+            self._id_positions = {
+                id: pos
+                for pos, id in enumerate(remaining)
+                if id != memory_docstore.TOMBSTONE
+            }
+        if self._meta_index is not None:
+            self._meta_index.remove(sorted(removed))
+        if self._lexical_index is not None:
+            self._lexical_index.remove(sorted(removed))
+        self.layout += 1
+
+    def _live(self, selected: np.ndarray | None) -> np.ndarray | None:
+        # metadata and lexical positions still cover tombstones, searches must skip them
+        if not self.tombstones:
+            return selected
+        live = np.ones(len(self.index_to_docstore_id), dtype=bool)
+        live[list(self.tombstones)] = False
+        return live if selected is None else selected & live
+
+    def search_selected(
+        self,
+        embedding: list[float],
+        k: int,
+        selected: np.ndarray,
+        score_threshold: float,
+    ) -> list[Document]:
+        return self.search_batch(
+            np.array([embedding], dtype=np.float32), k, selected, score_threshold
+        )[0]
+
+    def search_batch(
+        self,
+        embeddings: np.ndarray,
+        k: int,
+        selected: np.ndarray,
+        score_threshold: float,
+    ) -> list[list[Document]]:
+        # vector search restricted to the selected positions, no over-fetching and post-filtering
+        rows = [
+            [self.index_to_docstore_id[pos] for pos in positions]
+            for positions in self._search_positions(embeddings, k, selected, score_threshold)
+        ]
+        # documents for all hits in one read
+        found = self.docstore.mget([id for row in rows for id in row])
+        docs = iter(found)
+        return [[doc for _ in row if (doc := next(docs)) is not None] for row in rows]
+
+    def _search_positions(
+        self,
+        embeddings: np.ndarray,
+        k: int,
+        selected: np.ndarray | None,
+        score_threshold: float,
+    ) -> list[list[int]]:
+        # positions above the threshold, best first, among selected ones when given
+        excluded = None
+        if selected is not None:
+            ids = np.flatnonzero(self._live(selected)).astype("int64")
+            limit = ids.size
+            sel = faiss.IDSelectorBatch(ids)
+        else:
+            limit = len(self.index_to_docstore_id) - len(self.tombstones)
+            sel = None
+            if self.tombstones:
+                excluded = faiss.IDSelectorBatch(np.fromiter(self.tombstones, dtype=np.int64))
+                sel = faiss.IDSelectorNot(excluded)
+        if limit == 0 or len(embeddings) == 0:
+            return [[] for _ in range(len(embeddings))]
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+        if self.tiers:
+            params = memory_index.search_params(self.index, sel, self.tiers.config)
+        else:
+            params = faiss.SearchParameters(sel=sel) if sel is not None else None
+        if self._reranks:
+            fetch = min(k * self.tiers.config["rerank_factor"], limit)  # type: ignore
+            scores, indices = self.index.search(vectors, fetch, params=params)
+            scores, indices = self._rerank(vectors, scores, indices, min(k, limit))
+        else:
+            scores, indices = self.index.search(vectors, min(k, limit), params=params)
+        relevance_fn = self._select_relevance_score_fn()
+        return [
+            [
+                int(pos)
+                for score, pos in zip(row_scores, row_indices)
+                if pos != -1 and relevance_fn(float(score)) >= score_threshold
+            ]
+            for row_scores, row_indices in zip(scores, indices)
+        ]
+
+    def search_hybrid(
+        self,
+        query: str,
+        embedding: list[float],
+        k: int,
+        score_threshold: float,
+        selected: np.ndarray | None = None,
+        filter: Callable[[dict], bool] | None = None,
+        min_coverage: float = MIN_COVERAGE,
+    ) -> list[Document]:
+        # vector and BM25 rankings fused by reciprocal rank, vector hits gated by relevance,
+        # keyword hits by the share of the query's idf weight they match
+        fetch = k * HYBRID_FETCH_FACTOR if filter else k
+        vector_hits = self._search_positions(
+            np.array([embedding], dtype=np.float32), fetch, selected, score_threshold
+        )[0]
+        keyword_hits = self.lexical_index.search(
+            query, fetch, min_coverage=min_coverage, selected=self._live(selected)
+        )
+        fused = reciprocal_rank_fusion(
+            [np.array(vector_hits, dtype=np.int64), keyword_hits],
+            len(vector_hits) + len(keyword_hits),
+        )
+        found = self.docstore.mget([self.index_to_docstore_id[int(pos)] for pos in fused])
+        docs = [
+            doc
+            for doc in found
+            if doc is not None and (filter is None or filter(doc.metadata))
+        ]
+        return docs[:k]
+
+    def search_many(
+        self,
+        queries: list[str],
+        embeddings: np.ndarray,
+        k: int,
+        score_threshold: float,
+        selections: list[np.ndarray | None],
+        filters: list[Callable[[dict], bool] | None],
+        mmr_lambda: float,
+        hybrid: bool = False,
+        min_coverage: float = MIN_COVERAGE,
+    ) -> list[list[Document]]:
+        # one batch search for all queries, then maximal marginal relevance over the
+        # candidates, in query order, so later queries skip what earlier ones returned
+        fetch = k * MMR_FETCH_FACTOR
+        rows = self._search_positions(embeddings, fetch, None, score_threshold)
+        shortfall: dict[int, list[int]] = {}
+        for i, selected in enumerate(selections):
+            if selected is None:
+                continue
+            rows[i] = [pos for pos in rows[i] if selected[pos]]
+            if len(rows[i]) < fetch and np.count_nonzero(selected) > len(rows[i]):
+                # selective filter, the unfiltered neighbours were mostly elsewhere
+                shortfall.setdefault(id(selected), []).append(i)
+        for group in shortfall.values():
+            found = self._search_positions(
+                embeddings[group], fetch, selections[group[0]], score_threshold
+            )
+            for i, positions in zip(group, found):
+                rows[i] = positions
+
+        rankings: list[tuple[np.ndarray, np.ndarray | None]] = []
+        for i, positions in enumerate(rows):
+            ranked = np.array(positions, dtype=np.int64)
+            if not hybrid:
+                rankings.append((ranked, None))
+                continue
+            keywords = self.lexical_index.search(
+                queries[i],
+                fetch,
+                min_coverage=min_coverage,
+                selected=self._live(selections[i]),
+            )
+            ranked, fused = fused_scores([ranked, keywords])
+            rankings.append((ranked, fused / fused[0] if fused.size else fused))
+
+        candidates = np.unique(np.concatenate([ranked for ranked, _ in rankings]))
+        if not candidates.size:
+            return [[] for _ in queries]
+        ids = [self.index_to_docstore_id[int(pos)] for pos in candidates]
+        docs = dict(zip(candidates.tolist(), self.docstore.mget(ids)))
+        vectors = self.vectors_at(candidates.tolist())
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        rows_of = {int(pos): row for row, pos in enumerate(candidates)}
+        queries_np = np.array(embeddings, dtype=np.float32)
+        queries_np /= np.maximum(np.linalg.norm(queries_np, axis=1, keepdims=True), 1e-12)
+
+        taken: set[int] = set()  # candidate rows already returned for an earlier query
+        results = []
+        for i, (ranked, relevance) in enumerate(rankings):
+            filter = filters[i]
+            allowed = [
+                int(pos)
+                for pos in ranked
+                if (doc := docs[int(pos)]) is not None
+                and (filter is None or filter(doc.metadata))
+                and rows_of[int(pos)] not in taken
+            ]
+            if relevance is not None:
+                scores = dict(zip(ranked.tolist(), relevance.tolist()))
+                relevance = np.array([scores[pos] for pos in allowed], dtype=np.float32)
+            chosen = self._mmr(
+                vectors[[rows_of[pos] for pos in allowed]],
+                queries_np[i],
+                relevance,
+                vectors[sorted(taken)],
+                k,
+                mmr_lambda,
+            )
+            taken.update(rows_of[allowed[c]] for c in chosen)
+            results.append([docs[allowed[c]] for c in chosen])
+        return results
+
+    @staticmethod
+    def _mmr(
+        vectors: np.ndarray,
+        query: np.ndarray,
+        relevance: np.ndarray | None,
+        previous: np.ndarray,
+        k: int,
+        mmr_lambda: float,
+    ) -> list[int]:
+        # greedy mmr on unit vectors, one matrix product up front and a vector op per pick
+        if not len(vectors):
+            return []
+        if relevance is None:
+            relevance = vectors @ query
+        similarity = vectors @ vectors.T
+        redundancy = (
+            (vectors @ previous.T).max(axis=1) if len(previous) else np.zeros(len(vectors))
+        )
+        available = np.ones(len(vectors), dtype=bool)
+        chosen: list[int] = []
+        for _ in range(min(k, len(vectors))):
+            scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+            chosen.append(best)
+            available[best] = False
+            redundancy = np.maximum(redundancy, similarity[:, best])
+        return chosen
+
+    def search_filtered(
+        self,
+        embedding: list[float],
+        k: int,
+        score_threshold: float,
+        filter: Callable[[dict], bool] | None = None,
+    ) -> list[Document]:
+        # post-filtered vector search for expressions the metadata index cannot answer,
+        # over-fetched like the vector store does when a filter is given
+        fetch = max(20, k) if filter else k
+        positions = self._search_positions(
+            np.array([embedding], dtype=np.float32), fetch, None, score_threshold
+        )[0]
+        found = self.docstore.mget([self.index_to_docstore_id[pos] for pos in positions])
+        docs = [
+            doc
+            for doc in found
+            if doc is not None and (filter is None or filter(doc.metadata))
+        ]
+        return docs[:k]
+
 
 class Memory:
 
@@ -46,6 +542,8 @@ class Memory:
         INSTRUMENTS = "instruments"
 
     index: dict[str, "MyFaiss"] = {}
+    journals: dict[str, MemoryJournal] = {}
+    _import_locks: dict[str, asyncio.Lock] = {}
 
     @staticmethod
     async def get(agent: Agent):
@@ -65,9 +563,12 @@ class Memory:
                 ),
                 memory_subdir,
                 False,
+                agent.config.memory_index,
             )
             Memory.index[memory_subdir] = db
             wrap = Memory(agent, db, memory_subdir=memory_subdir)
+            if wrap.journal.pending:
+                wrap._schedule_checkpoint()  # compact replayed journal
             if agent.config.knowledge_subdirs:
                 await wrap.preload_knowledge(
                     log_item, agent.config.knowledge_subdirs, memory_subdir
@@ -84,15 +585,62 @@ class Memory:
     async def reload(agent: Agent):
         memory_subdir = agent.config.memory_subdir or "default"
         if Memory.index.get(memory_subdir):
+            # write pending mutations to the snapshot before dropping the index
+            Memory(agent, Memory.index[memory_subdir], memory_subdir).checkpoint()
             del Memory.index[memory_subdir]
         return await Memory.get(agent)
 
+    @staticmethod
+    def start_knowledge_import(agent: Agent) -> str:
+        # incremental import into the live index, searches keep working meanwhile
+        # job state and progress live in the log item, the ui polls it like any other
+        memory_subdir = agent.config.memory_subdir or "default"
+        job_id = str(uuid.uuid4())
+        log_item = agent.context.log.log(
+            type="util",
+            heading=f"Importing knowledge into '/{memory_subdir}'",
+            job_id=job_id,
+            state="queued",
+        )
+        DeferredTask(Memory._run_knowledge_import, agent, memory_subdir, log_item)
+        return job_id
+
+    @staticmethod
+    async def _run_knowledge_import(agent: Agent, memory_subdir: str, log_item: LogItem):
+        # jobs on the same subdir share knowledge_import.json, run them one at a time
+        lock = Memory._import_locks.setdefault(memory_subdir, asyncio.Lock())
+        async with lock:
+            log_item.update(state="running")
+            try:
+                if Memory.index.get(memory_subdir) is None:
+                    await Memory.get(agent)  # first load preloads knowledge itself
+                else:
+                    db = Memory(agent, Memory.index[memory_subdir], memory_subdir)
+                    await db.preload_knowledge(
+                        log_item, agent.config.knowledge_subdirs, memory_subdir
+                    )
+                log_item.update(
+                    heading=f"Knowledge imported into '/{memory_subdir}'",
+                    state="done",
+                )
+            except Exception as e:
+                PrintStyle.error(f"Knowledge import failed: {e}")
+                log_item.update(
+                    type="error",
+                    heading=f"Knowledge import into '/{memory_subdir}' failed",
+                    content=str(e),
+                    state="error",
+                )
+            finally:
+                agent.context.log.set_initial_progress()
+
     @staticmethod
     def initialize(
         log_item: LogItem | None,
         embeddings_model: Embeddings,
         memory_subdir: str,
         in_memory=False,
+        index_config: dict[str, Any] | None = None,
     ) -> MyFaiss:
 
         PrintStyle.standard("Initializing VectorDB...")
@@ -100,8 +648,8 @@ class Memory:
         if log_item:
             log_item.stream(progress="\nInitializing VectorDB")
 
-        em_dir = files.get_abs_path(
-            "memory/embeddings"
+        em_file = files.get_abs_path(
+            "memory/embeddings.db"
         )  # just caching, no need to parameterize
         db_dir = Memory._abs_db_dir(memory_subdir)
 
@@ -111,30 +659,36 @@ class Memory:
         if in_memory:
             store = InMemoryByteStore()
         else:
-            os.makedirs(em_dir, exist_ok=True)
-            store = LocalFileStore(em_dir)
+            # packed single-file cache, imports the old one-file-per-vector directory once
+            store = embedding_store.open_store(
+                em_file, legacy_dir=files.get_abs_path("memory/embeddings")
+            )
 
         # here we setup the embeddings model with the chosen cache storage
+        namespace = getattr(
+            embeddings_model,
+            "model",
+            getattr(embeddings_model, "model_name", "default"),
+        )
         embedder = CacheBackedEmbeddings.from_bytes_store(
             embeddings_model,
             store,
-            namespace=getattr(
-                embeddings_model,
-                "model",
-                getattr(embeddings_model, "model_name", "default"),
-            ),
+            namespace=namespace,
         )
 
         # self.db = Chroma(
         #     embedding_function=self.embedder,
         #     persist_directory=db_dir)
 
+        # pickled docstore from older versions, converted to the on-disk docstore once
+        if files.exists(db_dir, "index.pkl") and not in_memory:
+            Memory._migrate_pickled_docstore(db_dir, embedder)
+
         # if db folder exists and is not empty:
-        if os.path.exists(db_dir) and files.exists(db_dir, "index.faiss"):
-            db = MyFaiss.load_local(
-                folder_path=db_dir,
-                embeddings=embedder,
-                allow_dangerous_deserialization=True,
+        if os.path.exists(db_dir) and files.exists(db_dir, memory_docstore.INDEX_FILE):
+            db = MyFaiss.load_snapshot(
+                db_dir,
+                embedder,
                 distance_strategy=DistanceStrategy.COSINE,
                 # normalize_L2=True,
                 relevance_score_fn=Memory._cosine_normalizer,
@@ -145,14 +699,60 @@ class Memory:
             db = MyFaiss(
                 embedding_function=embedder,
                 index=index,
-                docstore=InMemoryDocstore(),
+                docstore=SQLiteDocstore(
+                    ":memory:"
+                    if in_memory
+                    else os.path.join(db_dir, memory_docstore.DOCSTORE_FILE)
+                ),
                 index_to_docstore_id={},
                 distance_strategy=DistanceStrategy.COSINE,
                 # normalize_L2=True,
                 relevance_score_fn=Memory._cosine_normalizer,
             )
+
+        # query vectors are cached separately, document cache only covers stored chunks
+        db.query_cache = get_query_cache(
+            namespace, None if in_memory else open_disk_store()
+        )
+
+        # flat below the configured size, approximate index built in background above it
+        # knobs from memory/<subdir>/index.json, overridden by the agent config
+        journal = Memory._get_journal(memory_subdir)
+        config = memory_index.load_config(db_dir)
+        config.update({k: v for k, v in (index_config or {}).items() if k != "type"})  # type: ignore
+        db.tiers = memory_index.TieredIndex(db, config, lock=journal.lock)
+
+        # apply mutations journaled since the last checkpoint
+        if not in_memory:
+            replayed = journal.replay(db)
+            if replayed:
+                PrintStyle.standard(f"Replayed {replayed} memory journal entries.")
+                if log_item:
+                    log_item.stream(
+                        progress=f"\nReplayed {replayed} memory journal entries"
+                    )
+
+        db.tiers.maybe_upgrade()
         return db  # type: ignore
 
+    @staticmethod
+    def _migrate_pickled_docstore(db_dir: str, embedder: Embeddings):
+        PrintStyle.standard(f"Migrating memory docstore in {db_dir}...")
+        legacy = FAISS.load_local(
+            folder_path=db_dir,
+            embeddings=embedder,
+            allow_dangerous_deserialization=True,
+        )
+        docstore = SQLiteDocstore(os.path.join(db_dir, memory_docstore.DOCSTORE_FILE))
+        docstore.add(dict(legacy.docstore._dict))  # type: ignore
+        docstore.flush()
+        memory_docstore.save_positions(
+            os.path.join(db_dir, memory_docstore.IDS_FILE), legacy.index_to_docstore_id
+        )
+        # removed last, an interrupted migration simply runs again
+        os.remove(os.path.join(db_dir, "index.pkl"))
+        PrintStyle.standard(f"Migrated {len(legacy.index_to_docstore_id)} memories.")
+
     def __init__(
         self,
         agent: Agent,
@@ -162,6 +762,12 @@ class Memory:
         self.agent = agent
         self.db = db
         self.memory_subdir = memory_subdir
+        self.journal = Memory._get_journal(memory_subdir)
+
+    @property
+    def version(self) -> tuple[int, int]:
+        # changes whenever search results could, the loaded index or its contents
+        return (id(self.db), self.db.generation)
 
     async def preload_knowledge(
         self, log_item: LogItem | None, kn_dirs: list[str], memory_subdir: str
@@ -185,19 +791,25 @@ class Memory:
                 index = json.load(f)
 
         # preload knowledge folders
-        index = self._preload_knowledge_folders(log_item, kn_dirs, index)
+        index = await self._preload_knowledge_folders(log_item, kn_dirs, index)
 
         for file in index:
-            if index[file]["state"] in ["changed", "removed"] and index[file].get(
-                "ids", []
-            ):  # for knowledge files that have been changed or removed and have IDs
-                await self.delete_documents_by_ids(
-                    index[file]["ids"]
-                )  # remove original version
+            if index[file]["state"] == "removed" and index[file].get("ids", []):
+                await self.delete_documents_by_ids(index[file]["ids"])
             if index[file]["state"] == "changed":
-                index[file]["ids"] = await self.insert_documents(
-                    index[file]["documents"]
-                )  # insert new version
+                # only chunks whose content hash changed are deleted or embedded
+                docs = index[file]["documents"]
+                ids = knowledge_import.chunk_ids(file, docs)
+                stale = set(index[file].get("ids", [])) - set(ids)
+                if stale:
+                    await self.delete_documents_by_ids(list(stale))
+                existing = self.db.docstore.contains(ids)
+                new = [(doc, id) for doc, id in zip(docs, ids) if id not in existing]
+                if new:
+                    await self.insert_documents(
+                        [doc for doc, _ in new], ids=[id for _, id in new]
+                    )
+                index[file]["ids"] = ids
 
         # remove index where state="removed"
         index = {k: v for k, v in index.items() if v["state"] != "removed"}
@@ -211,7 +823,7 @@ class Memory:
         with open(index_path, "w") as f:
             json.dump(index, f)
 
-    def _preload_knowledge_folders(
+    async def _preload_knowledge_folders(
         self,
         log_item: LogItem | None,
         kn_dirs: list[str],
@@ -220,7 +832,7 @@ class Memory:
         # load knowledge folders, subfolders by area
         for kn_dir in kn_dirs:
             for area in Memory.Area:
-                index = knowledge_import.load_knowledge(
+                index = await knowledge_import.load_knowledge(
                     log_item,
                     files.get_abs_path("knowledge", kn_dir, area.value),
                     index,
@@ -228,7 +840,7 @@ class Memory:
                 )
 
         # load instruments descriptions
-        index = knowledge_import.load_knowledge(
+        index = await knowledge_import.load_knowledge(
             log_item,
             files.get_abs_path("instruments"),
             index,
@@ -239,22 +851,115 @@ class Memory:
         return index
 
     async def search_similarity_threshold(
-        self, query: str, limit: int, threshold: float, filter: str = ""
+        self,
+        query: str,
+        limit: int,
+        threshold: float,
+        filter: str = "",
+        search_mode: str = "vector",
+        min_coverage: float = MIN_COVERAGE,
     ):
+        # search_mode "hybrid" also ranks keyword (BM25) matches, which finds
+        # identifiers, paths and error strings that embeddings place poorly; threshold gates
+        # vector hits, min_coverage keyword hits
         comparator = Memory._get_comparator(filter) if filter else None
+        embedding = await self.embed_query(query)
 
-        #rate limiter
-        await self.agent.rate_limiter(
-            model_config=self.agent.config.embeddings_model, input=query)
+        if search_mode == "hybrid":
+            indexed = comparator is not None and comparator.indexed
+            return self.db.search_hybrid(
+                query,
+                embedding,
+                k=limit,
+                score_threshold=threshold,
+                selected=comparator.select(self.db.meta_index) if indexed else None,  # type: ignore
+                filter=None if indexed else comparator,
+                min_coverage=min_coverage,
+            )
 
-        return await self.db.asearch(
-            query,
-            search_type="similarity_score_threshold",
+        # filters on indexed fields select candidates before the vector scan
+        if comparator and comparator.indexed:
+            return self.db.search_selected(
+                embedding,
+                k=limit,
+                selected=comparator.select(self.db.meta_index),
+                score_threshold=threshold,
+            )
+
+        return self.db.search_filtered(
+            embedding,
             k=limit,
             score_threshold=threshold,
             filter=comparator,
         )
 
+    async def search_many(
+        self,
+        queries: list[str],
+        k: int,
+        filters: list[str] | None = None,
+        mmr_lambda: float = 0.5,
+        threshold: float = 0.5,
+        search_mode: str = "vector",
+        min_coverage: float = MIN_COVERAGE,
+    ) -> list[list[Document]]:
+        # several queries, each with its own filter, in one embedding call and one batch
+        # search; mmr_lambda 1 ranks by relevance only, lower values favour diverse results
+        filters = filters or [""] * len(queries)
+        if not queries:
+            return []
+        embeddings = np.array(await self.embed_queries(queries), dtype=np.float32)
+        comparators = {f: Memory._get_comparator(f) for f in set(filters) if f}
+        masks = {
+            f: c.select(self.db.meta_index) for f, c in comparators.items() if c.indexed
+        }
+        return self.db.search_many(
+            queries,
+            embeddings,
+            k=k,
+            score_threshold=threshold,
+            selections=[masks.get(f) for f in filters],
+            filters=[comparators[f] if f and f not in masks else None for f in filters],
+            mmr_lambda=mmr_lambda,
+            hybrid=search_mode == "hybrid",
+            min_coverage=min_coverage,
+        )
+
+    async def embed_queries(self, queries: list[str]) -> list[list[float]]:
+        cache = self.db.query_cache
+        embeddings = [cache.get(q) if cache else None for q in queries]
+        missing = list(dict.fromkeys(q for q, e in zip(queries, embeddings) if e is None))
+        if missing:
+            await self.agent.rate_limiter(
+                model_config=self.agent.config.embeddings_model, input="\n".join(missing)
+            )
+            # query mode like embed_query, both share the query cache and some providers
+            # embed queries and documents differently
+            vectors = await asyncio.gather(
+                *[self.db.embedding_function.aembed_query(q) for q in missing]  # type: ignore
+            )
+            found = dict(zip(missing, vectors))
+            if cache:
+                for query, embedding in found.items():
+                    cache.put(query, embedding)
+            embeddings = [e if e is not None else found[q] for q, e in zip(queries, embeddings)]
+        return embeddings  # type: ignore
+
+    async def embed_query(self, query: str) -> list[float]:
+        cache = self.db.query_cache
+        embedding = cache.get(query) if cache else None
+        if embedding is not None:
+            return embedding  # cached, no provider call to rate limit
+
+        #rate limiter
+        await self.agent.rate_limiter(
+            model_config=self.agent.config.embeddings_model, input=query)
+
+        embedding = await self.db.embedding_function.aembed_query(query)  # type: ignore
+        if cache:
+            cache.put(query, embedding)
+        return embedding
+
     async def delete_documents_by_query(
         self, query: str, threshold: float, filter: str = ""
     ):
@@ -278,7 +983,7 @@ class Memory:
                 # fnd = self.db.get(where={"id": {"$in": document_ids}})
                 # if fnd["ids"]: self.db.delete(ids=fnd["ids"])
                 # tot += len(fnd["ids"])
-                self.db.delete(ids=document_ids)
+                self._delete_ids(document_ids)
                 tot += len(document_ids)
 
             # If fewer than K document IDs, break the loop
@@ -286,7 +991,7 @@ class Memory:
                 break
 
         if tot:
-            self._save_db()  # persist
+            self._schedule_checkpoint()  # persist
         return removed
 
     async def delete_documents_by_ids(self, ids: list[str]):
@@ -294,10 +999,10 @@ class Memory:
         rem_docs = self.db.get_by_ids(ids)  # existing docs to remove (prevents error)
         if rem_docs:
             rem_ids = [doc.metadata["id"] for doc in rem_docs]  # ids to remove
-            await self.db.adelete(ids=rem_ids)
+            self._delete_ids(rem_ids)
 
         if rem_docs:
-            self._save_db()  # persist
+            self._schedule_checkpoint()  # persist
         return rem_docs
 
     async def insert_text(self, text, metadata: dict = {}):
@@ -305,46 +1010,150 @@ class Memory:
         ids = await self.insert_documents([doc])
         return ids[0]
 
-    async def insert_documents(self, docs: list[Document]):
+    async def insert_documents(self, docs: list[Document], ids: list[str] | None = None):
+        ids = ids or [str(uuid.uuid4()) for _ in range(len(docs))]
+
+        if ids:
+            vectors = await self._embed_documents(docs, ids)
+            with self.journal.lock:
+                self._add_embedded(docs, ids, vectors)
+            self._schedule_checkpoint()  # persist
+        return ids
+
+    async def upsert_deduplicated(
+        self, texts: list[str], area: str, threshold: float
+    ) -> tuple[list[str], list[Document]]:
+        """Insert texts into an area, replacing stored documents at least `threshold`
+        similar to any of them. Embeds once, searches once and persists once."""
+        docs = [Document(text, metadata={"area": area}) for text in texts]
         ids = [str(uuid.uuid4()) for _ in range(len(docs))]
+        if not docs:
+            return [], []
+
+        vectors = await self._embed_documents(docs, ids)
+        matrix = np.array(vectors, dtype=np.float32)
+
+        # a candidate followed by a near-identical later one is superseded by it
+        keep = list(range(len(docs)))
+        if threshold > 0 and len(docs) > 1:
+            similarity = Memory._cosine_normalizer_np(matrix @ matrix.T)
+            keep = [
+                i for i in keep if not (similarity[i, i + 1 :] >= threshold).any()
+            ]
+
+        with self.journal.lock:
+            removed: dict[str, Document] = {}
+            if threshold > 0:
+                selected = compile_filter(f"area == {area!r}").select(
+                    self.db.meta_index
+                )
+                while True:
+                    hits = self.db.search_batch(
+                        matrix[keep], DEDUP_SEARCH_LIMIT, selected, threshold
+                    )
+                    found = {
+                        doc.metadata["id"]: doc
+                        for row in hits
+                        for doc in row
+                        if doc.metadata["id"] not in removed
+                    }
+                    removed.update(found)
+                    # a full result row may hide more duplicates, search again without them
+                    if not found or all(len(row) < DEDUP_SEARCH_LIMIT for row in hits):
+                        break
+                    positions = self.db.id_positions
+                    selected[[positions[id] for id in found]] = False
+                if removed:
+                    self._delete_ids(list(removed))
+
+            kept_ids = [ids[i] for i in keep]
+            self._add_embedded(
+                [docs[i] for i in keep], kept_ids, [vectors[i] for i in keep]
+            )
+        self._schedule_checkpoint()  # persist
+        return kept_ids, list(removed.values())
+
+    async def _embed_documents(self, docs: list[Document], ids: list[str]):
         timestamp = self.get_timestamp()
+        for doc, id in zip(docs, ids):
+            doc.metadata["id"] = id  # add ids to documents metadata
+            doc.metadata["timestamp"] = timestamp  # add timestamp
+            if not doc.metadata.get("area", ""):
+                doc.metadata["area"] = Memory.Area.MAIN.value
 
-        
-        if ids:
-            for doc, id in zip(docs, ids):
-                doc.metadata["id"] = id  # add ids to documents metadata
-                doc.metadata["timestamp"] = timestamp  # add timestamp
-                if not doc.metadata.get("area", ""):
-                    doc.metadata["area"] = Memory.Area.MAIN.value
-            
-            #rate limiter
-            docs_txt = "".join(self.format_docs_plain(docs))
-            await self.agent.rate_limiter(
-                model_config=self.agent.config.embeddings_model, input=docs_txt)
+        #rate limiter
+        docs_txt = "".join(self.format_docs_plain(docs))
+        await self.agent.rate_limiter(
+            model_config=self.agent.config.embeddings_model, input=docs_txt)
 
-            self.db.add_documents(documents=docs, ids=ids)
-            self._save_db()  # persist
-        return ids
+        # embed outside of the journal lock, checkpoints may hold it for a while
+        texts = [doc.page_content for doc in docs]
+        return self.db.embedding_function.embed_documents(texts)  # type: ignore
+
+    def _add_embedded(
+        self, docs: list[Document], ids: list[str], vectors: list[list[float]]
+    ):
+        if not docs:
+            return
+        with self.journal.lock:
+            self.db.add_embeddings(
+                text_embeddings=[(doc.page_content, v) for doc, v in zip(docs, vectors)],
+                metadatas=[doc.metadata for doc in docs],
+                ids=ids,
+            )
+            self.journal.log_add(ids, vectors, docs)
+
+    def _delete_ids(self, ids: list[str]):
+        with self.journal.lock:
+            self.db.delete(ids=ids)
+            self.journal.log_delete(ids)
+
+    def _schedule_checkpoint(self):
+        self.journal.schedule_checkpoint(self._save_db)
+
+    def checkpoint(self):
+        self.journal.checkpoint(self._save_db)
 
     def _save_db(self):
-        self.db.save_local(folder_path=self._abs_db_dir(self.memory_subdir))
+        # a reloaded subdir has a new index instance, never overwrite it with a stale one
+        if Memory.index.get(self.memory_subdir) not in (None, self.db):
+            return False
+        db_dir = self._abs_db_dir(self.memory_subdir)
+        tmp_dir = os.path.join(db_dir, ".checkpoint")
+        # documents first, journal replay is keyed on the index positions saved after them
+        self.db.docstore.flush()
+        self.db.save_snapshot(tmp_dir)
+        for file in os.listdir(tmp_dir):
+            os.replace(os.path.join(tmp_dir, file), os.path.join(db_dir, file))
+        os.rmdir(tmp_dir)
+        # record which index type the snapshot holds next to index.faiss
+        if self.db.tiers:
+            self.db.tiers.config["type"] = self.db.tiers.type
+            memory_index.save_index_type(db_dir, self.db.tiers.type)
+        return True
 
     @staticmethod
-    def _get_comparator(condition: str):
-        def comparator(data: dict[str, Any]):
-            try:
-                return eval(condition, {}, data)
-            except Exception as e:
-                # PrintStyle.error(f"Error evaluating condition: {e}")
-                return False
+    def _get_journal(memory_subdir: str) -> MemoryJournal:
+        if memory_subdir not in Memory.journals:
+            Memory.journals[memory_subdir] = MemoryJournal(
+                Memory._abs_db_dir(memory_subdir)
+            )
+        return Memory.journals[memory_subdir]
 
-        return comparator
+    @staticmethod
+    def _get_comparator(condition: str):
+        # parsed once and cached by filter string, callable on metadata for the slow path
+        return compile_filter(condition)
 
     @staticmethod
     def _score_normalizer(val: float) -> float:
         res = 1 - 1 / (1 + np.exp(val))
         return res
 
+    @staticmethod
+    def _cosine_normalizer_np(val: np.ndarray) -> np.ndarray:
+        return np.clip((1 + val) / 2, 0, 1)
+
     @staticmethod
     def _cosine_normalizer(val: float) -> float:
         res = (1 + val) / 2
@@ -0,0 +1,303 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Iterator, Sequence
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+DOCSTORE_FILE = "docstore.db"
+IDS_FILE = "index_ids.npy"
+INDEX_FILE = "index.faiss"
+BATCH_SIZE = 500  # keeps IN (...) below sqlite's bound variable limit
+TOMBSTONE = ""  # id at a position deleted from an approximate index, until it is rebuilt
+
+# in-file codes are mapped, not copied, where faiss supports it (1.10+)
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Documents of a memory subdir in SQLite, loaded only for the hits a search returns.
+    Changes since the last checkpoint are held in memory and written by flush(), so the
+    table always matches the snapshot and the journal replays on top of it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, page_content TEXT NOT NULL,"
+            " metadata TEXT NOT NULL) WITHOUT ROWID"
+        )
+        # exact float32 vectors, only kept while the index holds quantized codes
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            " WITHOUT ROWID"
+        )
+        self._conn.commit()
+        self._added: dict[str, Document] = {}
+        self._added_vectors: dict[str, bytes] = {}
+        self._deleted: set[str] = set()
+        self._dict = DocumentView(self)  # read only mapping, like InMemoryDocstore._dict
+
+    def add(self, texts: dict[str, Document]) -> None:
+        with self._lock:
+            for id, doc in texts.items():
+                self._added[id] = doc
+                self._deleted.discard(id)
+
+    def delete(self, ids: list) -> None:
+        # unknown ids are ignored, journal replay may delete what a checkpoint already did
+        with self._lock:
+            for id in ids:
+                self._added.pop(id, None)
+                self._added_vectors.pop(id, None)
+                self._deleted.add(id)
+
+    def add_vectors(self, ids: Sequence[str], vectors: np.ndarray):
+        with self._lock:
+            for id, vector in zip(ids, np.asarray(vectors, dtype=np.float32)):
+                self._added_vectors[id] = vector.tobytes()
+
+    def vectors(self, ids: Sequence[str]) -> list[np.ndarray | None]:
+        found: dict[str, bytes] = {}
+        with self._lock:
+            missing = []
+            for id in ids:
+                if id in self._added_vectors:
+                    found[id] = self._added_vectors[id]
+                elif id not in self._deleted:
+                    missing.append(id)
+            for batch in _batches(missing):
+                rows = self._conn.execute(
+                    f"SELECT id, vector FROM vectors WHERE id IN ({_params(batch)})", batch
+                )
+                found.update(rows)
+        return [
+            np.frombuffer(found[id], dtype=np.float32) if id in found else None
+            for id in ids
+        ]
+
+    def search(self, search: str) -> Document | str:
+        doc = self.mget([search])[0]
+        return doc if doc is not None else f"ID {search} not found."
+
+    def mget(self, ids: Sequence[str]) -> list[Document | None]:
+        found: dict[str, Document] = {}
+        with self._lock:
+            missing = []
+            for id in ids:
+                if id in self._added:
+                    found[id] = self._added[id]
+                elif id not in self._deleted:
+                    missing.append(id)
+            for batch in _batches(missing):
+                rows = self._conn.execute(
+                    f"SELECT id, page_content, metadata FROM docs WHERE id IN ({_params(batch)})",
+                    batch,
+                )
+                for id, page_content, metadata in rows:
+                    found[id] = Document(page_content, metadata=json.loads(metadata))
+        return [found.get(id) for id in ids]
+
+    def contains(self, ids: Sequence[str]) -> set[str]:
+        with self._lock:
+            result = {id for id in ids if id in self._added}
+            stored = [id for id in ids if id not in result and id not in self._deleted]
+            return result | self._stored(stored)
+
+    def field_values(self, ids: Sequence[str], fields: Sequence[str]) -> list[dict[str, Any]]:
+        # only the requested metadata fields, extracted by sqlite without parsing whole documents
+        columns = ", ".join(
+            f"json_type(metadata, '$.{f}'), json_extract(metadata, '$.{f}')" for f in fields
+        )
+        found: dict[str, dict[str, Any]] = {}
+        with self._lock:
+            stored = [id for id in ids if id not in self._added and id not in self._deleted]
+            for batch in _batches(stored):
+                rows = self._conn.execute(
+                    f"SELECT id, {columns} FROM docs WHERE id IN ({_params(batch)})", batch
+                )
+                for row in rows:
+                    values = {}
+                    for i, field in enumerate(fields):
+                        type, value = row[1 + 2 * i], row[2 + 2 * i]
+                        if type is None:
+                            continue  # field missing
+                        if type in ("object", "array"):
+                            value = json.loads(value)
+                        elif type in ("true", "false"):
+                            value = type == "true"
+                        values[field] = value
+                    found[row[0]] = values
+            for id in ids:
+                if id in self._added:
+                    metadata = self._added[id].metadata
+                    found[id] = {f: metadata[f] for f in fields if f in metadata}
+        return [found.get(id, {}) for id in ids]
+
+    def flush(self):
+        with self._lock, self._conn:
+            for batch in _batches(list(self._deleted)):
+                self._conn.execute(f"DELETE FROM docs WHERE id IN ({_params(batch)})", batch)
+                self._conn.execute(
+                    f"DELETE FROM vectors WHERE id IN ({_params(batch)})", batch
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO docs (id, page_content, metadata) VALUES (?, ?, ?)",
+                [
+                    (id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False, default=str))
+                    for id, doc in self._added.items()
+                ],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (id, vector) VALUES (?, ?)",
+                list(self._added_vectors.items()),
+            )
+            self._added.clear()
+            self._added_vectors.clear()
+            self._deleted.clear()
+
+    def ids(self) -> Iterator[str]:
+        with self._lock:
+            stored = [id for (id,) in self._conn.execute("SELECT id FROM docs")]
+            added = list(self._added)
+            skip = self._deleted | set(added)
+        for id in stored:
+            if id not in skip:
+                yield id
+        yield from added
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()
+            stored = self._stored(list(self._added) + list(self._deleted))
+            count += sum(1 for id in self._added if id not in stored)
+            count -= sum(1 for id in self._deleted if id in stored)
+        return count
+
+    def _stored(self, ids: list[str]) -> set[str]:
+        result: set[str] = set()
+        for batch in _batches(ids):
+            rows = self._conn.execute(
+                f"SELECT id FROM docs WHERE id IN ({_params(batch)})", batch
+            )
+            result.update(id for (id,) in rows)
+        return result
+
+
+class DocumentView(Mapping):
+    """Read only id -> Document view over a SQLiteDocstore, one query per lookup."""
+
+    def __init__(self, store: SQLiteDocstore):
+        self.store = store
+
+    def __getitem__(self, id: str) -> Document:
+        doc = self.store.mget([id])[0]
+        if doc is None:
+            raise KeyError(id)
+        return doc
+
+    def __contains__(self, id: object) -> bool:
+        return isinstance(id, str) and bool(self.store.contains([id]))
+
+    def __iter__(self) -> Iterator[str]:
+        return self.store.ids()
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+
+class PositionMap(MutableMapping):
+    """FAISS position -> document id, backed by a memory-mapped array of the snapshot's
+    ids with appended and tombstoned positions kept in a dict. Renumbering positions
+    replaces the whole mapping with a plain dict."""
+
+    def __init__(self, base: np.ndarray | None = None):
+        self.base = base if base is not None else np.zeros(0, dtype="S1")
+        self.extra: dict[int, str] = {}
+
+    def __getitem__(self, pos: int) -> str:
+        if pos in self.extra:
+            return self.extra[pos]
+        if 0 <= pos < len(self.base):
+            return self.base[pos].decode()
+        raise KeyError(pos)
+
+    def __setitem__(self, pos: int, id: str):
+        self.extra[pos] = id
+
+    def __delitem__(self, pos: int):
+        raise TypeError("positions are renumbered by replacing the mapping")
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    def __len__(self) -> int:
+        return len(self.base) + sum(1 for pos in self.extra if pos >= len(self.base))
+
+
+def deleted_positions(positions: Mapping[int, str]) -> set[int]:
+    # tombstones of approximate indexes, one vectorized scan of the mapped ids
+    if not isinstance(positions, PositionMap):
+        return {pos for pos, id in positions.items() if id == TOMBSTONE}
+    deleted = set(np.flatnonzero(positions.base == TOMBSTONE.encode()).tolist())
+    for pos, id in positions.extra.items():
+        if id == TOMBSTONE:
+            deleted.add(pos)
+        else:
+            deleted.discard(pos)
+    return deleted
+
+
+def load_positions(path: str) -> PositionMap:
+    if not os.path.exists(path):
+        return PositionMap()
+    return PositionMap(np.load(path, mmap_mode="r"))
+
+
+def save_positions(path: str, positions: Mapping[int, str]):
+    if isinstance(positions, PositionMap) and not any(
+        pos < len(positions.base) for pos in positions.extra
+    ):
+        # append-only since load, reuse the mapped array as is
+        extra = [positions.extra[pos] for pos in sorted(positions.extra)]
+        ids = _encode(extra)
+        width = max(positions.base.dtype.itemsize, ids.dtype.itemsize)
+        array = np.concatenate([positions.base.astype(f"S{width}"), ids.astype(f"S{width}")])
+    else:
+        array = _encode([positions[i] for i in range(len(positions))])
+    with open(path, "wb") as f:
+        np.save(f, array)
+
+
+def read_index(path: str) -> faiss.Index:
+    return faiss.read_index(path, MMAP_FLAGS)
+
+
+def own_index(index: faiss.Index) -> faiss.Index:
+    # mapped codes are read only, faiss aborts on writes, so copy into process memory
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def _encode(ids: list[str]) -> np.ndarray:
+    if not ids:
+        return np.zeros(0, dtype="S1")
+    return np.array([id.encode() for id in ids], dtype=bytes)
+
+
+def _batches(items: list[str]) -> Iterator[list[str]]:
+    for i in range(0, len(items), BATCH_SIZE):
+        yield items[i : i + BATCH_SIZE]
+
+
+def _params(batch: list[str]) -> str:
+    return ",".join("?" * len(batch))
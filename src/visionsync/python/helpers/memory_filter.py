@@ -0,0 +1,196 @@
+import ast
+from functools import lru_cache
+from typing import Any, Callable
+
+import numpy as np
+
+# metadata fields kept in per-value bitsets, filters using only these skip the python eval
+INDEXED_FIELDS = ("area",)
+
+_EMPTY = np.zeros(0, dtype=bool)
+
+
+class MetadataIndex:
+    """Per-value boolean masks over FAISS positions for the indexed metadata fields.
+    Positions follow the vector store's index_to_docstore_id, so deletes compact the
+    masks exactly like FAISS compacts its ids."""
+
+    def __init__(self, fields: tuple[str, ...] = INDEXED_FIELDS):
+        self.fields = fields
+        self.size = 0
+        self._capacity = 0
+        self._bitsets: dict[str, dict[Any, np.ndarray]] = {f: {} for f in fields}
+        self._present: dict[str, np.ndarray] = {}
+
+    def add(self, metadatas: list[dict[str, Any]]):
+        start = self.size
+        self._reserve(start + len(metadatas))
+        for offset, metadata in enumerate(metadatas):
+            for field in self.fields:
+                if field not in metadata:
+                    continue
+                self._present[field][start + offset] = True
+                value = metadata[field]
+                try:
+                    bits = self._bitsets[field].get(value)
+                except TypeError:
+                    continue  # unhashable values can never equal a filter constant
+                if bits is None:
+                    bits = self._bitsets[field][value] = np.zeros(
+                        self._capacity, dtype=bool
+                    )
+                bits[start + offset] = True
+        self.size = start + len(metadatas)
+
+    def remove(self, positions: list[int]):
+        if not positions:
+            return
+        keep = np.ones(self.size, dtype=bool)
+        keep[positions] = False
+        for field in self.fields:
+            self._present[field] = _compact(self._present[field], keep, self._capacity)
+            values = self._bitsets[field]
+            for value in list(values):
+                values[value] = _compact(values[value], keep, self._capacity)
+                if not values[value].any():
+                    del values[value]
+        self.size = int(keep.sum())
+
+    def mask(self, field: str, value: Any) -> np.ndarray:
+        try:
+            bits = self._bitsets[field].get(value)
+        except TypeError:
+            bits = None
+        if bits is None:
+            return np.zeros(self.size, dtype=bool)
+        return bits[: self.size]
+
+    def present(self, field: str) -> np.ndarray:
+        return self._present[field][: self.size]
+
+    def _reserve(self, size: int):
+        if size <= self._capacity:
+            return
+        capacity = max(size, self._capacity * 2, 64)
+        for field in self.fields:
+            self._present[field] = _grow(self._present.get(field, _EMPTY), capacity)
+            values = self._bitsets[field]
+            for value in values:
+                values[value] = _grow(values[value], capacity)
+        self._capacity = capacity
+
+
+class CompiledFilter:
+    def __init__(self, condition: str):
+        self.condition = condition
+        self.fields: set[str] = set()
+        try:
+            self.code = compile(condition, "<memory filter>", "eval")
+            self._plan = self._plan_node(ast.parse(condition, mode="eval").body)
+        except SyntaxError:
+            self.code = None  # invalid filters match nothing, like a failing eval
+            self._plan = None
+
+    @property
+    def indexed(self) -> bool:
+        return self._plan is not None
+
+    def __call__(self, data: dict[str, Any]) -> bool:
+        # slow path, used by vector stores that take a per-document callable
+        if self.code is None:
+            return False
+        try:
+            return bool(eval(self.code, {}, data))
+        except Exception:
+            return False
+
+    def select(self, index: MetadataIndex) -> np.ndarray:
+        if self._plan is None:
+            raise ValueError(f"Filter '{self.condition}' is not indexable")
+        result = self._plan(index)
+        # documents missing a referenced field would fail eval, so they never match
+        for field in self.fields:
+            result = result & index.present(field)
+        return result
+
+    def _plan_node(self, node: ast.AST) -> Callable[[MetadataIndex], np.ndarray] | None:
+        if isinstance(node, ast.BoolOp):
+            parts = [self._plan_node(v) for v in node.values]
+            if any(p is None for p in parts):
+                return None
+            if isinstance(node.op, ast.And):
+                return lambda idx: _reduce(np.logical_and, parts, idx)  # type: ignore
+            return lambda idx: _reduce(np.logical_or, parts, idx)  # type: ignore
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            inner = self._plan_node(node.operand)
+            if inner is None:
+                return None
+            return lambda idx: ~inner(idx)
+
+        if isinstance(node, ast.Compare) and len(node.ops) == 1:
+            left, op, right = node.left, node.ops[0], node.comparators[0]
+            if isinstance(op, (ast.Eq, ast.NotEq)) and isinstance(right, ast.Name):
+                left, right = right, left  # 'main' == area
+            if not (isinstance(left, ast.Name) and left.id in INDEXED_FIELDS):
+                return None
+            field = left.id
+            try:
+                constant = ast.literal_eval(right)
+            except ValueError:
+                return None
+            self.fields.add(field)
+
+            if isinstance(op, (ast.Eq, ast.NotEq)):
+                if _unhashable(constant):
+                    return None
+                eq = lambda idx: idx.mask(field, constant)
+                return eq if isinstance(op, ast.Eq) else (lambda idx: ~eq(idx))
+
+            if isinstance(op, (ast.In, ast.NotIn)) and isinstance(
+                constant, (list, tuple, set, frozenset)
+            ):
+                if any(_unhashable(c) for c in constant):
+                    return None
+                values = list(constant)
+                member = lambda idx: _reduce(
+                    np.logical_or, [lambda i, v=v: i.mask(field, v) for v in values], idx
+                )
+                return member if isinstance(op, ast.In) else (lambda idx: ~member(idx))
+
+        return None
+
+
+@lru_cache(maxsize=256)
+def compile_filter(condition: str) -> CompiledFilter:
+    return CompiledFilter(condition)
+
+
+def _reduce(fn, parts: list[Callable[[MetadataIndex], np.ndarray]], idx: MetadataIndex):
+    if not parts:
+        return np.zeros(idx.size, dtype=bool)
+    result = parts[0](idx)
+    for part in parts[1:]:
+        result = fn(result, part(idx))
+    return result
+
+
+def _unhashable(value: Any) -> bool:
+    try:
+        hash(value)
+        return False
+    except TypeError:
+        return True
+
+
+def _grow(bits: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.zeros(capacity, dtype=bool)
+    grown[: bits.size] = bits
+    return grown
+
+
+def _compact(bits: np.ndarray, keep: np.ndarray, capacity: int) -> np.ndarray:
+    compacted = np.zeros(capacity, dtype=bool)
+    kept = bits[: keep.size][keep]
+    compacted[: kept.size] = kept
+    return compacted
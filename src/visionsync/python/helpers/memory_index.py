@@ -0,0 +1,293 @@
+import json
+import math
+import os
+import threading
+from typing import Literal, TypedDict
+
+import faiss
+import numpy as np
+
+from python.helpers.print_style import PrintStyle
+
+CONFIG_FILE = "index.json"
+
+IndexType = Literal["flat", "hnsw", "ivf"]
+Storage = Literal["float", "sq8", "pq"]
+
+PQ_BITS = 8
+PQ_MIN_TRAIN = 1 << PQ_BITS  # k-means needs at least one point per centroid
+
+
+class IndexConfig(TypedDict):
+    type: IndexType  # type of the persisted index.faiss, maintained by the memory
+    tier: IndexType  # index to switch to once the collection outgrows flat_max
+    flat_max: int  # brute-force scan up to this many vectors
+    hnsw_m: int  # graph degree, higher = better recall, more RAM
+    hnsw_ef_construction: int
+    hnsw_ef_search: int  # higher = better recall, slower search
+    ivf_nlist: int  # 0 = 4 * sqrt(n)
+    ivf_nprobe: int  # higher = better recall, slower search
+    storage: Storage  # float32 vectors, 8-bit scalar or product quantized codes
+    quantize_min: int  # quantizers are trained once the collection has this many vectors
+    pq_m: int  # bytes per vector for pq, 0 = dim / 8; flat indexes use sq8 instead of pq
+    rerank: bool  # re-score quantized candidates with the exact vectors kept in the docstore
+    rerank_factor: int  # candidates fetched per requested result when re-ranking
+    compact_ratio: float  # rebuild once this share of an hnsw or ivf index's positions is deleted
+
+
+DEFAULT_CONFIG: IndexConfig = {
+    "type": "flat",
+    "tier": "hnsw",
+    "flat_max": 20000,
+    "hnsw_m": 32,
+    "hnsw_ef_construction": 80,
+    "hnsw_ef_search": 64,
+    "ivf_nlist": 0,
+    "ivf_nprobe": 16,
+    "storage": "float",
+    "quantize_min": 10000,
+    "pq_m": 0,
+    "rerank": True,
+    "rerank_factor": 4,
+    "compact_ratio": 0.2,
+}
+
+
+def load_config(db_dir: str) -> IndexConfig:
+    # knobs can be edited per memory_subdir in memory/<subdir>/index.json
+    config = IndexConfig(**DEFAULT_CONFIG)
+    config.update(_read_config(db_dir))  # type: ignore
+    return config
+
+
+def save_config(db_dir: str, config: IndexConfig):
+    with open(os.path.join(db_dir, CONFIG_FILE), "w") as f:
+        json.dump(config, f, indent=2)
+
+
+def save_index_type(db_dir: str, type: IndexType):
+    # only the maintained field next to the keys the user set, defaults stay out of the
+    # file so that changing them later applies, agent config overrides stay out too
+    config = _read_config(db_dir)
+    config["type"] = type
+    save_config(db_dir, config)  # type: ignore
+
+
+def _read_config(db_dir: str) -> dict:
+    path = os.path.join(db_dir, CONFIG_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def get_index_type(index: faiss.Index) -> IndexType:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def get_storage(index: faiss.Index) -> Storage:
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "sq8"
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "float"
+
+
+def apply_search_knobs(index: faiss.Index, config: IndexConfig):
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config["hnsw_ef_search"]
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = config["ivf_nprobe"]
+
+
+def search_params(
+    index: faiss.Index, sel: faiss.IDSelector | None, config: IndexConfig
+) -> faiss.SearchParameters:
+    # approximate indexes reject generic parameters, they need their own subclass
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=config["hnsw_ef_search"])
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=config["ivf_nprobe"])
+    return faiss.SearchParameters(sel=sel)
+
+
+def ensure_direct_map(index: faiss.Index):
+    # ivf ids are positions, a hashtable maps them to list entries and keeps working
+    # once deletes leave gaps, the array map only supports sequential ids
+    if isinstance(index, faiss.IndexIVF) and index.direct_map.type != faiss.DirectMap.Hashtable:
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+
+def add_vectors(index: faiss.Index, vectors: np.ndarray, start: int):
+    # vectors for positions start.., ivf gets them as explicit ids, deleted ones stay reserved
+    if isinstance(index, faiss.IndexIVF):
+        ensure_direct_map(index)
+        index.add_with_ids(vectors, np.arange(start, start + len(vectors), dtype=np.int64))
+    else:
+        index.add(vectors)
+
+
+def remove_vectors(index: faiss.Index, positions: list[int]) -> bool:
+    # True when the index renumbered the remaining vectors, False when positions are kept
+    if isinstance(index, faiss.IndexHNSW):
+        return False  # the graph cannot drop nodes, searches exclude them until a rebuild
+    ids = np.array(positions, dtype=np.int64)
+    if isinstance(index, faiss.IndexIVF):
+        ensure_direct_map(index)
+        index.remove_ids(ids)  # the list entries go, the other ids stay as they are
+        return False
+    index.remove_ids(ids)
+    return True
+
+
+def flat_storage(storage: Storage) -> Storage:
+    # flat pq cannot search with an id selector, filtered recall needs it
+    return "sq8" if storage == "pq" else storage
+
+
+def build_index(
+    vectors: np.ndarray,
+    type: IndexType,
+    config: IndexConfig,
+    storage: Storage = "float",
+) -> faiss.Index:
+    dim = vectors.shape[1]
+    ip = faiss.METRIC_INNER_PRODUCT
+    sq8 = faiss.ScalarQuantizer.QT_8bit
+    pq_m = _pq_m(dim, config)
+    if type == "hnsw":
+        m = config["hnsw_m"]
+        if storage == "sq8":
+            index = faiss.IndexHNSWSQ(dim, sq8, m, ip)
+        elif storage == "pq":
+            index = faiss.IndexHNSWPQ(dim, pq_m, m, PQ_BITS, ip)
+        else:
+            index = faiss.IndexHNSWFlat(dim, m, ip)
+        index.hnsw.efConstruction = config["hnsw_ef_construction"]
+    elif type == "ivf":
+        nlist = config["ivf_nlist"] or max(1, int(4 * math.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        quantizer = faiss.IndexFlatIP(dim)
+        if storage == "sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq8, ip)
+        elif storage == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, PQ_BITS, ip)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, ip)
+    elif flat_storage(storage) == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, sq8, ip)
+    else:
+        index = faiss.IndexFlatIP(dim)
+    if not index.is_trained:
+        index.train(vectors)
+    if len(vectors):
+        add_vectors(index, vectors, 0)
+    ensure_direct_map(index)
+    apply_search_knobs(index, config)
+    return index
+
+
+def _pq_m(dim: int, config: IndexConfig) -> int:
+    # sub-quantizers must divide the dimension
+    m = config["pq_m"] or max(1, dim // 8)
+    while dim % m:
+        m -= 1
+    return m
+
+
+class TieredIndex:
+    """Keeps a flat index for small collections and builds the configured approximate
+    and quantized index in a background thread once flat_max or quantize_min is exceeded.
+    Deletes apply in place: flat indexes remove and renumber, ivf removes and leaves the
+    position unused, hnsw keeps the node as a tombstone that searches exclude. Once
+    compact_ratio of the positions are tombstones a rebuild drops them. Rebuilds read
+    exact vectors through db.exact_vectors, quantized codes are never re-quantized."""
+
+    def __init__(self, db, config: IndexConfig, lock: threading.RLock):
+        self.db = db
+        self.config = config
+        self.lock = lock
+        self._building = False
+        apply_search_knobs(db.index, config)
+
+    @property
+    def type(self) -> IndexType:
+        return get_index_type(self.db.index)
+
+    @property
+    def storage(self) -> Storage:
+        return get_storage(self.db.index)
+
+    @property
+    def keeps_vectors(self) -> bool:
+        # exact copies are needed for re-ranking and rebuilds once codes are lossy
+        return self.config["storage"] != "float" or self.storage != "float"
+
+    def target(self, count: int) -> tuple[IndexType, Storage]:
+        type = self.config["tier"] if count > self.config["flat_max"] else "flat"
+        storage = self.config["storage"] if count >= self.config["quantize_min"] else "float"
+        if type == "flat" or count < PQ_MIN_TRAIN:
+            storage = flat_storage(storage)
+        return type, storage
+
+    def needs_rebuild(self) -> bool:
+        count = len(self.db.index_to_docstore_id)
+        deleted = len(self.db.tombstones)
+        if deleted and deleted > count * self.config["compact_ratio"]:
+            return True
+        return (self.type, self.storage) != self.target(count - deleted)
+
+    def maybe_upgrade(self):
+        with self.lock:
+            if self._building or not self.needs_rebuild():
+                return
+            self._building = True
+        threading.Thread(target=self._build, daemon=True).start()
+
+    def _build(self):
+        try:
+            with self.lock:
+                layout = self.db.layout
+                index = self.db.index
+                count = len(self.db.index_to_docstore_id)
+                deleted = set(self.db.tombstones)
+                live = [pos for pos in range(count) if pos not in deleted]
+                type, storage = self.target(len(live))
+                vectors = self.db.exact_vectors(live)
+                if storage != "float" and self.storage == "float":
+                    self.db.keep_vectors(live, vectors)  # last chance to read them exactly
+
+            # the expensive part runs without the lock, searches and inserts continue
+            PrintStyle.standard(
+                f"Building {type} {storage} memory index for {len(live)} vectors..."
+            )
+            new_index = build_index(vectors, type, self.config, storage)
+
+            with self.lock:
+                # flat deletes renumbered positions meanwhile, the build is stale
+                swapped = layout == self.db.layout and self.db.index is index
+                if swapped:
+                    # catch up with vectors inserted during the build, then swap
+                    added = list(range(count, len(self.db.index_to_docstore_id)))
+                    if added:
+                        add_vectors(new_index, self.db.exact_vectors(added), len(live))
+                    self.db.index = new_index
+                    # positions the build left out are renumbered away, deletes made
+                    # during the build are applied to the new index
+                    self.db.compact(deleted)
+                    self.db.remove_positions(sorted(self.db.tombstones))
+        except Exception as e:
+            PrintStyle.error(f"Building memory index failed: {e}")
+            self._building = False
+            return
+
+        self._building = False
+        if swapped:
+            PrintStyle.standard(f"Memory index switched to {type} {storage}.")
+        self.maybe_upgrade()
@@ -0,0 +1,135 @@
+import base64
+import json
+import os
+import threading
+from typing import Any, Callable, Iterator
+
+import numpy as np
+from langchain_core.documents import Document
+
+from python.helpers.print_style import PrintStyle
+
+JOURNAL_FILE = "journal.jsonl"
+CHECKPOINT_DELAY = 30  # seconds of inactivity before the journal is compacted
+CHECKPOINT_MAX_OPS = 500  # compact sooner when this many mutations are pending
+
+
+class MemoryJournal:
+    """Append-only log of memory mutations (adds with vectors, deletes) stored next to
+    the FAISS snapshot. Mutations are appended cheaply per operation, the full snapshot
+    is rewritten by a debounced checkpoint, and the journal is replayed on load."""
+
+    def __init__(self, db_dir: str):
+        self.path = os.path.join(db_dir, JOURNAL_FILE)
+        self.lock = threading.RLock()
+        self.pending = 0
+        self._timer: threading.Timer | None = None
+
+    def log_add(self, ids: list[str], vectors: list[list[float]], docs: list[Document]):
+        self._append(
+            {
+                "op": "add",
+                "ids": ids,
+                "vectors": [_encode_vector(v) for v in vectors],
+                "docs": [
+                    {"page_content": d.page_content, "metadata": d.metadata}
+                    for d in docs
+                ],
+            }
+        )
+
+    def log_delete(self, ids: list[str]):
+        self._append({"op": "delete", "ids": ids})
+
+    def _append(self, record: dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending += 1
+
+    def read(self) -> Iterator[dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # torn write from a crash, everything before it is still valid
+                    PrintStyle.error(f"Skipping corrupted memory journal entry in {self.path}")
+
+    def replay(self, db) -> int:
+        # replay is idempotent - adds of indexed ids and deletes of missing ids are skipped,
+        # so a crash between snapshot and journal truncation does not duplicate documents
+        count = 0
+        with self.lock:
+            existing: set[str] | None = None
+            for record in self.read():
+                if existing is None:
+                    # the index positions are authoritative, the docstore may be a checkpoint ahead
+                    existing = set(db.index_to_docstore_id.values())
+                if record["op"] == "add":
+                    items = [
+                        (id, _decode_vector(vec), doc)
+                        for id, vec, doc in zip(
+                            record["ids"], record["vectors"], record["docs"]
+                        )
+                        if id not in existing
+                    ]
+                    if items:
+                        existing.update(id for id, _, _ in items)
+                        db.add_embeddings(
+                            text_embeddings=[
+                                (doc["page_content"], vec) for _, vec, doc in items
+                            ],
+                            metadatas=[doc["metadata"] for _, _, doc in items],
+                            ids=[id for id, _, _ in items],
+                        )
+                elif record["op"] == "delete":
+                    ids = [id for id in record["ids"] if id in existing]
+                    if ids:
+                        existing.difference_update(ids)
+                        db.delete(ids=ids)
+                count += 1
+            self.pending = count
+        return count
+
+    def schedule_checkpoint(self, save: Callable[[], bool]):
+        # debounce: every mutation pushes the checkpoint further out, unless too many are pending
+        with self.lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if self.pending >= CHECKPOINT_MAX_OPS:
+                self.checkpoint(save)
+                return
+            self._timer = threading.Timer(CHECKPOINT_DELAY, self.checkpoint, [save])
+            self._timer.daemon = True
+            self._timer.start()
+
+    def checkpoint(self, save: Callable[[], bool]):
+        with self.lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self.pending:
+                return
+            if not save():
+                return
+            # snapshot is on disk, journal content is now redundant
+            open(self.path, "w").close()
+            self.pending = 0
+
+
+def _encode_vector(vector: list[float]) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> list[float]:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).tolist()
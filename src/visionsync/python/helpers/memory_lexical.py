@@ -0,0 +1,139 @@
+import math
+import re
+from array import array
+
+import numpy as np
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # damping of reciprocal rank fusion, 60 is the usual choice
+MIN_COVERAGE = 0.5  # share of the query's idf weight a keyword hit must match in memory search
+
+_TOKEN = re.compile(r"[A-Za-z0-9_]+")
+_PARTS = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    # identifiers are kept whole and also split, so "ModuleNotFoundError" and "not found" both match
+    tokens = []
+    for word in _TOKEN.findall(text):
+        lower = word.lower()
+        tokens.append(lower)
+        parts = [p.lower() for p in _PARTS.findall(word)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class LexicalIndex:
+    """BM25 inverted index over FAISS positions. Like MetadataIndex, positions follow
+    the vector store's index_to_docstore_id and deletes compact the postings."""
+
+    def __init__(self):
+        self.size = 0
+        self.total_length = 0
+        self._lengths = array("f")
+        # term -> (positions, term frequencies), arrays append cheaply and view as numpy
+        self._postings: dict[str, tuple[array, array]] = {}
+
+    def add(self, texts: list[str]):
+        for text in texts:
+            pos = self.size
+            counts: dict[str, int] = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = (array("i"), array("f"))
+                postings[0].append(pos)
+                postings[1].append(count)
+            self._lengths.append(len(tokens))
+            self.total_length += len(tokens)
+            self.size += 1
+
+    def remove(self, positions: list[int]):
+        if not positions:
+            return
+        keep = np.ones(self.size, dtype=bool)
+        keep[positions] = False
+        renumber = np.cumsum(keep, dtype=np.int32) - 1
+        for token in list(self._postings):
+            docs, freqs = self._postings[token]
+            docs_np = np.frombuffer(docs, dtype=np.int32)
+            kept = keep[docs_np]
+            if not kept.any():
+                del self._postings[token]
+                continue
+            self._postings[token] = (
+                array("i", renumber[docs_np[kept]].tobytes()),
+                array("f", np.frombuffer(freqs, dtype=np.float32)[kept].tobytes()),
+            )
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)[keep]
+        self._lengths = array("f", lengths.tobytes())
+        self.total_length = int(lengths.sum())
+        self.size = int(keep.sum())
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        min_coverage: float = 0.0,
+        selected: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Positions of the best BM25 matches, best first. Coverage is the share of the
+        query's idf weight a document matches, documents below min_coverage are dropped."""
+        # unknown query terms count towards the total, matching none of them lowers coverage
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        terms = [t for t in query_terms if t in self._postings]
+        total_idf = sum(self._idf(t) for t in query_terms)
+        if not terms or not self.size or not total_idf:
+            return np.zeros(0, dtype=np.int64)
+
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)
+        average = self.total_length / self.size or 1.0
+        scores = np.zeros(self.size, dtype=np.float32)
+        coverage = np.zeros(self.size, dtype=np.float32)
+        for term in terms:
+            docs_buf, freqs_buf = self._postings[term]
+            docs = np.frombuffer(docs_buf, dtype=np.int32)
+            freqs = np.frombuffer(freqs_buf, dtype=np.float32)
+            idf = self._idf(term)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / average)
+            scores[docs] += idf * freqs * (BM25_K1 + 1) / (freqs + norm)
+            coverage[docs] += idf
+
+        matched = (scores > 0) & (coverage / total_idf >= min_coverage)
+        if selected is not None:
+            matched &= selected[: self.size]
+        candidates = np.flatnonzero(matched)
+        if candidates.size > k:
+            top = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        return candidates[np.argsort(-scores[candidates], kind="stable")].astype(np.int64)
+
+    def _idf(self, term: str) -> float:
+        postings = self._postings.get(term)
+        df = len(postings[0]) if postings else 0
+        return math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+
+
+def reciprocal_rank_fusion(rankings: list[np.ndarray], k: int) -> np.ndarray:
+    positions, _ = fused_scores(rankings)
+    return positions[:k]
+
+
+def fused_scores(rankings: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    # one pass over all rankings: each position scores 1 / (RRF_K + rank) per list it is in
+    rankings = [r for r in rankings if r.size]
+    if not rankings:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    positions = np.concatenate(rankings)
+    weights = np.concatenate(
+        [1.0 / (RRF_K + np.arange(1, r.size + 1, dtype=np.float64)) for r in rankings]
+    )
+    unique, inverse = np.unique(positions, return_inverse=True)
+    fused = np.bincount(inverse, weights=weights)
+    order = np.argsort(-fused, kind="stable")
+    return unique[order], fused[order]
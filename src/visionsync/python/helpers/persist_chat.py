@@ -1,22 +1,31 @@
-from collections import OrderedDict
 from typing import Any
+import os
+import threading
 import uuid
 from agent import Agent, AgentConfig, AgentContext, HumanMessage, AIMessage
 from python.helpers import files, history
 import json
 from initialize import initialize
 
+from python.helpers.chat_journal import JOURNAL_SUFFIX, ChatJournal
 from python.helpers.log import Log, LogItem
 
 CHATS_FOLDER = "tmp/chats"
 LOG_SIZE = 1000
 
+_journals: dict[str, ChatJournal] = {}
+_journals_lock = threading.Lock()
+
 
 def save_tmp_chat(context: AgentContext):
-    relative_path = _get_file_path(context.id)
-    data = _serialize_context(context)
-    js = _safe_json_serialize(data, ensure_ascii=False)
-    files.write_file(relative_path, js)
+    # only what changed since the last save is appended, the full chat is written on compaction
+    journal = _get_journal(context.id)
+    with journal.lock:
+        records = journal.diff(context, _serialize_agent_data)
+        if records is None or journal.needs_compaction():
+            _save_snapshot(context, journal)
+        elif records:
+            journal.append(records, lambda r: _safe_json_serialize(r, ensure_ascii=False))
 
 
 def load_tmp_chats():
@@ -27,6 +36,21 @@ def load_tmp_chats():
         js = files.read_file(path)
         data = json.loads(js)
         ctx = _deserialize_context(data)
+        journal = ChatJournal(_get_journal_path(ctx.id))
+        journal.seq = data.get("journal_seq", 0)
+        records = list(journal.read(after=journal.seq))
+        if records:
+            _replay(ctx, data, records)
+        with _journals_lock:
+            _journals[ctx.id] = journal
+        logs = data.get("log", {}).get("logs", [])
+        with journal.lock:
+            if records or any(item.get("no", i) != i for i, item in enumerate(logs)):
+                # replayed or renumbered log items, later records must follow the new numbers
+                _save_snapshot(ctx, journal)
+            else:
+                journal.compacted(len(js.encode("utf-8")))
+                journal.capture(ctx, _serialize_agent_data)
         ctxids.append(ctx.id)
     return ctxids
 
@@ -50,12 +74,75 @@ def export_json_chat(context: AgentContext):
 
 def remove_chat(ctxid):
     files.delete_file(_get_file_path(ctxid))
+    with _journals_lock:
+        journal = _journals.pop(ctxid, None)
+    (journal or ChatJournal(_get_journal_path(ctxid))).remove()
 
 
 def _get_file_path(ctxid: str):
     return f"{CHATS_FOLDER}/{ctxid}.json"
 
 
+def _get_journal_path(ctxid: str):
+    return files.get_abs_path(CHATS_FOLDER, f"{ctxid}{JOURNAL_SUFFIX}")
+
+
+def _get_journal(ctxid: str) -> ChatJournal:
+    with _journals_lock:
+        journal = _journals.get(ctxid)
+        if journal is None:
+            journal = _journals[ctxid] = ChatJournal(_get_journal_path(ctxid))
+        return journal
+
+
+def _save_snapshot(context: AgentContext, journal: ChatJournal):
+    data = _serialize_context(context)
+    data["journal_seq"] = journal.seq
+    js = _safe_json_serialize(data, ensure_ascii=False)
+    # written aside and renamed, a crash leaves the previous snapshot and its journal intact
+    path = files.get_abs_path(_get_file_path(context.id))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(js)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    journal.compacted(len(js.encode("utf-8")))
+    journal.capture(context, _serialize_agent_data)
+
+
+def _replay(context: AgentContext, data: dict[str, Any], records: list[dict[str, Any]]):
+    agents = {}
+    agent = context.agent0
+    while agent:
+        agents[agent.number] = agent
+        agent = agent.data.get(Agent.DATA_NAME_SUBORDINATE, None)
+    log = context.log
+    # journaled log items carry the numbers of the process that wrote them
+    positions = {
+        item.get("no", i): i for i, item in enumerate(data.get("log", {}).get("logs", []))
+    }
+    for record in records:
+        op = record["op"]
+        if op == "messages":
+            agents[record["agent"]].history.replay_messages(record["topics"])
+        elif op == "data":
+            agent = agents[record["agent"]]
+            links = {k: v for k, v in agent.data.items() if k.startswith("_")}
+            agent.data = {**record["data"], **links}
+        elif op == "log":
+            for item_data in record["items"]:
+                position = positions.get(item_data["no"])
+                if position is None:
+                    position = positions[item_data["no"]] = len(log.logs)
+                    log.logs.append(_deserialize_log_item(log, position, item_data))
+                    log.updates.append(position)
+                else:
+                    log.logs[position] = _deserialize_log_item(log, position, item_data)
+            number = record.get("streaming_agent", 0)
+            context.streaming_agent = agents.get(number, context.streaming_agent)
+
+
 def _serialize_context(context: AgentContext):
     # serialize agents
     agents = []
@@ -75,7 +162,7 @@ def _serialize_context(context: AgentContext):
 
 
 def _serialize_agent(agent: Agent):
-    data = {k: v for k, v in agent.data.items() if not k.startswith("_")}
+    data = _persisted_data(agent)
 
     history = agent.history.serialize()
 
@@ -86,6 +173,14 @@ def _serialize_agent(agent: Agent):
     }
 
 
+def _persisted_data(agent: Agent) -> dict[str, Any]:
+    return {k: v for k, v in agent.data.items() if not k.startswith("_")}
+
+
+def _serialize_agent_data(agent: Agent) -> str:
+    return _safe_json_serialize(_persisted_data(agent), ensure_ascii=False)
+
+
 def _serialize_log(log: Log):
     return {
         "guid": log.guid,
@@ -171,23 +266,25 @@ def _deserialize_log(data: dict[str, Any]) -> "Log":
     # Deserialize the list of LogItem objects
     i = 0
     for item_data in data.get("logs", []):
-        log.logs.append(
-            LogItem(
-                log=log,  # restore the log reference
-                no=i, #item_data["no"],
-                type=item_data["type"],
-                heading=item_data.get("heading", ""),
-                content=item_data.get("content", ""),
-                kvps=OrderedDict(item_data["kvps"]) if item_data["kvps"] else None,
-                temp=item_data.get("temp", False),
-            )
-        )
+        log.logs.append(_deserialize_log_item(log, i, item_data))
         log.updates.append(i)
         i += 1
 
     return log
 
 
+def _deserialize_log_item(log: Log, no: int, item_data: dict[str, Any]) -> LogItem:
+    return LogItem(
+        log=log,  # restore the log reference
+        no=no,
+        type=item_data["type"],
+        heading=item_data.get("heading", ""),
+        content=item_data.get("content", ""),
+        kvps=dict(item_data["kvps"]) if item_data["kvps"] else None,
+        temp=item_data.get("temp", False),
+    )
+
+
 def _safe_json_serialize(obj, **kwargs):
     def serializer(o):
         if isinstance(o, dict):
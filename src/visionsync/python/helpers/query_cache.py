@@ -0,0 +1,114 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.stores import ByteStore
+
+from python.helpers import embedding_store, files
+
+DEFAULT_MAX_SIZE = 2048  # query vectors kept in process per embedding model
+QUERY_CACHE_FILE = "memory/query_cache.db"
+MAX_DISK_BYTES = 32 * 1024 * 1024  # about 10k vectors of 768 dimensions, all models together
+KEY_PREFIX = "query."
+
+_caches: dict[str, "QueryCache"] = {}
+_caches_lock = threading.Lock()
+
+
+class QueryCache:
+    """Bounded LRU of query embeddings keyed by model namespace and normalised text,
+    optionally backed by a bounded byte store on disk."""
+
+    def __init__(
+        self,
+        namespace: str,
+        max_size: int = DEFAULT_MAX_SIZE,
+        store: ByteStore | None = None,
+    ):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.store = store
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._items: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> list[float] | None:
+        key = self._key(text)
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return vector
+
+        if self.store:
+            data = self.store.mget([key])[0]
+            if data is not None:
+                vector = np.frombuffer(data, dtype=np.float32).tolist()
+                self._remember(key, vector)
+                with self._lock:
+                    self.disk_hits += 1
+                return vector
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text: str, vector: list[float]):
+        key = self._key(text)
+        self._remember(key, vector)
+        if self.store:
+            self.store.mset([(key, np.asarray(vector, dtype=np.float32).tobytes())])
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._items),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+            }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        total = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        return f"{stats['hit_rate']:.0%} of {total}, {stats['disk_hits']} from disk"
+
+    def _remember(self, key: str, vector: list[float]):
+        with self._lock:
+            self._items[key] = vector
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def _key(self, text: str) -> str:
+        # byte store keys must be path-safe, hash namespace and text together
+        normalized = normalize(text)
+        digest = hashlib.sha1(f"{self.namespace}\0{normalized}".encode()).hexdigest()
+        return f"{KEY_PREFIX}{digest}"
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def open_disk_store() -> ByteStore:
+    # own bounded file, apart from the document embeddings cache
+    return embedding_store.open_lru_store(files.get_abs_path(QUERY_CACHE_FILE), MAX_DISK_BYTES)
+
+
+def get_query_cache(namespace: str, store: ByteStore | None = None) -> QueryCache:
+    # one cache per embedding model, shared by all memory subdirs using it
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = _caches[namespace] = QueryCache(namespace, store=store)
+        elif store and not cache.store:
+            cache.store = store
+        return cache
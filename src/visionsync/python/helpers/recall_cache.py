@@ -0,0 +1,122 @@
+import hashlib
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Hashable
+
+import numpy as np
+
+from agent import Agent
+
+if TYPE_CHECKING:
+    from python.helpers.history import History
+
+DATA_NAME = "_recall_cache"  # agent data, underscore keeps it out of the saved chat
+DEFAULT_EPSILON = 0.03  # cosine distance under which two recall queries count as the same
+
+
+@dataclass
+class RecallEntry:
+    topic: str = ""
+    query: str = ""
+    embedding: np.ndarray | None = None
+    version: Hashable = None
+    results: Any = None
+
+
+@dataclass
+class RecallStats:
+    queries_reused: int = 0
+    queries_generated: int = 0
+    results_reused: int = 0
+    results_searched: int = 0
+
+
+class RecallCache:
+    """Recall queries and hits of one agent, per recall area. The utility model is
+    skipped while the topic and the user message are unchanged, and a search is skipped
+    when the new query lands within epsilon of the last one and memory has not changed."""
+
+    def __init__(self, epsilon: float = DEFAULT_EPSILON):
+        self.epsilon = epsilon
+        self.entries: dict[str, RecallEntry] = {}
+        self.stats: dict[str, RecallStats] = {}
+
+    @staticmethod
+    def topic_key(history: "History", message: str) -> str:
+        # what the queries are about: the current topic, named by its first message
+        # and summary, and the user message; tool output appended by every iteration of
+        # the topic would change the key each time and never repeat
+        current = history.current
+        first = str(current.messages[0].no) if current.messages else ""
+        return RecallCache.topic_hash(first, current.summary, message)
+
+    @staticmethod
+    def topic_hash(*parts: str) -> str:
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(part.encode("utf-8", "replace"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get_query(self, area: str, topic: str) -> str | None:
+        entry = self.entries.get(area)
+        stats = self.stats.setdefault(area, RecallStats())
+        if entry and entry.topic == topic and entry.query:
+            stats.queries_reused += 1
+            return entry.query
+        stats.queries_generated += 1
+        return None
+
+    def put_query(self, area: str, topic: str, query: str):
+        entry = self.entries.setdefault(area, RecallEntry())
+        if entry.query != query:
+            entry.embedding = None
+        entry.topic, entry.query = topic, query
+
+    def get_results(self, area: str, embedding: list[float], version: Hashable) -> Any:
+        entry = self.entries.get(area)
+        stats = self.stats.setdefault(area, RecallStats())
+        if (
+            entry
+            and entry.embedding is not None
+            and entry.version == version
+            and self._distance(entry.embedding, embedding) <= self.epsilon
+        ):
+            stats.results_reused += 1
+            return entry.results
+        stats.results_searched += 1
+        return None
+
+    def put_results(self, area: str, embedding: list[float], version: Hashable, results: Any):
+        entry = self.entries.setdefault(area, RecallEntry())
+        entry.embedding = np.asarray(embedding, dtype=np.float32)
+        entry.version = version
+        entry.results = results
+
+    def hit_rates(self, area: str) -> dict[str, float]:
+        stats = self.stats.get(area, RecallStats())
+        queries = stats.queries_reused + stats.queries_generated
+        results = stats.results_reused + stats.results_searched
+        return {
+            "query_hit_rate": stats.queries_reused / queries if queries else 0.0,
+            "result_hit_rate": stats.results_reused / results if results else 0.0,
+        }
+
+    def summary(self, area: str) -> str:
+        rates = self.hit_rates(area)
+        return (
+            f"query {rates['query_hit_rate']:.0%}, results {rates['result_hit_rate']:.0%}"
+        )
+
+    @staticmethod
+    def _distance(a: np.ndarray, b: list[float]) -> float:
+        vector = np.asarray(b, dtype=np.float32)
+        norms = float(np.linalg.norm(a) * np.linalg.norm(vector))
+        return 1 - float(a @ vector) / norms if norms else 1.0
+
+
+def get_recall_cache(agent: Agent) -> RecallCache:
+    cache = agent.get_data(DATA_NAME)
+    if cache is None:
+        cache = RecallCache()
+        agent.set_data(DATA_NAME, cache)
+    return cache
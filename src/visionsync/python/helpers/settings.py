@@ -6,7 +6,7 @@ import subprocess
 from typing import Any, Literal, TypedDict
 
 import models
-from python.helpers import runtime, whisper, defer
+from python.helpers import runtime, whisper, defer, tokens
 from . import files, dotenv
 
 class Settings(TypedDict):
@@ -40,6 +40,7 @@ class Settings(TypedDict):
     agent_prompts_subdir: str
     agent_memory_subdir: str
     agent_knowledge_subdir: str
+    agent_memory_recall_mode: str
 
     api_keys: dict[str, str]
 
@@ -482,6 +483,20 @@ def convert_out(settings: Settings) -> SettingsOutput:
         }
     )
 
+    agent_fields.append(
+        {
+            "id": "agent_memory_recall_mode",
+            "title": "Memory recall mode",
+            "description": "How memories are recalled automatically. 'Vector' ranks by embedding similarity only. 'Hybrid' also ranks keyword (BM25) matches and prefers diverse results over near-duplicates.",
+            "type": "select",
+            "value": settings["agent_memory_recall_mode"],
+            "options": [
+                {"value": "vector", "label": "Vector"},
+                {"value": "hybrid", "label": "Hybrid"},
+            ],
+        }
+    )
+
     agent_section: SettingsSection = {
         "title": "Agent Config",
         "description": "Agent parameters.",
@@ -677,6 +692,7 @@ def set_settings(settings: Settings):
     global _settings
     _settings = normalize_settings(settings)
     _write_settings_file(_settings)
+    tokens.clear_chat_model_encoding()  # the chat model may have changed
     _apply_settings()
 
 
@@ -803,6 +819,7 @@ def get_default_settings() -> Settings:
         agent_prompts_subdir="default",
         agent_memory_subdir="default",
         agent_knowledge_subdir="custom",
+        agent_memory_recall_mode="vector",
         rfc_auto_docker=True,
         rfc_url="localhost",
         rfc_password="",
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from python.helpers import files
+
+if TYPE_CHECKING:
+    from agent import Agent
+
+SUMMARY_CACHE_FILE = "tmp/summary_cache.db"
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+EVICT_TO_RATIO = 0.9  # evict a little more than needed, not on every insert
+
+_cache: "SummaryCache | None" = None
+_cache_lock = threading.Lock()
+
+
+class SummaryCache:
+    """Utility model summaries on disk, keyed by model and the full rendered prompt, least recently used evicted first."""
+
+    def __init__(self, path: str, max_bytes: int = MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_used ON summaries (used)")
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM summaries"
+        ).fetchone()[0]
+
+    @staticmethod
+    def key(model: str, system: str, message: str) -> str:
+        # the rendered prompt covers the template, its version and the serialized messages
+        digest = hashlib.sha256()
+        for part in (model, system, message):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE summaries SET used = ? WHERE key = ?", (time.time(), key)
+            )
+            return row[0]
+
+    def put(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        with self._lock, self._conn:
+            old = self._conn.execute(
+                "SELECT size FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, value, size, used) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time()),
+            )
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICT_TO_RATIO))
+
+    def _evict(self, target: int):
+        rows = self._conn.execute(
+            "SELECT key, size FROM summaries ORDER BY used"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM summaries WHERE key = ?", evicted)
+
+
+def get_cache() -> SummaryCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SummaryCache(files.get_abs_path(SUMMARY_CACHE_FILE))
+        return _cache
+
+
+async def summarize(agent: "Agent", system: str, message: str) -> str:
+    # identical content summarized again after a reload or fork is a local lookup
+    model = agent.config.utility_model
+    cache = get_cache()
+    key = cache.key(f"{model.provider}/{model.name}", system, message)
+    summary = cache.get(key)
+    if summary is None:
+        summary = await agent.call_utility_model(system=system, message=message)
+        if summary:
+            cache.put(key, summary)
+    return summary
@@ -1,19 +1,130 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 import tiktoken
 
 APPROX_BUFFER = 1.1
+DEFAULT_ENCODING = "cl100k_base"
+PARALLEL_MIN_CHARS = 200_000  # below this a thread pool costs more than it saves
+PARALLEL_CHUNK_CHARS = 50_000
+DEFAULT_CHARS_PER_TOKEN = 4.0
+CALIBRATION_MIN_CHARS = 200  # short texts say little about the ratio
+CALIBRATION_WEIGHT = 0.05
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_chars_per_token: dict[str, float] = {}
+_calibration_lock = threading.Lock()  # exact counts come from several threads at once
+_chat_encoding: str | None = None
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING) -> tiktoken.Encoding:
+    # loading an encoding parses its whole bpe table, do it once per process
+    return tiktoken.get_encoding(encoding_name)
+
+
+@lru_cache(maxsize=64)
+def encoding_for_model(model: str) -> str:
+    # provider prefixes like "openai/gpt-4o" are not known to tiktoken
+    for name in (model, model.rsplit("/", 1)[-1]):
+        try:
+            return tiktoken.encoding_name_for_model(name)
+        except KeyError:
+            continue
+    return DEFAULT_ENCODING
+
+
+def chat_model_encoding() -> str:
+    # encoding of the configured chat model, the one whose context window is managed,
+    # looked up once, settings.set_settings clears it when the model may have changed
+    global _chat_encoding
+    if _chat_encoding is None:
+        from python.helpers import settings
+
+        model = settings.get_settings().get("chat_model_name", "")
+        _chat_encoding = encoding_for_model(model) if model else DEFAULT_ENCODING
+    return _chat_encoding
+
+
+def clear_chat_model_encoding():
+    global _chat_encoding
+    _chat_encoding = None
 
-def count_tokens(text: str, encoding_name="cl100k_base") -> int:
-        if not text:
-            return 0
-    
-        # Get the encoding
-        encoding = tiktoken.get_encoding(encoding_name)
 
-        # Encode the text and count the tokens
-        tokens = encoding.encode(text)
-        token_count = len(tokens)
+def count_tokens(text: str, encoding_name=DEFAULT_ENCODING) -> int:
+    if not text:
+        return 0
+    count = len(get_encoding(encoding_name).encode_ordinary(text))
+    _calibrate(encoding_name, len(text), count)
+    return count
+
+
+def count_many(texts: list[str], encoding_name=DEFAULT_ENCODING) -> list[int]:
+    # tiktoken releases the GIL while encoding, large batches use a thread pool
+    if sum(len(t) for t in texts) < PARALLEL_MIN_CHARS:
+        return [count_tokens(t, encoding_name) for t in texts]
+    chunks = [(i, chunk) for i, text in enumerate(texts) for chunk in _split(text)]
+    encoding = get_encoding(encoding_name)
+    counts = [0] * len(texts)
+    sizes = _get_pool().map(lambda chunk: len(encoding.encode_ordinary(chunk[1])), chunks)
+    for (i, _), size in zip(chunks, sizes):
+        counts[i] += size
+    for text, count in zip(texts, counts):
+        _calibrate(encoding_name, len(text), count)
+    return counts
 
-        return token_count
 
 def approximate_tokens(text: str, ) -> int:
-    return int(count_tokens(text) * APPROX_BUFFER)
\ No newline at end of file
+    return int(count_tokens(text, chat_model_encoding()) * APPROX_BUFFER)
+
+
+def estimate_tokens(text: str, encoding_name=DEFAULT_ENCODING) -> int:
+    # heuristic for hot paths, characters over a ratio calibrated by exact counts so far
+    if not text:
+        return 0
+    ratio = _chars_per_token.get(encoding_name, DEFAULT_CHARS_PER_TOKEN)
+    return int(len(text) / ratio * APPROX_BUFFER) + 1
+
+
+def _split(text: str) -> list[str]:
+    # chunks of about PARALLEL_CHUNK_CHARS cut between a letter or digit and the whitespace
+    # after it, where tiktoken's pre-tokenizer splits too, so no token spans two chunks and
+    # the counts add up to the count of the whole text; a chunk without such a place, like
+    # an encoded blob, is cut anywhere and may count a token more
+    chunks = []
+    start = 0
+    while len(text) - start > PARALLEL_CHUNK_CHARS:
+        end = cut = start + PARALLEL_CHUNK_CHARS
+        while True:
+            cut = max(text.rfind(" ", start + 1, cut), text.rfind("\n", start + 1, cut))
+            if cut <= start:
+                cut = end
+                break
+            while cut - 1 > start and text[cut - 1].isspace():
+                cut -= 1
+            if text[cut - 1].isalnum():
+                break
+        chunks.append(text[start:cut])
+        start = cut
+    chunks.append(text[start:])
+    return chunks
+
+
+def _calibrate(encoding_name: str, chars: int, count: int):
+    if chars < CALIBRATION_MIN_CHARS or not count:
+        return
+    with _calibration_lock:
+        ratio = _chars_per_token.get(encoding_name, DEFAULT_CHARS_PER_TOKEN)
+        _chars_per_token[encoding_name] = (
+            ratio * (1 - CALIBRATION_WEIGHT) + chars / count * CALIBRATION_WEIGHT
+        )
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(thread_name_prefix="tokens")
+        return _pool
@@ -65,9 +65,8 @@ class Knowledge(Tool):
 
     async def mem_search(self, question: str):
         db = await memory.Memory.get(self.agent)
-        docs = await db.search_similarity_threshold(
-            query=question, limit=5, threshold=0.5
-        )
+        # mmr keeps near-duplicate fragments from filling the result
+        (docs,) = await db.search_many(queries=[question], k=5, threshold=0.5)
         text = memory.Memory.format_docs_plain(docs)
         return "\n\n".join(text)
 
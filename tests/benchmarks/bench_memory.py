@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Memory and knowledge throughput benchmarks, runnable offline.
+
+    python tests/benchmarks/bench_memory.py --sizes 1000,10000,100000 --output bench.json
+
+Each size runs in a scratch memory subdir with the deterministic hashing embedder and
+measures insert_documents, search_similarity_threshold (unfiltered, indexed filter,
+python filter), delete_documents_by_query, preload_knowledge and a cold
+Memory.initialize. The whole run uses a temporary base dir, so the memory stores,
+embedding and query caches, parsed knowledge cache and html logs it writes are removed
+with it and the app's own files are never touched.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import (  # noqa: E402
+    DEFAULT_DIM,
+    DEFAULT_SEED,
+    BenchAgent,
+    Corpus,
+    HashingEmbedder,
+    Stopwatch,
+    rss_mb,
+    write_report,
+)
+
+from langchain_core.documents import Document  # noqa: E402
+
+from python.helpers import embedding_store, files, query_cache  # noqa: E402
+from python.helpers.memory import Memory  # noqa: E402
+from python.helpers.print_style import PrintStyle  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000]
+INSERT_BATCH = 1000
+SEARCH_LIMIT = 10
+SEARCH_THRESHOLD = 0.5
+DELETE_THRESHOLD = 0.6
+DOCS_PER_KNOWLEDGE_FILE = 20
+
+
+class MemoryBenchmark:
+    def __init__(self, size: int, args: argparse.Namespace):
+        self.size = size
+        self.args = args
+        self.subdir = f"bench_{uuid.uuid4().hex[:8]}"
+        self.knowledge_subdir = f"bench_kn_{uuid.uuid4().hex[:8]}"
+        self.embedder = HashingEmbedder(dim=args.dim, seed=args.seed)
+        self.corpus = Corpus(seed=args.seed)
+        self.agent = BenchAgent(self.subdir, [self.knowledge_subdir])
+        self.memory: Memory | None = None
+
+    async def run(self) -> dict[str, Any]:
+        result: dict[str, Any] = {"size": self.size, "rss_start_mb": rss_mb()}
+        try:
+            self._open()
+            result["insert_documents"] = await self.bench_insert()
+            result["checkpoint"] = self.bench_checkpoint()
+            result["initialize_cold"] = self.bench_cold_initialize()
+            result["search"] = await self.bench_search("")
+            result["search_indexed_filter"] = await self.bench_search("area == 'main'")
+            result["search_python_filter"] = await self.bench_search(
+                "area == 'main' and topic < 100"
+            )
+            result["delete_documents_by_query"] = await self.bench_delete()
+            result["preload_knowledge"] = await self.bench_preload()
+            result["index_type"] = self._db.tiers.type if self._db.tiers else "flat"
+            result["rss_end_mb"] = rss_mb()
+        finally:
+            self._cleanup()
+        return result
+
+    @property
+    def _db(self):
+        assert self.memory
+        return self.memory.db
+
+    def _open(self):
+        db = Memory.initialize(None, self.embedder, self.subdir, False)
+        Memory.index[self.subdir] = db
+        self.memory = Memory(self.agent, db, self.subdir)  # type: ignore
+
+    async def bench_insert(self) -> dict[str, Any]:
+        watch = Stopwatch()
+        assert self.memory
+        for offset in range(0, self.size, INSERT_BATCH):
+            count = min(INSERT_BATCH, self.size - offset)
+            docs = [
+                Document(text, metadata=metadata)
+                for text, metadata in self.corpus.texts(count, offset)
+            ]
+            with watch.measure():
+                await self.memory.insert_documents(docs)
+        return {**watch.summary(operations=self.size), "batch": INSERT_BATCH}
+
+    def bench_checkpoint(self) -> dict[str, Any]:
+        watch = Stopwatch()
+        assert self.memory
+        with watch.measure():
+            self.memory.checkpoint()
+        return watch.summary()
+
+    def bench_cold_initialize(self) -> dict[str, Any]:
+        # same path as a restart: index and docstore read back from disk
+        del Memory.index[self.subdir]
+        self.memory = None
+        gc.collect()
+        rss_before = rss_mb()
+        watch = Stopwatch()
+        with watch.measure():
+            self._open()
+        rss_after = rss_mb()
+        summary: dict[str, Any] = watch.summary()
+        if rss_before is not None and rss_after is not None:
+            summary["rss_delta_mb"] = round(rss_after - rss_before, 1)
+        return summary
+
+    async def bench_search(self, filter: str) -> dict[str, Any]:
+        assert self.memory
+        queries = self.corpus.queries(self.args.queries, self.size, salt=len(filter))
+        watch = Stopwatch()
+        hits = 0
+        for query in queries:
+            with watch.measure():
+                docs = await self.memory.search_similarity_threshold(
+                    query, limit=SEARCH_LIMIT, threshold=SEARCH_THRESHOLD, filter=filter
+                )
+            hits += len(docs)
+        return {
+            **watch.summary(),
+            "queries": len(queries),
+            "filter": filter,
+            "mean_hits": round(hits / max(1, len(queries)), 2),
+        }
+
+    async def bench_delete(self) -> dict[str, Any]:
+        assert self.memory
+        queries = self.corpus.queries(self.args.delete_queries, self.size, salt=99)
+        watch = Stopwatch()
+        removed = 0
+        for query in queries:
+            with watch.measure():
+                docs = await self.memory.delete_documents_by_query(
+                    query, threshold=DELETE_THRESHOLD
+                )
+            removed += len(docs)
+        return {**watch.summary(), "queries": len(queries), "removed": removed}
+
+    async def bench_preload(self) -> dict[str, Any]:
+        assert self.memory
+        count = min(self.size, self.args.knowledge_docs)
+        folder = files.get_abs_path("knowledge", self.knowledge_subdir, "main")
+        os.makedirs(folder, exist_ok=True)
+        for start in range(0, count, DOCS_PER_KNOWLEDGE_FILE):
+            texts = [
+                text
+                for text, _ in self.corpus.texts(
+                    min(DOCS_PER_KNOWLEDGE_FILE, count - start), self.size + start
+                )
+            ]
+            with open(os.path.join(folder, f"doc_{start}.txt"), "w") as f:
+                f.write("\n\n".join(texts))
+
+        result: dict[str, Any] = {"documents": count}
+        for phase in ("cold", "unchanged"):
+            before = len(self._db.docstore._dict)  # type: ignore
+            watch = Stopwatch()
+            with watch.measure():
+                await self.memory.preload_knowledge(
+                    None, [self.knowledge_subdir], self.subdir
+                )
+            added = len(self._db.docstore._dict) - before  # type: ignore
+            result[phase] = {**watch.summary(), "indexed": added}
+        return result
+
+    def _cleanup(self):
+        memory = self.memory
+        if memory:
+            journal = memory.journal
+            with journal.lock:
+                if journal._timer:
+                    journal._timer.cancel()  # nothing left to persist
+                journal.pending = 0
+        Memory.index.pop(self.subdir, None)
+        Memory.journals.pop(self.subdir, None)
+        self.memory = None
+        shutil.rmtree(Memory._abs_db_dir(self.subdir), ignore_errors=True)
+        shutil.rmtree(files.get_abs_path("knowledge", self.knowledge_subdir), ignore_errors=True)
+        gc.collect()
+
+
+@contextlib.contextmanager
+def scratch_base_dir():
+    # every store, cache and log path hangs off the base dir, point it at a temp dir
+    caches = (embedding_store._stores, embedding_store._lru_stores, query_cache._caches)
+    saved = [dict(cache) for cache in caches]
+    get_base_dir, log_file_path = files.get_base_dir, PrintStyle.log_file_path
+    with tempfile.TemporaryDirectory(prefix="bench_memory_") as base_dir:
+        files.get_base_dir = lambda: base_dir
+        PrintStyle.log_file_path = None
+        for cache in caches:
+            cache.clear()
+        try:
+            yield base_dir
+        finally:
+            for store in [*embedding_store._stores.values(), *embedding_store._lru_stores.values()]:
+                store._conn.close()
+            for cache, items in zip(caches, saved):
+                cache.clear()
+                cache.update(items)  # type: ignore
+            files.get_base_dir, PrintStyle.log_file_path = get_base_dir, log_file_path
+
+
+async def main(args: argparse.Namespace):
+    results = []
+    # memory prints progress to stdout, keep it clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr), scratch_base_dir():
+        for size in args.sizes:
+            print(f"Benchmarking memory with {size} documents...")
+            started = time.perf_counter()
+            results.append(await MemoryBenchmark(size, args).run())
+            print(f"  done in {time.perf_counter() - started:.1f}s")
+    config = {
+        "dim": args.dim,
+        "seed": args.seed,
+        "queries": args.queries,
+        "delete_queries": args.delete_queries,
+        "knowledge_docs": args.knowledge_docs,
+        "search_limit": SEARCH_LIMIT,
+        "search_threshold": SEARCH_THRESHOLD,
+        "delete_threshold": DELETE_THRESHOLD,
+    }
+    return write_report("memory", config, results, args.output)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0] if __doc__ else None)
+    parser.add_argument(
+        "--sizes",
+        type=lambda s: [int(x) for x in s.split(",") if x],
+        default=DEFAULT_SIZES,
+        help="comma separated corpus sizes, e.g. 1000,10000,100000,1000000",
+    )
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--delete-queries", type=int, default=20)
+    parser.add_argument("--knowledge-docs", type=int, default=5000)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Memory saved against recall lost by the quantized memory index storage options.
+
+    python tests/benchmarks/bench_quantization.py --sizes 10000,100000 --output quant.json
+
+Vectors come from the deterministic hashing embedder over a synthetic corpus. Every
+index layout memory_index can build is measured for serialized size, build time,
+query latency and recall@k against exact search, with and without re-ranking the
+quantized candidates by their exact vectors the way MyFaiss does.
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import (  # noqa: E402
+    DEFAULT_DIM,
+    DEFAULT_SEED,
+    Corpus,
+    HashingEmbedder,
+    Stopwatch,
+    write_report,
+)
+
+import faiss  # noqa: E402
+import numpy as np  # noqa: E402
+
+from python.helpers import memory_index  # noqa: E402
+
+LAYOUTS: list[tuple[memory_index.IndexType, memory_index.Storage]] = [
+    ("flat", "float"),
+    ("flat", "sq8"),
+    ("hnsw", "float"),
+    ("hnsw", "sq8"),
+    ("hnsw", "pq"),
+    ("ivf", "float"),
+    ("ivf", "sq8"),
+    ("ivf", "pq"),
+]
+K = 10
+
+
+def embed_corpus(size: int, embedder: HashingEmbedder, corpus: Corpus) -> np.ndarray:
+    vectors = np.zeros((size, embedder.dim), dtype=np.float32)
+    batch = 1000
+    for start in range(0, size, batch):
+        texts = [text for text, _ in corpus.texts(min(batch, size - start), start)]
+        vectors[start : start + len(texts)] = embedder.embed_documents(texts)
+    return vectors
+
+
+def rerank(
+    exact: np.ndarray, queries: np.ndarray, indices: np.ndarray, k: int
+) -> np.ndarray:
+    # same selection as MyFaiss._rerank, exact vectors gathered per candidate row
+    result = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, candidates) in enumerate(zip(queries, indices)):
+        candidates = candidates[candidates != -1]
+        order = np.argsort(-(exact[candidates] @ query))[:k]
+        result[row, : order.size] = candidates[order]
+    return result
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f[f != -1]) & set(t)) for f, t in zip(found, truth))
+    return round(hits / truth.size, 4)
+
+
+def bench_layout(
+    type: memory_index.IndexType,
+    storage: memory_index.Storage,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    truth: np.ndarray,
+    config: memory_index.IndexConfig,
+) -> list[dict[str, Any]]:
+    started = time.perf_counter()
+    index = memory_index.build_index(vectors, type, config, storage)
+    build_seconds = time.perf_counter() - started
+    size = len(faiss.serialize_index(index))
+    results = []
+    for reranked in [False, True] if storage != "float" else [False]:
+        fetch = K * config["rerank_factor"] if reranked else K
+        watch = Stopwatch()
+        found = np.zeros((len(queries), K), dtype=np.int64)
+        for row, query in enumerate(queries):
+            with watch.measure():
+                _, indices = index.search(query[None, :], fetch)
+                if reranked:
+                    indices = rerank(vectors, query[None, :], indices, K)
+            found[row] = indices[0, :K]
+        results.append(
+            {
+                "type": type,
+                "storage": storage,
+                "rerank": reranked,
+                "index_bytes": size,
+                "bytes_per_vector": round(size / len(vectors), 1),
+                "build_seconds": round(build_seconds, 3),
+                f"recall_at_{K}": recall(found, truth),
+                "search": watch.summary(),
+            }
+        )
+    return results
+
+
+def run(size: int, args: argparse.Namespace) -> dict[str, Any]:
+    embedder = HashingEmbedder(dim=args.dim, seed=args.seed)
+    corpus = Corpus(seed=args.seed)
+    vectors = embed_corpus(size, embedder, corpus)
+    queries = np.array(
+        embedder.embed_documents(corpus.queries(args.queries, size)), dtype=np.float32
+    )
+
+    exact = faiss.IndexFlatIP(args.dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, K)
+
+    config = memory_index.IndexConfig(**memory_index.DEFAULT_CONFIG)
+    config["pq_m"] = args.pq_m
+    layouts = []
+    for type, storage in LAYOUTS:
+        print(f"  {type} {storage}...", file=sys.stderr)
+        layouts += bench_layout(type, storage, vectors, queries, truth, config)
+
+    # memory saved relative to float32 flat, the default layout
+    baseline = layouts[0]["index_bytes"]
+    for layout in layouts:
+        layout["size_vs_flat_float"] = round(layout["index_bytes"] / baseline, 4)
+    return {"size": size, "layouts": layouts}
+
+
+def main(args: argparse.Namespace):
+    results = []
+    for size in args.sizes:
+        print(f"Benchmarking quantized storage with {size} vectors...", file=sys.stderr)
+        results.append(run(size, args))
+    config = {
+        "dim": args.dim,
+        "seed": args.seed,
+        "queries": args.queries,
+        "k": K,
+        "pq_m": args.pq_m,
+    }
+    return write_report("quantization", config, results, args.output)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0] if __doc__ else None)
+    parser.add_argument(
+        "--sizes",
+        type=lambda s: [int(x) for x in s.split(",") if x],
+        default=[10000, 50000],
+        help="comma separated collection sizes",
+    )
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--pq-m", type=int, default=0, help="pq bytes per vector, 0 = dim / 8")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
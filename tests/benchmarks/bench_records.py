@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Memory held by chat histories and logs, slotted records against the previous layout.
+
+    python tests/benchmarks/bench_records.py --contexts 100 --messages 1000 --output records.json
+
+Every context gets a History of --messages messages split into topics and a Log of
+as many items, a third of them with kvps. The same message texts are shared by all
+contexts and both layouts, so the measured bytes are the records themselves. The
+previous layout is rebuilt below as plain classes with a __dict__ per instance and an
+OrderedDict of kvps on every log item.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import rss_mb, write_report  # noqa: E402
+
+from python.helpers.history import History  # noqa: E402
+from python.helpers.log import Log  # noqa: E402
+
+TOPIC_MESSAGES = 20
+KVPS_EVERY = 3
+TEXTS = 500
+
+
+class LegacyMessage:
+    def __init__(self, ai: bool, content: Any, no: int = 0):
+        self.ai = ai
+        self._content = content
+        self._summary = ""
+        self.no = no
+        self.parent: Any = None
+
+
+class LegacyTopic:
+    def __init__(self, history: "LegacyHistory"):
+        self.history = history
+        self._summary = ""
+        self.messages: list[LegacyMessage] = []
+        self.parent: Any = None
+
+    def add_message(self, ai: bool, content: Any):
+        self.history.counter += 1
+        msg = LegacyMessage(ai, content, no=self.history.counter)
+        msg.parent = self
+        self.messages.append(msg)
+
+
+class LegacyHistory:
+    def __init__(self):
+        self.bulks: list = []
+        self.topics: list[LegacyTopic] = []
+        self.counter = 0
+        self.current = LegacyTopic(self)
+
+    def add_message(self, ai: bool, content: Any):
+        self.current.add_message(ai, content)
+
+    def new_topic(self):
+        self.topics.append(self.current)
+        self.current = LegacyTopic(self)
+
+
+@dataclass
+class LegacyLogItem:
+    log: Any
+    no: int
+    type: str
+    heading: str
+    content: str
+    temp: bool
+    update_progress: Optional[str] = "persistent"
+    kvps: Optional[OrderedDict] = None
+    id: Optional[str] = None
+    guid: str = ""
+
+
+def legacy_log(texts: list[str], count: int) -> tuple[list[LegacyLogItem], list[int]]:
+    items = []
+    for i in range(count):
+        kvps = {"tool": texts[i % len(texts)]} if i % KVPS_EVERY == 0 else {}
+        items.append(
+            LegacyLogItem(
+                log=None,
+                no=i,
+                type="".join(["to", "ol"]),  # built at runtime like a parsed type
+                heading=texts[(i + 1) % len(texts)],
+                content=texts[i % len(texts)],
+                temp=False,
+                kvps=OrderedDict(kvps),
+                guid="",
+            )
+        )
+    return items, [item.no for item in items]
+
+
+def current_log(texts: list[str], count: int) -> Log:
+    log = Log()
+    for i in range(count):
+        kvps = {"tool": texts[i % len(texts)]} if i % KVPS_EVERY == 0 else None
+        log.log(
+            type="".join(["to", "ol"]),  # type: ignore
+            heading=texts[(i + 1) % len(texts)],
+            content=texts[i % len(texts)],
+            kvps=kvps,
+        )
+    return log
+
+
+def fill(history, texts: list[str], count: int):
+    for i in range(count):
+        history.add_message(i % 2 == 1, texts[i % len(texts)])
+        if (i + 1) % TOPIC_MESSAGES == 0:
+            history.new_topic()
+    return history
+
+
+def build_legacy(texts: list[str], contexts: int, messages: int) -> list:
+    return [
+        (fill(LegacyHistory(), texts, messages), legacy_log(texts, messages))
+        for _ in range(contexts)
+    ]
+
+
+def build_current(texts: list[str], contexts: int, messages: int) -> list:
+    return [
+        (fill(History(agent=None), texts, messages), current_log(texts, messages))
+        for _ in range(contexts)
+    ]
+
+
+def measure(build, texts: list[str], contexts: int, messages: int) -> dict[str, Any]:
+    build(texts, 1, TOPIC_MESSAGES)  # first use imports and caches, not part of the records
+    gc.collect()
+    rss_before = rss_mb()
+    tracemalloc.start()
+    built = build(texts, contexts, messages)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = rss_mb()
+    records = contexts * messages
+    result = {
+        "bytes": size,
+        "peak_bytes": peak,
+        "bytes_per_message_and_log_item": round(size / records, 1),
+        "rss_delta_mb": (
+            round(rss_after - rss_before, 1)
+            if rss_before is not None and rss_after is not None
+            else None
+        ),
+    }
+    del built
+    gc.collect()
+    return result
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    texts = [f"message {i} " + "lorem ipsum dolor sit amet " * (i % 20 + 1) for i in range(TEXTS)]
+    legacy = measure(build_legacy, texts, args.contexts, args.messages)
+    current = measure(build_current, texts, args.contexts, args.messages)
+    return {
+        "contexts": args.contexts,
+        "messages": args.messages,
+        "legacy": legacy,
+        "slotted": current,
+        "saved_ratio": round(1 - current["bytes"] / legacy["bytes"], 4),
+    }
+
+
+def main(args: argparse.Namespace):
+    print(
+        f"Measuring {args.contexts} contexts of {args.messages} messages...",
+        file=sys.stderr,
+    )
+    config = {"contexts": args.contexts, "messages": args.messages}
+    return write_report("records", config, [run(args)], args.output)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0] if __doc__ else None)
+    parser.add_argument("--contexts", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
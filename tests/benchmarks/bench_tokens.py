@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Tokenizer micro-benchmark for python/helpers/tokens.py.
+
+    python tests/benchmarks/bench_tokens.py --texts 2000 --output tokens.json
+
+The texts are the repository's own sources and prompts cut into message sized
+pieces, which is closer to chat history than synthetic words. Measured: the old
+count_tokens that looked the encoding up on every call, the cached encoder,
+count_many serial against the thread pool on a large batch, and the calibrated
+estimate_tokens heuristic with its error against the exact counts.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import ROOT, Stopwatch, write_report  # noqa: E402
+
+import tiktoken  # noqa: E402
+
+from python.helpers import tokens  # noqa: E402
+
+SOURCES = ("src/visionsync/python/**/*.py", "prompts/**/*.md", "docs/**/*.md")
+
+
+def load_texts(count: int, size: int) -> list[str]:
+    # slices of all repository text joined, wrapping around until there are enough
+    parts = []
+    for pattern in SOURCES:
+        for path in sorted(glob.glob(os.path.join(ROOT, pattern), recursive=True)):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                parts.append(f.read())
+    corpus = "\n".join(parts)
+    if not corpus:
+        raise RuntimeError("no source texts found")
+    while len(corpus) < size:
+        corpus += corpus
+    return [
+        (corpus + corpus[:size])[start : start + size]
+        for start in ((i * size) % len(corpus) for i in range(count))
+    ]
+
+
+def legacy_count(text: str, encoding_name: str) -> int:
+    # count_tokens before the encoder cache
+    if not text:
+        return 0
+    encoding = tiktoken.get_encoding(encoding_name)
+    return len(encoding.encode(text))
+
+
+def timed(function, texts: list[str]) -> dict[str, Any]:
+    watch = Stopwatch()
+    for text in texts:
+        with watch.measure():
+            function(text)
+    result: dict[str, Any] = watch.summary()
+    total = sum(watch.samples)
+    if total > 0:
+        result["chars_per_second"] = round(sum(map(len, texts)) / total)
+    return result
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    encoding = args.encoding
+    texts = load_texts(args.texts, args.text_chars)
+
+    started = time.perf_counter()
+    tokens.get_encoding(encoding)
+    load_seconds = time.perf_counter() - started
+
+    results: dict[str, Any] = {
+        "texts": len(texts),
+        "chars": sum(map(len, texts)),
+        "encoding_load_seconds": round(load_seconds, 4),
+        "count_tokens_legacy": timed(lambda t: legacy_count(t, encoding), texts),
+        "count_tokens": timed(lambda t: tokens.count_tokens(t, encoding), texts),
+    }
+
+    # one large batch, serial against the pool
+    batch = load_texts(args.batch_texts, args.batch_text_chars)
+    serial = Stopwatch()
+    with serial.measure():
+        exact = [tokens.count_tokens(t, encoding) for t in batch]
+    pooled = Stopwatch()
+    with pooled.measure():
+        parallel = tokens.count_many(batch, encoding)
+    results["count_many"] = {
+        "texts": len(batch),
+        "chars": sum(map(len, batch)),
+        "serial": serial.summary(len(batch)),
+        "thread_pool": pooled.summary(len(batch)),
+        "speedup": round(sum(serial.samples) / max(sum(pooled.samples), 1e-9), 2),
+        "max_count_difference": max(abs(a - b) for a, b in zip(exact, parallel)),
+    }
+
+    # heuristic, calibrated by the exact counts above
+    estimated = [tokens.estimate_tokens(t, encoding) for t in texts]
+    counted = [int(tokens.count_tokens(t, encoding) * tokens.APPROX_BUFFER) for t in texts]
+    errors = [abs(e - c) / c for e, c in zip(estimated, counted) if c]
+    results["estimate_tokens"] = {
+        **timed(lambda t: tokens.estimate_tokens(t, encoding), texts),
+        "mean_relative_error": round(sum(errors) / len(errors), 4) if errors else None,
+        "max_relative_error": round(max(errors), 4) if errors else None,
+    }
+    return results
+
+
+def main(args: argparse.Namespace):
+    print(f"Benchmarking tokenizer with {args.texts} texts...", file=sys.stderr)
+    config = {
+        "encoding": args.encoding,
+        "texts": args.texts,
+        "text_chars": args.text_chars,
+        "batch_texts": args.batch_texts,
+        "batch_text_chars": args.batch_text_chars,
+    }
+    return write_report("tokens", config, [run(args)], args.output)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0] if __doc__ else None)
+    parser.add_argument("--encoding", default=tokens.DEFAULT_ENCODING)
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--text-chars", type=int, default=2000)
+    parser.add_argument("--batch-texts", type=int, default=64)
+    parser.add_argument("--batch-text-chars", type=int, default=20000)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_args())
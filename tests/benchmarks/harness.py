@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Shared pieces of the benchmark suite: a deterministic offline embedder, a synthetic
+corpus generator, a minimal agent for driving Memory, timers and JSON reporting.
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Iterator
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_DIR = os.path.join(ROOT, "src", "visionsync")
+
+# the helpers import `python.*`, `agent` and `models` as top level modules
+for path in (APP_DIR, ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+DEFAULT_DIM = 256
+DEFAULT_SEED = 1337
+
+
+class HashingEmbedder(Embeddings):
+    """Deterministic embedder for benchmarks, no network and no model download.
+    Unigrams and bigrams are hashed with crc32 into a seeded random projection, so
+    texts sharing words end up close and results are identical across processes."""
+
+    def __init__(self, dim: int = DEFAULT_DIM, seed: int = DEFAULT_SEED, buckets: int = 1 << 16):
+        self.dim = dim
+        self.buckets = buckets
+        self.model = f"bench-hashing-{dim}-{seed}"  # cache namespace, see Memory.initialize
+        rng = np.random.default_rng(seed)
+        self._projection = rng.standard_normal((buckets, dim), dtype=np.float32)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([text])[0].tolist()
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = text.lower().split()
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            if not features:
+                continue
+            buckets = [zlib.crc32(f.encode()) % self.buckets for f in features]
+            vectors[row] = self._projection[buckets].sum(axis=0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+
+class Corpus:
+    """Synthetic documents grouped into topics with a zipfian vocabulary, so a query
+    built from one document has real near neighbours."""
+
+    AREAS = ("main", "fragments", "solutions")
+
+    def __init__(self, seed: int = DEFAULT_SEED, vocabulary: int = 20000, topics: int = 200):
+        self.seed = seed
+        self.vocabulary = [f"w{i}" for i in range(vocabulary)]
+        rng = np.random.default_rng(seed)
+        ranks = np.arange(1, vocabulary + 1)
+        self._weights = (1 / ranks) / (1 / ranks).sum()
+        self._topic_words = [
+            rng.choice(vocabulary, size=40, replace=False) for _ in range(topics)
+        ]
+
+    def texts(self, count: int, offset: int = 0) -> Iterator[tuple[str, dict[str, Any]]]:
+        # each document is reproducible from its number alone
+        for number in range(offset, offset + count):
+            yield self.document(number)
+
+    def document(self, number: int) -> tuple[str, dict[str, Any]]:
+        rng = np.random.default_rng((self.seed, number))
+        topic = int(rng.integers(len(self._topic_words)))
+        length = int(rng.integers(20, 60))
+        common = rng.choice(len(self.vocabulary), size=length // 2, p=self._weights)
+        specific = rng.choice(self._topic_words[topic], size=length - length // 2)
+        words = [self.vocabulary[i] for i in np.concatenate([common, specific])]
+        rng.shuffle(words)  # type: ignore
+        metadata = {
+            "area": self.AREAS[number % len(self.AREAS)],
+            "topic": topic,
+            "doc": number,
+        }
+        return " ".join(words), metadata
+
+    def queries(self, count: int, corpus_size: int, salt: int = 0) -> list[str]:
+        # a slice of an existing document, unique per call so the query cache misses
+        rng = np.random.default_rng((self.seed, corpus_size, salt, 7))
+        queries = []
+        for i in range(count):
+            text, _ = self.document(int(rng.integers(corpus_size)))
+            words = text.split()
+            start = int(rng.integers(max(1, len(words) - 12)))
+            queries.append(" ".join(words[start : start + 12]) + f" q{salt}x{i}")
+        return queries
+
+
+class BenchAgent:
+    """The subset of Agent that Memory touches outside of Memory.get."""
+
+    def __init__(self, memory_subdir: str, knowledge_subdirs: list[str] | None = None):
+        from python.helpers.log import Log
+
+        self.config = SimpleNamespace(
+            memory_subdir=memory_subdir,
+            knowledge_subdirs=knowledge_subdirs or [],
+            embeddings_model=None,
+        )
+        self.context = SimpleNamespace(id=f"bench-{memory_subdir}", log=Log())
+        self.data: dict[str, Any] = {}
+
+    async def rate_limiter(self, model_config=None, input: str = ""):
+        return None  # offline embedder, nothing to throttle
+
+    def get_data(self, field: str):
+        return self.data.get(field)
+
+    def set_data(self, field: str, value):
+        self.data[field] = value
+
+
+class Stopwatch:
+    def __init__(self):
+        self.samples: list[float] = []
+
+    @contextmanager
+    def measure(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.append(time.perf_counter() - start)
+
+    def summary(self, operations: int | None = None) -> dict[str, float]:
+        total = sum(self.samples)
+        result: dict[str, float] = {"seconds": round(total, 6)}
+        if len(self.samples) > 1:
+            ordered = sorted(self.samples)
+            result.update(
+                p50_ms=round(statistics.median(ordered) * 1000, 3),
+                p95_ms=round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 3),
+                max_ms=round(ordered[-1] * 1000, 3),
+            )
+        ops = operations if operations is not None else len(self.samples)
+        if total > 0 and ops > 1:
+            result["ops_per_second"] = round(ops / total, 2)
+        return result
+
+
+def rss_mb() -> float | None:
+    # resident set size of this process, None where /proc is not available
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def environment() -> dict[str, Any]:
+    info: dict[str, Any] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+    try:
+        import faiss
+
+        info["faiss"] = getattr(faiss, "__version__", "unknown")
+    except ImportError:
+        pass
+    return info
+
+
+def write_report(name: str, config: dict[str, Any], results: list[dict[str, Any]], output: str | None):
+    report = {
+        "benchmark": name,
+        "environment": environment(),
+        "config": config,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    return report
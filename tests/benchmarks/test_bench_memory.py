@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Smoke test for the memory benchmark, a tiny corpus through every measured path.
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("faiss")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import Corpus, HashingEmbedder  # noqa: E402
+
+
+def test_embedder_is_deterministic():
+    """Same text, same vector, across embedder instances."""
+    a = HashingEmbedder(dim=32).embed_query("alpha beta gamma")
+    b = HashingEmbedder(dim=32).embed_query("alpha beta gamma")
+    assert a == b
+    assert abs(sum(x * x for x in a) - 1) < 1e-5
+
+
+def test_corpus_is_reproducible():
+    """Documents depend only on seed and number."""
+    assert Corpus(seed=1).document(42) == Corpus(seed=1).document(42)
+    assert Corpus(seed=1).document(42) != Corpus(seed=1).document(43)
+
+
+def test_memory_benchmark_report(tmp_path):
+    """A small run produces a report with every section."""
+    import bench_memory
+
+    output = tmp_path / "memory.json"
+    args = bench_memory.parse_args(
+        [
+            "--sizes", "300",
+            "--dim", "32",
+            "--queries", "5",
+            "--delete-queries", "2",
+            "--knowledge-docs", "40",
+            "--output", str(output),
+        ]
+    )
+    asyncio.run(bench_memory.main(args))
+
+    report = json.loads(output.read_text())
+    result = report["results"][0]
+    assert result["size"] == 300
+    for section in (
+        "insert_documents",
+        "initialize_cold",
+        "search",
+        "search_indexed_filter",
+        "search_python_filter",
+        "delete_documents_by_query",
+        "preload_knowledge",
+    ):
+        assert section in result
+    assert result["search"]["queries"] == 5
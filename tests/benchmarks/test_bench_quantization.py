@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Smoke test for the quantized storage benchmark.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("faiss")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_quantization_report(tmp_path):
+    """Every layout is measured and quantized codes are smaller than float ones."""
+    import bench_quantization
+
+    output = tmp_path / "quantization.json"
+    args = bench_quantization.parse_args(
+        ["--sizes", "2000", "--dim", "64", "--queries", "5", "--output", str(output)]
+    )
+    bench_quantization.main(args)
+
+    layouts = json.loads(output.read_text())["results"][0]["layouts"]
+    assert {(l["type"], l["storage"]) for l in layouts} == set(bench_quantization.LAYOUTS)
+    float_bytes = {l["type"]: l["index_bytes"] for l in layouts if l["storage"] == "float"}
+    for layout in layouts:
+        assert 0 <= layout["recall_at_10"] <= 1
+        if layout["storage"] != "float":
+            assert layout["index_bytes"] < float_bytes[layout["type"]]
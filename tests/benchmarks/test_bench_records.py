@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Smoke test for the history and log records memory benchmark.
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_records_report(tmp_path):
+    """Slotted records take less memory than the previous layout."""
+    import bench_records
+
+    output = tmp_path / "records.json"
+    args = bench_records.parse_args(["--contexts", "3", "--messages", "200", "--output", str(output)])
+    bench_records.main(args)
+
+    result = json.loads(output.read_text())["results"][0]
+    assert result["slotted"]["bytes"] < result["legacy"]["bytes"]
+    assert 0 < result["saved_ratio"] < 1
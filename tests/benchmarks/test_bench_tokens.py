@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Smoke test for the tokenizer benchmark, a few texts through every measured path.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+tiktoken = pytest.importorskip("tiktoken")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import harness  # noqa: E402,F401  puts the app on sys.path
+
+
+# gpt-2 style pre-tokenization over single bytes, stands in when no bpe table can be downloaded
+LOCAL_PATTERN = r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    from python.helpers import tokens
+
+    try:
+        tokens.get_encoding(tokens.DEFAULT_ENCODING)
+    except Exception:  # the bpe table is downloaded on first use, offline use a local one
+        encoding = tiktoken.Encoding(
+            "local",
+            pat_str=LOCAL_PATTERN,
+            mergeable_ranks={bytes([i]): i for i in range(256)},
+            special_tokens={},
+        )
+        monkeypatch.setattr(tiktoken, "get_encoding", lambda name: encoding)
+        monkeypatch.setattr(tokens, "get_encoding", lambda name=tokens.DEFAULT_ENCODING: encoding)
+    return tokens
+
+
+def test_count_many_matches_count_tokens(tokens, monkeypatch):
+    """The thread pool path gives the serial counts, chunks are cut at whitespace."""
+    monkeypatch.setattr(tokens, "PARALLEL_MIN_CHARS", 0)
+    monkeypatch.setattr(tokens, "PARALLEL_CHUNK_CHARS", 1000)
+    texts = ["hello world " * 500, "", "def f(x):\n    return x\n" * 200]
+    serial = [tokens.count_tokens(t) for t in texts]
+    pooled = tokens.count_many(texts)
+    assert pooled == serial
+
+
+def test_tokens_benchmark_report(tokens, tmp_path):
+    """A small run produces a report with every section."""
+    import bench_tokens
+
+    output = tmp_path / "tokens.json"
+    args = bench_tokens.parse_args(
+        ["--texts", "20", "--batch-texts", "4", "--batch-text-chars", "2000", "--output", str(output)]
+    )
+    bench_tokens.main(args)
+
+    result = json.loads(output.read_text())["results"][0]
+    for section in ("count_tokens_legacy", "count_tokens", "count_many", "estimate_tokens"):
+        assert section in result
+    assert result["count_many"]["max_count_difference"] >= 0
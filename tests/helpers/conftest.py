@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Shared setup for the helper tests, the app on sys.path.
+"""
+
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+APP_DIR = os.path.join(ROOT, "src", "visionsync")
+
+# the helpers import `python.*`, `agent` and `models` as top level modules
+for path in (APP_DIR, ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def history_settings(monkeypatch):
+    """A 1000 token chat model with 70% of it for history, tokens counted as words."""
+    from python.helpers import settings, tokens
+
+    monkeypatch.setattr(
+        settings,
+        "get_settings",
+        lambda: {"chat_model_ctx_length": 1000, "chat_model_ctx_history": 0.7},
+    )
+    monkeypatch.setattr(tokens, "approximate_tokens", lambda text: len(text.split()))
+
+
+@pytest.fixture(autouse=True)
+def print_log(tmp_path, monkeypatch):
+    """PrintStyle html output goes to the test's tmp dir instead of the app's logs."""
+    from python.helpers.print_style import PrintStyle
+
+    monkeypatch.setattr(PrintStyle, "log_file_path", str(tmp_path / "log.html"))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for the chat journal, records written since a snapshot and replayed on top of it.
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from python.helpers.chat_journal import COMPACT_MAX_RECORDS, ChatJournal
+from python.helpers.history import History
+from python.helpers.log import Log
+
+
+def serialize_data(agent) -> str:
+    return json.dumps(agent.data, sort_keys=True)
+
+
+@pytest.fixture
+def context(history_settings, monkeypatch):
+    import agent as agent_module
+
+    # the journal walks subordinates by this data key, the test agent has none
+    monkeypatch.setattr(
+        agent_module.Agent, "DATA_NAME_SUBORDINATE", "_subordinate", raising=False
+    )
+    agent = SimpleNamespace(number=0, history=History(agent=None), data={"topic": "setup"})
+    agent.history.add_message(False, "hello")
+    return SimpleNamespace(agent0=agent, log=Log(), streaming_agent=None)
+
+
+@pytest.fixture
+def journal(tmp_path, context):
+    journal = ChatJournal(str(tmp_path / "chat.journal.jsonl"))
+    journal.capture(context, serialize_data)
+    return journal
+
+
+def test_diff_records_appended_messages_data_and_log(journal, context):
+    history = context.agent0.history
+    history.add_message(True, "hi")
+    history.new_topic()
+    history.add_message(False, "next topic")
+    context.agent0.data["topic"] = "next"
+    item = context.log.log(type="info", heading="working")
+
+    records = journal.diff(context, serialize_data)
+    assert [r["op"] for r in records] == ["messages", "data", "log"]
+    topics = records[0]["topics"]
+    assert [[m["content"] for m in msgs] for msgs in topics] == [["hi"], ["next topic"]]
+    assert records[1]["data"] == {"topic": "next"}
+    assert [i["heading"] for i in records[2]["items"]] == ["working"]
+
+    assert journal.diff(context, serialize_data) == []
+    item.update(heading="done")
+    assert journal.diff(context, serialize_data)[0]["items"][0]["heading"] == "done"
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda ctx: setattr(ctx.agent0.history.current.messages[0], "summary", "short"),
+        lambda ctx: setattr(ctx.agent0, "history", History(agent=None)),
+        lambda ctx: ctx.log.reset(),
+    ],
+    ids=["edited history", "replaced history", "reset log"],
+)
+def test_other_changes_need_a_snapshot(journal, context, change):
+    change(context)
+    assert journal.diff(context, serialize_data) is None
+
+
+def test_replay_restores_the_history_after_the_snapshot(journal, context):
+    """Records already in the snapshot and a torn last line are skipped."""
+    history = context.agent0.history
+    snapshot = history.serialize()
+
+    history.add_message(True, "first")
+    journal.append(journal.diff(context, serialize_data), json.dumps)
+    seq = journal.seq  # a snapshot written now would hold everything so far
+    history.add_message(False, "second")
+    history.new_topic()
+    history.add_message(True, "third")
+    journal.append(journal.diff(context, serialize_data), json.dumps)
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"seq": 99, "op": "messa')
+
+    restored = History.from_dict(json.loads(snapshot), history=History(agent=None))
+    for record in ChatJournal(journal.path).read():
+        if record["op"] == "messages":
+            restored.replay_messages(record["topics"])
+    assert restored.output() == history.output()
+    assert restored.counter == history.counter
+
+    reader = ChatJournal(journal.path)
+    assert [r["seq"] for r in reader.read(after=seq)] == [seq + 1]
+    assert reader.seq == seq + 1
+
+
+def test_compaction_after_many_records(journal, context):
+    for i in range(COMPACT_MAX_RECORDS):
+        context.agent0.history.add_message(i % 2 == 0, f"message {i}")
+        journal.append(journal.diff(context, serialize_data), json.dumps)
+    assert journal.needs_compaction()
+
+    journal.compacted(snapshot_bytes=1000)
+    assert not journal.needs_compaction()
+    assert list(journal.read()) == []
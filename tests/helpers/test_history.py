@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for planned history compression. The history budget is 700 tokens: 350 for the
+current topic, 210 for older topics and 140 for bulks, each message counts its words
+plus one for the role label.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from python.helpers import summary_cache
+from python.helpers.history import History
+
+
+class Agent:
+    config = SimpleNamespace(utility_model=SimpleNamespace(provider="test", name="test"))
+
+    def __init__(self):
+        self.calls = 0
+
+    async def call_utility_model(self, system: str, message: str, **kwargs) -> str:
+        self.calls += 1
+        return "short summary"
+
+    def read_prompt(self, file: str, **kwargs) -> str:
+        return f"{file} {kwargs}" if kwargs else file
+
+    def parse_prompt(self, file: str, **kwargs) -> str:
+        return kwargs.get("summary", "")
+
+
+@pytest.fixture
+def history(history_settings, monkeypatch, tmp_path):
+    cache = summary_cache.SummaryCache(str(tmp_path / "summaries.db"))
+    monkeypatch.setattr(summary_cache, "get_cache", lambda: cache)
+    return History(agent=Agent())
+
+
+def add_topic(history: History, *words: int):
+    # distinct words in every message, no summary is served from the cache
+    for i, count in enumerate(words):
+        no = history.counter
+        history.add_message(i % 2 == 1, " ".join(f"m{no}w{j}" for j in range(count)))
+
+
+def close_topic(history: History, *words: int):
+    add_topic(history, *words)
+    history.new_topic()
+
+
+def run(history: History, steps) -> bool:
+    return asyncio.run(history.run_compression(steps))
+
+
+def test_older_topics_are_summarized_oldest_first(history):
+    for _ in range(3):
+        close_topic(history, 50, 50)  # 102 tokens each, 306 over 210
+
+    steps = history.plan_compression()
+    assert len(steps) == 2 and all(step.run for step in steps)
+    assert run(history, steps)
+    assert [t.summary for t in history.topics] == ["short summary", "short summary", ""]
+    assert history.agent.calls == 2
+    assert history.plan_compression() == []
+
+
+def test_current_topic_is_kept_under_a_soft_ratio(history):
+    """Ahead of the limit only older topics shrink, the current one keeps its detail."""
+    close_topic(history, 50, 50)
+    close_topic(history, 50, 50)  # 204, under 210, over 105 at half
+    add_topic(history, 99, 99, 99)  # 300, under 350
+
+    assert history.plan_compression() == []
+    steps = history.plan_compression(0.5)
+    assert len(steps) == 2
+    run(history, steps)
+    assert all(t.summary for t in history.topics)
+    assert [m.summary for m in history.current.messages] == ["", "", ""]
+
+    add_topic(history, 99)  # 400, over its hard limit at any ratio
+    assert history.plan_compression(0.5)
+
+
+def test_large_messages_are_truncated_before_summarizing(history):
+    """The summary waits for the next round, it is written from the truncated messages."""
+    add_topic(history, 10, 399, *[50] * 8)  # 819, the second message far over 52.5
+
+    steps = history.plan_compression()
+    assert len(steps) == 1 and steps[0].run is None
+    run(history, steps)
+    assert history.current.messages[1].summary
+    assert history.agent.calls == 0
+
+    steps = history.plan_compression()  # still over 350
+    assert len(steps) == 1 and steps[0].run
+    run(history, steps)
+    assert history.get_current_topic_tokens() < 350
+    assert history.plan_compression() == []
+
+
+def test_current_topic_middle_is_summarized(history):
+    add_topic(history, *[50] * 8)  # 408
+
+    steps = history.plan_compression()
+    assert len(steps) == 1 and steps[0].run
+    run(history, steps)
+    # ceil(6 * 0.65) messages after the first replaced by one summary message
+    assert len(history.current.messages) == 5
+    assert history.current.messages[1].content == "short summary"
+
+
+def test_summary_of_moved_messages_is_discarded(history):
+    add_topic(history, *[50] * 8)
+    steps = history.plan_compression()
+    history.current.messages.pop(2)
+
+    assert not run(history, steps)
+    assert len(history.current.messages) == 7
+
+
+def test_bulks_wait_while_topics_move(history):
+    """Moving topics to bulks and merging bulks are never planned in the same round."""
+    for _ in range(2):
+        close_topic(history, 10)
+    for topic in history.topics:
+        topic.summary = " ".join(["summary"] * 120)  # 121 each, 242 over 210
+    run(history, history.plan_compression())
+    assert len(history.bulks) == 2 and not history.topics
+
+    for _ in range(2):
+        close_topic(history, 10)
+    for topic in history.topics:
+        topic.summary = " ".join(["summary"] * 120)
+    steps = history.plan_compression()
+    assert len(steps) == 1 and steps[0].run is None
+    run(history, steps)
+    assert len(history.bulks) == 4
+
+    steps = history.plan_compression()
+    assert len([step for step in steps if step.run]) == 1  # [b0 b1 b2] merged, [b3] kept
+    run(history, steps)
+    assert [b.summary for b in history.bulks] == ["short summary", history.bulks[1].summary]
+    assert len(history.bulks) == 2
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for memory filter expressions, the indexed plan against the python eval.
+"""
+
+import pytest
+
+from python.helpers.memory_filter import MetadataIndex, compile_filter
+
+METADATAS = [
+    {"area": "main"},
+    {"area": "solutions"},
+    {},
+    {"area": "fragments", "source": "notes.md"},
+    {"area": ["main"]},  # unhashable, equal to no constant
+    {"area": "main", "source": "notes.md"},
+]
+
+INDEXED = [
+    "area == 'main'",
+    "'main' == area",
+    "area != 'main'",
+    "not area == 'main'",
+    "area in ['main', 'solutions']",
+    "area not in ('main',)",
+    "area == 'main' or area == 'solutions'",
+    "area == 'main' and area == 'solutions'",
+    "not (area == 'main' or area == 'fragments')",
+]
+
+
+@pytest.fixture
+def index():
+    index = MetadataIndex()
+    index.add(METADATAS)
+    return index
+
+
+@pytest.mark.parametrize("condition", INDEXED)
+def test_indexed_plan_matches_eval(index, condition):
+    """Documents missing the field never match, like the eval that raises on them."""
+    compiled = compile_filter(condition)
+    assert compiled.indexed
+    assert compiled.select(index).tolist() == [compiled(m) for m in METADATAS]
+
+
+@pytest.mark.parametrize(
+    "condition, expected",
+    [
+        ("source == 'notes.md'", [False, False, False, True, False, True]),
+        ("area == 'main' and source == 'notes.md'", [False, False, False, False, False, True]),
+        ("len(area) > 4", [False, True, False, True, False, False]),
+    ],
+)
+def test_other_fields_fall_back_to_eval(index, condition, expected):
+    compiled = compile_filter(condition)
+    assert not compiled.indexed
+    with pytest.raises(ValueError):
+        compiled.select(index)
+    assert [compiled(m) for m in METADATAS] == expected
+
+
+def test_invalid_filter_matches_nothing():
+    compiled = compile_filter("area ==")
+    assert not compiled.indexed
+    assert not any(compiled(m) for m in METADATAS)
+
+
+def test_masks_follow_removed_positions(index):
+    """Deletes compact the masks like the vector store compacts its positions."""
+    index.remove([0, 2])
+    compiled = compile_filter("area == 'main'")
+    remaining = METADATAS[1:2] + METADATAS[3:]
+    assert compiled.select(index).tolist() == [compiled(m) for m in remaining]
+    index.add([{"area": "main"}])
+    assert compiled.select(index).tolist() == [False, False, False, True, True]
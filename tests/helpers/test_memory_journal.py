@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory mutation journal and the docstore it checkpoints with.
+"""
+
+import os
+
+from langchain_core.documents import Document
+
+from python.helpers.memory_docstore import SQLiteDocstore
+from python.helpers.memory_journal import MemoryJournal
+
+
+class Store:
+    """The parts of the vector store the journal replays into."""
+
+    def __init__(self, ids=()):
+        self.index_to_docstore_id = dict(enumerate(ids))
+        self.texts: dict[str, str] = {}
+        self.vectors: dict[str, list[float]] = {}
+
+    def add_embeddings(self, text_embeddings, metadatas, ids):
+        for id, (text, vector) in zip(ids, text_embeddings):
+            self.index_to_docstore_id[len(self.index_to_docstore_id)] = id
+            self.texts[id] = text
+            self.vectors[id] = vector
+
+    def delete(self, ids):
+        positions = [p for p, id in self.index_to_docstore_id.items() if id in ids]
+        for pos in positions:
+            del self.index_to_docstore_id[pos]
+        for id in ids:
+            self.texts.pop(id, None)
+
+
+def journal_with(tmp_path, *records) -> MemoryJournal:
+    journal = MemoryJournal(str(tmp_path))
+    for op, ids in records:
+        if op == "add":
+            vectors = [[0.5, float(i)] for i in range(len(ids))]
+            journal.log_add(ids, vectors, [Document(id) for id in ids])
+        else:
+            journal.log_delete(ids)
+    return journal
+
+
+def test_replay_skips_a_torn_write(tmp_path):
+    """A line cut short by a crash is skipped, the entries around it still apply."""
+    journal = journal_with(tmp_path, ("add", ["a", "b"]))
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "ids": ["c"], "vec')
+        f.write("\n")
+    journal.log_delete(["a"])
+
+    store = Store()
+    assert journal.replay(store) == 2
+    assert list(store.index_to_docstore_id.values()) == ["b"]
+    assert store.vectors["b"] == [0.5, 1.0]  # float32 round trip
+    assert journal.pending == 2
+
+
+def test_replay_is_idempotent_over_the_snapshot(tmp_path):
+    """Adds already indexed and deletes of missing ids are skipped."""
+    journal = journal_with(tmp_path, ("add", ["a", "b"]), ("delete", ["x"]), ("add", ["c"]))
+    store = Store(ids=["a", "b"])
+
+    journal.replay(store)
+    assert list(store.index_to_docstore_id.values()) == ["a", "b", "c"]
+    assert list(store.texts) == ["c"]
+
+
+def test_checkpoint_truncates_only_after_a_save(tmp_path):
+    journal = journal_with(tmp_path, ("add", ["a"]))
+    journal.checkpoint(lambda: False)
+    assert os.path.getsize(journal.path) > 0 and journal.pending == 1
+
+    journal.checkpoint(lambda: True)
+    assert os.path.getsize(journal.path) == 0 and journal.pending == 0
+
+
+def test_docstore_changes_reach_disk_on_flush(tmp_path):
+    """Adds and deletes are visible at once, written to the table only by flush."""
+    path = str(tmp_path / "docstore.db")
+    store = SQLiteDocstore(path)
+    store.add({"a": Document("alpha", metadata={"area": "main"}), "b": Document("beta")})
+    store.add_vectors(["a"], [[1.0, 2.0]])
+
+    assert [d.page_content for d in store.mget(["a", "b"])] == ["alpha", "beta"]
+    assert len(store) == 2
+    assert len(SQLiteDocstore(path)) == 0
+
+    store.flush()
+    store.delete(["b"])
+    assert store.mget(["b"]) == [None] and len(store) == 1
+    assert "b" not in store._dict
+    reopened = SQLiteDocstore(path)
+    assert [d.page_content for d in reopened.mget(["a", "b"])] == ["alpha", "beta"]
+    assert reopened.field_values(["a", "b"], ["area"]) == [{"area": "main"}, {}]
+    assert reopened.vectors(["a"])[0].tolist() == [1.0, 2.0]
+
+    store.flush()
+    reopened = SQLiteDocstore(path)
+    assert reopened.mget(["a", "b"])[1] is None
+    assert list(reopened.ids()) == ["a"]
+
+
+def test_checkpoint_with_docstore_flush_replays_nothing_twice(tmp_path):
+    """The checkpoint flushes the docstore, the emptied journal adds nothing on load."""
+    journal = journal_with(tmp_path, ("add", ["a"]))
+    docs = SQLiteDocstore(str(tmp_path / "docstore.db"))
+    docs.add({"a": Document("a")})
+
+    def save():
+        docs.flush()
+        return True
+
+    journal.checkpoint(save)
+    store = Store(ids=["a"])
+    assert MemoryJournal(str(tmp_path)).replay(store) == 0
+    assert SQLiteDocstore(str(tmp_path / "docstore.db")).mget(["a"])[0].page_content == "a"
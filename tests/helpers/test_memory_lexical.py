@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for the BM25 index used by hybrid memory search.
+"""
+
+import numpy as np
+import pytest
+
+from python.helpers.memory_lexical import (
+    RRF_K,
+    LexicalIndex,
+    fused_scores,
+    reciprocal_rank_fusion,
+)
+
+
+def test_min_coverage_drops_partial_keyword_matches():
+    """Coverage is the matched share of the query's idf weight, not a relevance score."""
+    index = LexicalIndex()
+    index.add(["alpha beta", "alpha", "gamma delta", "delta", "epsilon"])
+
+    assert index.search("alpha beta", 5).tolist() == [0, 1]
+    assert index.search("alpha beta", 5, min_coverage=0.9).tolist() == [0]
+    assert index.search("alpha unknown", 5, min_coverage=0.9).tolist() == []
+
+
+def test_identifiers_match_whole_and_by_parts():
+    index = LexicalIndex()
+    index.add(["ModuleNotFoundError: No module named langchain_openai", "module reference"])
+
+    assert index.search("ModuleNotFoundError", 5).tolist() == [0, 1]  # "module" alone
+    assert index.search("ModuleNotFoundError", 5, min_coverage=0.5).tolist() == [0]
+    assert index.search("not found", 5).tolist() == [0]
+    assert index.search("langchain_openai", 5).tolist() == [0]
+
+
+def test_bm25_prefers_rare_terms_and_short_documents():
+    index = LexicalIndex()
+    index.add(
+        [
+            "error error error in the parser",
+            "the parser",
+            "the parser and a long tail of other words about the parser and the lexer",
+            "the lexer",
+        ]
+    )
+
+    assert index.search("parser", 5).tolist() == [1, 0, 2]
+    assert index.search("error parser", 1).tolist() == [0]
+    selected = np.array([False, False, True, True])
+    assert index.search("the parser", 5, selected=selected).tolist() == [2, 3]
+
+
+def test_removed_positions_are_renumbered():
+    index = LexicalIndex()
+    index.add(["alpha", "beta", "alpha beta"])
+    index.remove([0])
+
+    assert index.size == 2
+    assert sorted(index.search("alpha", 5).tolist()) == [1]
+    assert sorted(index.search("beta", 5).tolist()) == [0, 1]
+
+
+def test_rrf_ranks_hits_found_by_both_lists_first():
+    vector = np.array([3, 1, 2], dtype=np.int64)
+    keyword = np.array([2, 4], dtype=np.int64)
+
+    positions, scores = fused_scores([vector, keyword])
+    assert positions.tolist() == [2, 3, 1, 4]  # ties keep position order
+    assert scores[0] == pytest.approx(1 / (RRF_K + 3) + 1 / (RRF_K + 1))
+    assert scores[1] == pytest.approx(1 / (RRF_K + 1))
+    assert reciprocal_rank_fusion([vector, keyword], 2).tolist() == [2, 3]
+    assert reciprocal_rank_fusion([np.zeros(0, dtype=np.int64)], 5).size == 0
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for the vector store's document id -> position map, kept in sync with its mapping.
+"""
+
+import faiss
+import numpy as np
+import pytest
+
+from python.helpers.memory import MyFaiss
+from python.helpers.memory_docstore import TOMBSTONE, SQLiteDocstore
+
+DIM = 8
+
+
+def make_db(index: faiss.Index) -> MyFaiss:
+    return MyFaiss(
+        embedding_function=None,  # type: ignore
+        index=index,
+        docstore=SQLiteDocstore(":memory:"),
+        index_to_docstore_id={},
+    )
+
+
+def add(db: MyFaiss, ids: list[str]):
+    vectors = np.random.default_rng(len(db.index_to_docstore_id)).random((len(ids), DIM))
+    db.add_embeddings([(id, vector.tolist()) for id, vector in zip(ids, vectors)], ids=ids)
+
+
+def expected(db: MyFaiss) -> dict[str, int]:
+    return {id: pos for pos, id in db.index_to_docstore_id.items() if id != TOMBSTONE}
+
+
+@pytest.mark.parametrize(
+    "index",
+    [lambda: faiss.IndexFlatIP(DIM), lambda: faiss.IndexHNSWFlat(DIM, 8)],
+    ids=["flat renumbers", "hnsw tombstones"],
+)
+def test_positions_follow_adds_and_deletes(index):
+    db = make_db(index())
+    add(db, ["a", "b", "c", "d"])
+    assert db.id_positions == {"a": 0, "b": 1, "c": 2, "d": 3}
+
+    db.delete(["b"])
+    add(db, ["e"])
+    db.delete(["a", "e"])
+    assert db.id_positions == expected(db)
+    assert set(db.id_positions) == {"c", "d"}
+
+    with pytest.raises(ValueError):
+        db.delete(["b"])
+
+
+def test_compaction_renumbers_positions():
+    db = make_db(faiss.IndexHNSWFlat(DIM, 8))
+    add(db, ["a", "b", "c"])
+    db.delete(["a"])
+    assert db.id_positions == {"b": 1, "c": 2}
+
+    db.compact(sorted(db.tombstones))
+    assert db.id_positions == {"b": 0, "c": 1} == expected(db)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Tests for the query embedding cache and its bounded disk tier.
+"""
+
+from python.helpers.embedding_store import LRUByteStore
+from python.helpers.query_cache import QueryCache
+
+
+def test_lru_store_evicts_least_recently_used(tmp_path):
+    """Over the byte bound the least recently read or written values go first."""
+    store = LRUByteStore(str(tmp_path / "cache.db"), max_bytes=350)
+    store.mset([("a", b"x" * 100), ("b", b"x" * 100)])
+    store.mget(["a"])  # b is now the oldest
+    store.mset([("c", b"x" * 100), ("d", b"x" * 100)])
+
+    assert store.mget(["a", "b", "c", "d"]) == [b"x" * 100, None, b"x" * 100, b"x" * 100]
+    assert store._size == 300
+
+
+def test_lru_store_tracks_replaced_and_deleted_sizes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    store = LRUByteStore(path, max_bytes=1000)
+    store.mset([("a", b"x" * 100), ("b", b"x" * 100)])
+    store.mset([("a", b"x" * 10)])
+    store.mdelete(["b", "missing"])
+
+    assert store._size == 10
+    assert LRUByteStore(path, max_bytes=1000)._size == 10  # recounted on open
+
+
+def test_query_cache_falls_back_to_disk(tmp_path):
+    """A vector evicted from process memory is still found on disk."""
+    store = LRUByteStore(str(tmp_path / "cache.db"), max_bytes=1000)
+    cache = QueryCache("model", max_size=1, store=store)
+    cache.put("first  query", [1.0, 2.0])
+    cache.put("second query", [3.0, 4.0])
+
+    assert cache.get("first query") == [1.0, 2.0]  # whitespace normalised, from disk
+    assert cache.get("first query") == [1.0, 2.0]  # kept in memory again
+    assert cache.get("third query") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+    assert cache.summary() == "67% of 3, 1 from disk"
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Tests for the recall query and result cache.
+"""
+
+from python.helpers.history import History
+from python.helpers.recall_cache import RecallCache
+
+
+def test_query_reused_across_iterations_of_a_topic():
+    """Tool output appended by the next iteration keeps the key, the query is a hit."""
+    history = History(agent=None)
+    history.add_message(False, "find where the config loader lives")
+    cache = RecallCache()
+
+    key = RecallCache.topic_key(history, "find where the config loader lives")
+    assert cache.get_query("memories", key) is None
+    cache.put_query("memories", key, "config loader location")
+
+    history.add_message(True, '{"tool_name": "code_execution_tool", "code": "grep -rn config"}')
+    history.add_message(False, "python/helpers/memory_index.py:56: def load_config(...)")
+    key = RecallCache.topic_key(history, "find where the config loader lives")
+
+    assert cache.get_query("memories", key) == "config loader location"
+    assert cache.hit_rates("memories")["query_hit_rate"] == 0.5
+
+
+def test_new_topic_or_message_writes_new_queries():
+    """Another topic or another user message is a miss."""
+    history = History(agent=None)
+    history.add_message(False, "find where the config loader lives")
+    cache = RecallCache()
+    key = RecallCache.topic_key(history, "find where the config loader lives")
+    cache.put_query("memories", key, "config loader location")
+
+    assert cache.get_query("memories", RecallCache.topic_key(history, "now fix it")) is None
+
+    history.new_topic()
+    history.add_message(False, "find where the config loader lives")
+    key = RecallCache.topic_key(history, "find where the config loader lives")
+    assert cache.get_query("memories", key) is None
+
+
+def test_results_reused_for_near_query_and_same_version():
+    """A query within epsilon against unchanged memory reuses the hits."""
+    cache = RecallCache(epsilon=0.05)
+    cache.put_results("memories", [1.0, 0.0], ("db", 1), ["hit"])
+
+    assert cache.get_results("memories", [0.99, 0.05], ("db", 1)) == ["hit"]
+    assert cache.get_results("memories", [0.99, 0.05], ("db", 2)) is None
+    assert cache.get_results("memories", [0.0, 1.0], ("db", 1)) is None
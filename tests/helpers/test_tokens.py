@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for token counting, on a small local encoding so that nothing is downloaded.
+"""
+
+import pytest
+import tiktoken
+
+from python.helpers import tokens
+
+# gpt-2 style pre-tokenization, words keep the space before them
+PATTERN = r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+"""
+MERGES = [b"  ", b"\n\n", b" t", b"he", b" the", b"re", b" there", b"in", b"ing", b" a"]
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    ranks = {bytes([i]): i for i in range(256)}
+    for merge in MERGES:
+        ranks[merge] = len(ranks)
+    encoding = tiktoken.Encoding("test", pat_str=PATTERN, mergeable_ranks=ranks, special_tokens={})
+    monkeypatch.setattr(tokens, "get_encoding", lambda name=tokens.DEFAULT_ENCODING: encoding)
+    return encoding
+
+
+def test_count_many_matches_count_tokens(encoding, monkeypatch):
+    """Chunks are cut after a word, the pooled counts are exact."""
+    monkeypatch.setattr(tokens, "PARALLEL_MIN_CHARS", 0)
+    monkeypatch.setattr(tokens, "PARALLEL_CHUNK_CHARS", 37)
+    texts = [
+        "the theme there thing   a\n\nthe.\n\n  " * 40,
+        "",
+        "def f(x):\n    return x  # there\n" * 30,
+        "x" * 100,  # no whitespace, cut anywhere
+    ]
+    pooled = tokens.count_many(texts)
+    assert pooled[:3] == [tokens.count_tokens(t) for t in texts[:3]]
+    assert abs(pooled[3] - tokens.count_tokens(texts[3])) <= len(texts[3]) // 37
+
+
+def test_split_keeps_whitespace_with_the_next_chunk(monkeypatch):
+    monkeypatch.setattr(tokens, "PARALLEL_CHUNK_CHARS", 10)
+    text = "alpha beta gamma\n\ndelta epsilon"
+    chunks = tokens._split(text)
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 10 for chunk in chunks[:-1])
+    assert all(chunk[-1].isalnum() for chunk in chunks[:-1])
+
+
+def test_chat_model_encoding_cached_until_cleared(monkeypatch):
+    from python.helpers import settings
+
+    calls = []
+
+    def get_settings():
+        calls.append(1)
+        return {"chat_model_name": "gpt-4o"}
+
+    monkeypatch.setattr(settings, "get_settings", get_settings)
+    tokens.clear_chat_model_encoding()
+    assert tokens.chat_model_encoding() == tokens.chat_model_encoding() == "o200k_base"
+    assert len(calls) == 1
+
+    tokens.clear_chat_model_encoding()
+    tokens.chat_model_encoding()
+    assert len(calls) == 2
+    tokens.clear_chat_model_encoding()
+
+
+def test_estimate_follows_calibration(encoding, monkeypatch):
+    monkeypatch.setattr(tokens, "_chars_per_token", {})
+    text = "the there " * 100
+    before = tokens.estimate_tokens(text)
+    for _ in range(50):
+        tokens.count_tokens(text)
+    exact = tokens.count_tokens(text) * tokens.APPROX_BUFFER
+    assert abs(tokens.estimate_tokens(text) - exact) < abs(before - exact)
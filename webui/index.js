@@ -280,7 +280,7 @@ window.loadKnowledge = async function () {
             toast(await response.text(), "error");
         } else {
             const data = await response.json();
-            toast("Knowledge files imported: " + data.filenames.join(", "), "success");
+            toast("Knowledge import started: " + data.filenames.join(", "), "success");
         }
         } catch (e) {
             toastFetchError("Error loading knowledge", e)